@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# под ASGI чтение каталога и заказов выполняют async views, ASYNC_VIEWS=0 возвращает синхронные
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,11 +48,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'service_app.replicas.replica_pin_middleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'service_app.metrics.request_metrics_middleware',
+    'service_app.query_detector.query_detector_middleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -81,9 +86,95 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # профиль SQLite для работы под нагрузкой (service_app.sqlite): timeout - ожидание блокировки записи
+        # в секундах, транзакции BEGIN IMMEDIATE, init_command - PRAGMA для каждого нового соединения
+        'OPTIONS': {
+            'timeout': 5,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode = WAL;'
+                'PRAGMA synchronous = NORMAL;'
+                'PRAGMA mmap_size = 268435456;'
+                # отрицательное значение - размер в килобайтах
+                'PRAGMA cache_size = -65536;'
+                'PRAGMA temp_store = MEMORY'
+            ),
+        },
     }
 }
 
+# чтение каталога и заказов с реплик (service_app.replicas): алиасы реплик из DATABASES, например
+# DATABASES['replica'] = {'ENGINE': ..., 'HOST': 'replica.local', ...}; DATABASE_REPLICAS = ['replica']
+DATABASE_ROUTERS = ['service_app.replicas.ReplicaRouter']
+DATABASE_REPLICAS = []
+# после записи клиент столько секунд читает основную базу, значение - с запасом больше отставания реплик
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_CACHE_ALIAS = 'catalog'
+
+# очередь записи SQLite внутри процесса (service_app.sqlite.write_transaction)
+SQLITE_WRITE_QUEUE = True
+
+# метрики запросов к API (service_app.metrics): заголовок Server-Timing и гистограммы по маршрутам
+# на api/v1/metrics/ в формате Prometheus; метрики отдаются с Authorization: Bearer <METRICS_TOKEN>
+# или пользователю с is_staff, без METRICS_TOKEN - только пользователю с is_staff
+REQUEST_METRICS_PREFIX = '/api/v1/'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# поиск N+1 запросов (service_app.query_detector): доля проверяемых запросов к API (в разработке - все),
+# сколько раз запрос одной формы должен повториться за HTTP-запрос и файл отчета (сводка - manage.py query_report)
+QUERY_DETECTOR_SAMPLE_RATE = 1.0 if DEBUG else 0.01
+QUERY_DETECTOR_THRESHOLD = 5
+QUERY_DETECTOR_REPORT = Path(tempfile.gettempdir()) / 'backend_query_report.jsonl'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # общий для всех процессов кеш каталога, хранит версию каталога и подготовленные ответы
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'backend_service_catalog',
+    },
+    # общий для всех процессов кеш аутентификации: поколения токенов и пары (пользователь, токен)
+    'auth': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'backend_service_auth',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = 300
+# снимок каталога привязан к версии каталога и хранится до ее изменения, но не дольше этого времени
+CATALOG_SNAPSHOT_TIMEOUT = 86400
+# потоков фонового перестроения снимков после изменения каталога, 0 - перестроение в потоке, изменившем каталог
+CATALOG_SNAPSHOT_WORKERS = 1
+# перестроение снимков начинается не раньше чем через столько секунд после изменения каталога или остатков,
+# изменения за это время перестраиваются вместе
+CATALOG_SNAPSHOT_DEBOUNCE = 2
+
+# кеш аутентификации по токену: время жизни записи и размер LRU в памяти процесса,
+# AUTH_TOKEN_CACHE_ALIAS - общий кеш из CACHES, через который сброс токена виден всем процессам
+# (None - только кеш процесса, для одного процесса)
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_ALIAS = 'auth'
+
+# сколько секунд новый заказ держит зарезервированный товар до подтверждения
+ORDER_RESERVATION_TIMEOUT = 1800
+
+# заказы, измененные позже чем столько секунд назад, не попадают в ленту поставщика:
+# транзакции, начатые раньше, еще могут записать заказ с меньшим updated_at
+ORDER_FEED_DELAY = 5
+
+# async views для чтения каталога, корзины, заказов и статуса магазина (service_app.async_views);
+# backend/asgi.py включает их по умолчанию, под WSGI остаются синхронные views
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -132,6 +223,10 @@ EMAIL_HOST_PASSWORD = 'CLdm7yW4U9nivz9mbexu'
 EMAIL_PORT = '465'
 EMAIL_USE_SSL = True
 SERVER_EMAIL = EMAIL_HOST_USER
+EMAIL_TIMEOUT = 30
+
+# потоков фоновой отправки писем из очереди outbox, 0 - отправка в потоке запроса после фиксации транзакции
+EMAIL_OUTBOX_WORKERS = 2
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -141,14 +236,14 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 40,
 
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'service_app.renderers.UJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
 
     ),
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
 
-        'rest_framework.authentication.TokenAuthentication',
+        'service_app.authentication.CachedTokenAuthentication',
     ),
 
 }
@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from benchmarks import setup_django, add_database_argument
+
+"""
+Сравнение WSGI и ASGI на маршрутах чтения, у которых есть async views (service_app.async_views):
+filter_products/, basket/, order/ и shop_status/. Режимы:
+wsgi - синхронные views, concurrency клиентов с тестовым клиентом django в потоках, одновременно
+обрабатываются не больше --wsgi-threads запросов (потоки WSGI-сервера), остальные клиенты ждут;
+asgi-sync - синхронные views через ASGIHandler, concurrency одновременных корутин AsyncClient
+(так приложение работает под uvicorn без async views: каждый запрос уходит в поток через sync_to_async);
+asgi - async views (ASYNC_VIEWS = True) через ASGIHandler.
+Для каждого маршрута, режима и уровня конкурентности выводятся пропускная способность и задержки p50/p99,
+результат записывается в JSON. Сеть не участвует: измеряется стоимость обработки запроса в процессе,
+с реальным сервером (gunicorn и uvicorn) абсолютные значения будут другими.
+--client-delay моделирует медленного клиента: столько миллисекунд соединение передает запрос до обработки.
+Под WSGI в это время занят поток сервера, под ASGI - только корутина
+
+python -m benchmarks.asgi --concurrency 1,16,64,256 --requests 2000
+python -m benchmarks.asgi --concurrency 256 --client-delay 50 --wsgi-threads 16
+"""
+
+
+MODES = ('wsgi', 'asgi-sync', 'asgi')
+REPORTS = os.path.join(os.path.dirname(__file__), 'reports')
+
+
+def use_async_views(enabled):
+    from django.conf import settings
+    from django.urls import clear_url_caches
+    import backend.urls
+    import service_app.urls
+    settings.ASYNC_VIEWS = enabled
+    importlib.reload(service_app.urls)
+    importlib.reload(backend.urls)
+    clear_url_caches()
+
+
+def run_wsgi(make, concurrency, requests, delay=0.0, server_threads=None):
+    from django.db import connection
+    from django.test import Client
+
+    numbers = itertools.count()
+    lock = threading.Lock()
+    latencies, statuses = [], []
+    server = threading.BoundedSemaphore(server_threads or concurrency)
+
+    def worker():
+        client = Client()
+        while True:
+            with lock:
+                i = next(numbers)
+            if i >= requests:
+                break
+            path, headers = make(i)
+            started = time.perf_counter()
+            with server:
+                if delay:
+                    time.sleep(delay)
+                response = client.get(path, headers=headers)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(response.status_code)
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - started
+
+
+def run_asgi(make, concurrency, requests, delay=0.0):
+    from django.test import AsyncClient
+
+    numbers = itertools.count()
+    latencies, statuses = [], []
+
+    async def worker():
+        client = AsyncClient()
+        for i in numbers:
+            if i >= requests:
+                break
+            path, headers = make(i)
+            started = time.perf_counter()
+            if delay:
+                await asyncio.sleep(delay)
+            response = await client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            statuses.append(response.status_code)
+
+    async def main():
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return latencies, statuses, time.perf_counter() - started
+
+
+def get_routes(seed):
+    buyers = [f'{user_id:040d}' for user_id in seed['buyers']]
+    shops = [f'{user_id:040d}' for user_id in seed['shop_users']]
+    shop_ids, category_ids = seed['shops'], seed['categories']
+
+    def token(keys, i):
+        return {'Authorization': f'Token {keys[i % len(keys)]}'}
+
+    return {
+        'filter_products': lambda i: (f'/api/v1/filter_products/?shop_id={shop_ids[i % len(shop_ids)]}'
+                                      f'&category_id={category_ids[i % len(category_ids)]}&page_size=50', {}),
+        'basket': lambda i: ('/api/v1/basket/', token(buyers, i)),
+        'order': lambda i: ('/api/v1/order/?page_size=20', token(buyers, i)),
+        'shop_status': lambda i: ('/api/v1/shop_status/', token(shops, i)),
+    }
+
+
+def main(argv=None):
+    from benchmarks.api import percentile
+
+    parser = argparse.ArgumentParser(description='Сравнение WSGI и ASGI на маршрутах чтения')
+    add_database_argument(parser)
+    parser.add_argument('--skus', type=int, default=10000)
+    parser.add_argument('--buyers', type=int, default=50)
+    parser.add_argument('--concurrency', default='1,16,64,256', help='Уровни конкурентности через запятую')
+    parser.add_argument('--requests', type=int, default=1000, help='Запросов на маршрут, режим и уровень')
+    parser.add_argument('--wsgi-threads', type=int, default=16, help='Потоков WSGI-сервера')
+    parser.add_argument('--client-delay', type=float, default=0, help='Задержка медленного клиента, мс')
+    parser.add_argument('--routes', default='', help='Маршруты через запятую, по умолчанию все')
+    parser.add_argument('--output', help='Файл JSON с результатами, по умолчанию reports/asgi_<база данных>.json')
+    args = parser.parse_args(argv)
+
+    setup_django(args.db, fresh=not args.keep)
+    from django.db import connection
+    from benchmarks.seed import seed_catalog
+    seed = seed_catalog(shops=5, categories=20, skus=args.skus, parameters=5, buyers=args.buyers, orders=10, items=5)
+    routes = get_routes(seed)
+    if args.routes:
+        routes = {name: make for name, make in routes.items() if name in args.routes.split(',')}
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    print(f'База данных {connection.vendor}, товаров {args.skus}, запросов на замер {args.requests}, '
+          f'потоков WSGI {args.wsgi_threads}, задержка клиента {args.client_delay:.0f} мс')
+    print(f'{"маршрут":<16} {"клиентов":>8} ' + ' '.join(f'{mode + " rps":>14} {"p50/p99 мс":>15}' for mode in MODES))
+    results = {}
+    failed = False
+    for name, make in routes.items():
+        for level in levels:
+            row = {}
+            for mode in MODES:
+                use_async_views(mode == 'asgi')
+                # прогрев: кеши каталога и токенов, соединение с базой данных
+                if mode == 'wsgi':
+                    run_wsgi(make, 1, 5)
+                    measured = run_wsgi(make, level, args.requests, args.client_delay / 1000, args.wsgi_threads)
+                else:
+                    run_asgi(make, 1, 5)
+                    measured = run_asgi(make, level, args.requests, args.client_delay / 1000)
+                latencies, statuses, elapsed = measured
+                latencies.sort()
+                errors = sum(status != 200 for status in statuses)
+                failed = failed or errors > 0
+                row[mode] = {'rps': round(len(latencies) / elapsed, 1), 'errors': errors,
+                             'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                             'p99_ms': round(percentile(latencies, 99) * 1000, 2)}
+            results.setdefault(name, {})[str(level)] = row
+            print(f'{name:<16} {level:>8} ' + ' '.join(
+                f'{row[mode]["rps"]:>14.0f} {row[mode]["p50_ms"]:>7.1f}/{row[mode]["p99_ms"]:<7.1f}' for mode in MODES))
+    use_async_views(False)
+
+    output = args.output or os.path.join(REPORTS, f'asgi_{connection.vendor}.json')
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump({'config': {'skus': args.skus, 'buyers': args.buyers, 'requests': args.requests,
+                              'concurrency': levels, 'wsgi_threads': args.wsgi_threads,
+                              'client_delay_ms': args.client_delay, 'database': connection.vendor},
+                   'routes': results}, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
+    print(f'Результаты записаны в {output}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
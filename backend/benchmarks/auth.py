@@ -0,0 +1,71 @@
+import argparse
+import sys
+import time
+from benchmarks import setup_django, add_database_argument
+
+"""
+Микробенчмарк аутентификации по токену.
+Запросы GET user/get/ выполняются с токенами покупателей через TokenAuthentication и через
+CachedTokenAuthentication; выводится количество запросов к базе данных на один HTTP-запрос
+(на промахе и на попадании в кеш, один запрос - чтение контактов самим view) и количество запросов
+и время на одну аутентификацию
+
+python -m benchmarks.auth --users 100 --requests 5000
+"""
+
+
+def measure(authentication_class, keys, requests):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.request import Request
+    from rest_framework.test import APIClient, APIRequestFactory
+    from service_app.views import ModifyUser
+
+    # HTTP-запрос целиком: первый запрос с токеном - промах кеша, повторный - попадание
+    ModifyUser.authentication_classes = [authentication_class]
+    client = APIClient()
+    counts = []
+    for _ in range(2):
+        with CaptureQueriesContext(connection) as queries:
+            client.get('/api/v1/user/get/', HTTP_AUTHORIZATION=f'Token {keys[0]}')
+        counts.append(len(queries))
+
+    factory = APIRequestFactory()
+    prepared = [Request(factory.get('/', HTTP_AUTHORIZATION=f'Token {keys[i % len(keys)]}'))
+                for i in range(requests)]
+    authentication = authentication_class()
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for request in prepared:
+            authentication.authenticate(request)
+        elapsed = time.perf_counter() - started
+    return counts[0], counts[1], len(queries) / requests, elapsed / requests * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Микробенчмарк аутентификации по токену')
+    add_database_argument(parser)
+    parser.add_argument('--users', type=int, default=100, help='Количество пользователей с токенами')
+    parser.add_argument('--requests', type=int, default=5000, help='Количество аутентификаций')
+    args = parser.parse_args(argv)
+
+    setup_django(args.db, fresh=not args.keep)
+    from rest_framework.authentication import TokenAuthentication
+    from rest_framework.authtoken.models import Token
+    from benchmarks.seed import seed_catalog
+    from service_app.authentication import CachedTokenAuthentication, clear_token_cache
+    seed = seed_catalog(shops=1, categories=1, skus=10, parameters=1, buyers=args.users, orders=0, items=0)
+    keys = list(Token.objects.filter(user_id__in=seed['buyers']).values_list('key', flat=True))
+
+    print(f'Пользователей: {len(keys)}, аутентификаций: {args.requests}')
+    for name, authentication_class in (('TokenAuthentication', TokenAuthentication),
+                                       ('CachedTokenAuthentication', CachedTokenAuthentication)):
+        clear_token_cache()
+        first, second, per_request, microseconds = measure(authentication_class, keys, args.requests)
+        print(f'{name}: запросов к БД на HTTP-запрос: первый {first}, повторный {second}; '
+              f'на аутентификацию: {per_request:.2f}, {microseconds:.1f} мкс')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
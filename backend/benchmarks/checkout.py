@@ -0,0 +1,105 @@
+import argparse
+import sys
+import threading
+import time
+from benchmarks import setup_django, add_database_argument
+
+"""
+Конкурентное оформление заказов одного товара.
+Каждый покупатель держит в корзине quantity штук одного товара с остатком stock, потоки одновременно
+оформляют корзины через service_app.reservations.checkout. Проверяется, что продано не больше остатка,
+остаток не ушел в минус и совпадает с количеством оформленных заказов, выводится пропускная способность.
+Ошибки блокировки базы данных (SQLite допускает одну пишущую транзакцию) повторяются и считаются отдельно
+
+python -m benchmarks.checkout --threads 16 --buyers 400 --stock 100
+"""
+
+
+def prepare(buyers, stock, quantity):
+    from benchmarks.seed import seed_catalog
+    from service_app.models import Order, OrderItem, ProductInfo
+    seed = seed_catalog(shops=1, categories=1, skus=10, parameters=1, buyers=buyers, orders=0, items=0)
+    hot = ProductInfo.objects.order_by('id').first()
+    ProductInfo.objects.filter(id=hot.id).update(quantity=stock)
+    baskets = list(Order.objects.filter(status='basket').values_list('id', 'user_id'))
+    OrderItem.objects.bulk_create([OrderItem(order_id=order_id, product_info_id=hot.id, quantity=quantity)
+                                   for order_id, _ in baskets])
+    return seed, hot.id, baskets
+
+
+def run(baskets, threads, retries):
+    from django.db import connection, OperationalError
+    from service_app.reservations import checkout, OutOfStock
+
+    counters = {'sold': 0, 'out_of_stock': 0, 'retries': 0, 'failed': 0}
+    lock = threading.Lock()
+    queue = list(baskets)
+    latencies = []
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    break
+                order_id, user_id = queue.pop()
+            started = time.perf_counter()
+            for attempt in range(retries + 1):
+                try:
+                    checkout(order_id, user_id)
+                    result = 'sold'
+                    break
+                except OutOfStock:
+                    result = 'out_of_stock'
+                    break
+                except OperationalError:
+                    with lock:
+                        counters['retries'] += 1
+                    time.sleep(0.001 * (attempt + 1))
+            else:
+                result = 'failed'
+            with lock:
+                counters[result] += 1
+                latencies.append(time.perf_counter() - started)
+        connection.close()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return counters, time.perf_counter() - started, sorted(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Конкурентное оформление заказов одного товара')
+    add_database_argument(parser)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--buyers', type=int, default=400, help='Количество корзин с одним и тем же товаром')
+    parser.add_argument('--stock', type=int, default=100, help='Начальный остаток товара')
+    parser.add_argument('--quantity', type=int, default=1, help='Количество товара в каждой корзине')
+    parser.add_argument('--retries', type=int, default=50, help='Повторы при блокировке базы данных')
+    args = parser.parse_args(argv)
+
+    setup_django(args.db, fresh=not args.keep)
+    from service_app.models import Order, ProductInfo
+    _, hot_id, baskets = prepare(args.buyers, args.stock, args.quantity)
+    counters, elapsed, latencies = run(baskets, args.threads, args.retries)
+
+    remaining = ProductInfo.objects.get(id=hot_id).quantity
+    ordered = Order.objects.filter(status='new').count()
+    sold = counters['sold'] * args.quantity
+    print(f'Потоков: {args.threads}, корзин: {len(baskets)}, остаток: {args.stock}, в корзине: {args.quantity}')
+    print(f'Оформлено: {counters["sold"]}, отказов по остатку: {counters["out_of_stock"]}, '
+          f'ошибок: {counters["failed"]}, повторов из-за блокировок: {counters["retries"]}')
+    print(f'Остаток после оформления: {remaining}, заказов в статусе new: {ordered}')
+    print(f'Время: {elapsed:.2f} с, оформлений в секунду: {len(latencies) / elapsed:.0f}, '
+          f'p50: {latencies[len(latencies) // 2] * 1000:.1f} мс, '
+          f'p99: {latencies[int(len(latencies) * 0.99)] * 1000:.1f} мс')
+    oversold = sold > args.stock or remaining < 0 or remaining != args.stock - sold or ordered != counters['sold']
+    print('ПЕРЕПРОДАЖА' if oversold else 'Перепродажи нет')
+    return 1 if oversold else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
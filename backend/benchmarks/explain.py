@@ -0,0 +1,162 @@
+import argparse
+import sys
+from benchmarks import setup_django, add_database_argument
+
+"""
+Отчет EXPLAIN для запросов view на заполненной синтетическими данными базе.
+Для каждого запроса выводится SQL и план выполнения, полный просмотр больших таблиц и
+сортировка результата во временном B-дереве отмечаются предупреждениями, чтобы регрессии индексов были видны
+при сравнении отчетов между коммитами.
+
+python -m benchmarks.explain --skus 20000 --output benchmarks/reports/explain_sqlite.txt
+"""
+
+
+LARGE_TABLES = ('service_app_productinfo', 'service_app_productparameter', 'service_app_productfacet',
+                'service_app_searchterm', 'service_app_order', 'service_app_orderitem')
+
+
+def make_request(user=None, **params):
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    request = Request(APIRequestFactory().get('/', params))
+    if user is not None:
+        request.user = user
+    return request
+
+
+def collect_queries(seed):
+    from django.db.models import Count
+    from service_app.models import User, ProductInfo, ProductParameter, ProductFacet, SearchTerm, OrderItem
+    from service_app.search import CANDIDATE_LIMIT
+    from service_app.views import ProductInfoFiltersView, BasketView, OrderView, ListOfOrdersView
+    from service_app.facets import parse_facet_filters, apply_facet_filters
+    from service_app.fast_serializers import product_info_values, order_values
+
+    buyer = User.objects.get(id=seed['buyers'][0])
+    shop_user = User.objects.get(id=seed['shop_users'][0])
+    shop_id, category_id = seed['shops'][0], seed['categories'][0]
+    queries = []
+
+    def filter_products(name, **params):
+        view = ProductInfoFiltersView()
+        request = make_request(**params)
+        paginator = view.pagination_class()
+        queries.append((f'filter_products: {name}', paginator.get_page_queryset(
+            product_info_values(view.get_queryset(request)), request, view=view)))
+        return paginator, request, view
+
+    filter_products('первая страница')
+    filter_products('магазин и категория', shop_id=shop_id, category_id=category_id)
+    filter_products('магазин, по цене', shop_id=shop_id, ordering='price')
+    paginator, request, view = filter_products('по цене', ordering='price')
+    page = paginator.paginate_queryset(product_info_values(view.get_queryset(request)), request, view=view)
+    filter_products('по цене, следующая страница', ordering='price', cursor=paginator.next_cursor)
+    filter_products('цвет и цена', param='Цвет:красный', price_max=50000)
+    filter_products('категория, диапазон параметра', category_id=category_id, param_range='Параметр 0:5:10')
+    facet_request = make_request(param='Цвет:красный')
+    matching = apply_facet_filters(ProductInfo.objects.filter(shop__status=True),
+                                   parse_facet_filters(facet_request.query_params))
+    queries.append(('filter_products: количества фасетов',
+                    ProductFacet.objects.filter(product_info_id__in=matching.values('id'))
+                    .values('parameter_id', 'value').annotate(count=Count('id'))
+                    .order_by('parameter_id', '-count', 'value')))
+    queries.append(('filter_products: параметры страницы',
+                    ProductParameter.objects.filter(product_info_id__in=[row['id'] for row in page])
+                    .values_list('product_info_id', 'parameter__name', 'value')))
+
+    queries.append(('search: кандидаты по слову', SearchTerm.objects.filter(term='товар')
+                    .values_list('product_info_id', flat=True)[:CANDIDATE_LIMIT + 1]))
+    queries.append(('search: кандидаты по префиксу', SearchTerm.objects.filter(term__gte='12', term__lt='12\uffff')
+                    .values_list('product_info_id', flat=True)[:CANDIDATE_LIMIT + 1]))
+
+    basket = order_values(BasketView().get_queryset(make_request(buyer)))
+    queries.append(('basket: корзина', basket))
+    queries.append(('basket: позиции корзины',
+                    OrderItem.objects.filter(order_id__in=[order['id'] for order in basket]).order_by('id')
+                    .values('id', 'order_id', 'product_info_id', 'quantity', 'price')))
+    for name, params in (('история заказов', {}), ('история заказов за период', {'dt_from': '2020-01-01'}),
+                         ('история заказов по статусу', {'status': 'new,confirmed'})):
+        view = OrderView()
+        request = make_request(buyer, **params)
+        queries.append((f'order: {name}', view.pagination_class().get_page_queryset(
+            view.get_queryset(request), request, view=view)))
+    view = ListOfOrdersView()
+    paginator = view.pagination_class()
+    request = make_request(shop_user)
+    feed = order_values(view.get_queryset(request), ('updated_at',))
+    queries.append(('list_of_orders: лента заказов поставщика', paginator.get_page_queryset(feed, request, view=view)))
+    paginator.paginate_queryset(feed, request, view=view)
+    request = make_request(shop_user, since=paginator.next_cursor)
+    queries.append(('list_of_orders: лента заказов поставщика, since', view.pagination_class().get_page_queryset(
+        order_values(view.get_queryset(request), ('updated_at',)), request, view=view)))
+    queries.append(('import: сопоставление прайс-листа',
+                    ProductInfo.objects.filter(shop_id=shop_id, external_id__in=list(range(1, 51)))))
+    return queries
+
+
+# просмотр таблицы без сортировки в запросе с LIMIT - это чтение в порядке первичного ключа
+# с остановкой после страницы, а не полный просмотр; сортировка после GROUP BY упорядочивает
+# уже сгруппированные строки и не отмечается
+def find_warnings(plan, limited=False):
+    sorted_in_memory = 'USE TEMP B-TREE FOR ORDER BY' in plan
+    warnings = []
+    for line in plan.splitlines():
+        text = line.strip()
+        for table in LARGE_TABLES:
+            full_scan_sqlite = (f'SCAN {table}' in text and 'USING' not in text
+                                and (sorted_in_memory or not limited))
+            full_scan_postgres = f'Seq Scan on {table}' in text
+            if full_scan_sqlite or full_scan_postgres:
+                warnings.append(f'полный просмотр {table}')
+        if 'USE TEMP B-TREE FOR ORDER BY' in text and 'USE TEMP B-TREE FOR GROUP BY' not in plan:
+            warnings.append(text)
+    return warnings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Отчет EXPLAIN для запросов view')
+    add_database_argument(parser)
+    parser.add_argument('--shops', type=int, default=10)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--skus', type=int, default=20000)
+    parser.add_argument('--parameters', type=int, default=5)
+    parser.add_argument('--buyers', type=int, default=200)
+    parser.add_argument('--orders', type=int, default=20)
+    parser.add_argument('--output', help='Файл отчета, по умолчанию stdout')
+    parser.add_argument('--strict', action='store_true', help='Код возврата 1 при наличии предупреждений')
+    args = parser.parse_args(argv)
+
+    setup_django(args.db, fresh=not args.keep)
+    from django.db import connection
+    from benchmarks.seed import seed_catalog
+    seed = seed_catalog(shops=args.shops, categories=args.categories, skus=args.skus,
+                        parameters=args.parameters, buyers=args.buyers, orders=args.orders)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    lines = [f'# EXPLAIN ({connection.vendor}), магазинов: {args.shops}, категорий: {args.categories}, '
+             f'товаров: {args.skus}, покупателей: {args.buyers}, заказов на покупателя: {args.orders}', '']
+    total_warnings = 0
+    for name, queryset in collect_queries(seed):
+        plan = queryset.explain()
+        warnings = find_warnings(plan, limited=queryset.query.high_mark is not None)
+        total_warnings += len(warnings)
+        lines.append(f'## {name}')
+        lines.append(str(queryset.query))
+        lines.append(plan)
+        lines.extend(f'WARNING: {warning}' for warning in warnings)
+        lines.append('')
+    lines.append(f'Предупреждений: {total_warnings}')
+
+    report = '\n'.join(lines) + '\n'
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report)
+    else:
+        sys.stdout.write(report)
+    return 1 if args.strict and total_warnings else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
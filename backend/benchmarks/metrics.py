@@ -0,0 +1,80 @@
+import argparse
+import statistics
+import sys
+import time
+from benchmarks import setup_django, add_database_argument
+
+"""
+Накладные расходы метрик запросов (service_app.metrics).
+Маршруты чтения выполняются тестовым клиентом django поочередно с request_metrics_middleware и счетчиком
+запросов к базе данных и без них (middleware убирается из MIDDLEWARE, record_query - из execute_wrappers
+соединения). Замеры чередуются раундами (порядок режимов меняется каждый раунд), для каждого режима берется
+медиана лучшего раунда.
+Выводятся время запроса в обоих режимах, разница в микросекундах и процентах и количество запросов
+к базе данных на маршрут, под строкой маршрута - заголовок Server-Timing его ответа
+
+python -m benchmarks.metrics --requests 300 --rounds 6
+"""
+
+
+MIDDLEWARE = 'service_app.metrics.request_metrics_middleware'
+
+
+def use_metrics(enabled):
+    from django.conf import settings
+    from django.db import connection
+    from service_app.metrics import record_query
+    connection.ensure_connection()
+    middleware = [name for name in settings.MIDDLEWARE if name != MIDDLEWARE]
+    wrappers = [wrapper for wrapper in connection.execute_wrappers if wrapper is not record_query]
+    settings.MIDDLEWARE = middleware + [MIDDLEWARE] if enabled else middleware
+    connection.execute_wrappers[:] = wrappers + [record_query] if enabled else wrappers
+
+
+def measure(path, headers, requests):
+    from django.test import Client
+    # обработчик тестового клиента собирает цепочку middleware при первом запросе
+    client = Client()
+    client.get(path, headers=headers)
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        latencies.append(time.perf_counter() - started)
+    return statistics.median(latencies), response
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Накладные расходы метрик запросов')
+    add_database_argument(parser)
+    parser.add_argument('--skus', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=300, help='Запросов на маршрут в раунде')
+    parser.add_argument('--rounds', type=int, default=6)
+    args = parser.parse_args(argv)
+
+    setup_django(args.db, fresh=not args.keep)
+    from benchmarks.asgi import get_routes
+    from benchmarks.seed import seed_catalog
+    seed = seed_catalog(shops=5, categories=20, skus=args.skus, parameters=5, buyers=20, orders=10, items=5)
+
+    print(f'{"маршрут":<16} {"без метрик мкс":>15} {"с метриками мкс":>16} {"разница мкс":>12} {"%":>6} {"запросов":>9}')
+    for name, make in get_routes(seed).items():
+        path, headers = make(0)
+        best = {True: None, False: None}
+        for round_number in range(args.rounds):
+            for enabled in ((False, True) if round_number % 2 else (True, False)):
+                use_metrics(enabled)
+                median, response = measure(path, headers, args.requests)
+                if best[enabled] is None or median < best[enabled][0]:
+                    best[enabled] = (median, response)
+        off, on = best[False][0] * 1e6, best[True][0] * 1e6
+        timing = best[True][1].headers['Server-Timing']
+        queries = timing.split('desc="')[1].split(' ')[0]
+        print(f'{name:<16} {off:>15.0f} {on:>16.0f} {on - off:>12.0f} {(on - off) / off * 100:>6.1f} {queries:>9}')
+        print(f'{"":<16} Server-Timing: {timing}')
+    use_metrics(True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
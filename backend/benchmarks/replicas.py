@@ -0,0 +1,136 @@
+import argparse
+import contextlib
+import sqlite3
+import sys
+import time
+from collections import Counter
+from benchmarks import setup_django, add_database_argument
+
+"""
+Проверка чтения с реплик (service_app.replicas) на нескольких локальных базах.
+Для SQLite реплики - копии основной базы, сделанные после заполнения (файлы <db>.replica1, ...), то есть
+реплики, которые никогда не догоняют основную базу: все, что записано после копирования, видно только
+в основной базе. Для Postgres адреса реплик передаются параметром --replica-db (настоящие реплики
+или копии базы, созданные, например, через CREATE DATABASE ... TEMPLATE).
+Выводится распределение запросов чтения каталога и истории заказов по базам и проверяется:
+каталог и история заказов читаются с реплик, после изменения корзины и оформления заказа клиент
+читает свои изменения с основной базы, остальные клиенты продолжают читать реплики,
+по истечении REPLICA_PIN_SECONDS клиент снова читает реплику
+
+python -m benchmarks.replicas --replicas 2 --requests 500
+python -m benchmarks.replicas --db postgresql://postgres@localhost/shop \\
+    --replica-db postgresql://postgres@localhost/shop_replica1 --replica-db postgresql://postgres@localhost/shop_replica2
+"""
+
+
+def copy_sqlite(source, target):
+    with contextlib.closing(sqlite3.connect(source)) as source_connection, \
+            contextlib.closing(sqlite3.connect(target)) as target_connection:
+        source_connection.backup(target_connection)
+
+
+@contextlib.contextmanager
+def count_queries():
+    """
+    Количество выполненных запросов по алиасам баз данных
+    """
+    from django.db import connections
+    counts = Counter()
+
+    def wrapper(alias):
+        def execute(execute, sql, params, many, context):
+            counts[alias] += 1
+            return execute(sql, params, many, context)
+        return execute
+
+    with contextlib.ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper(alias)))
+        yield counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Проверка чтения с реплик')
+    add_database_argument(parser)
+    parser.add_argument('--replicas', type=int, default=2, help='Количество реплик SQLite')
+    parser.add_argument('--replica-db', action='append', default=[], help='Адрес реплики Postgres')
+    parser.add_argument('--skus', type=int, default=2000)
+    parser.add_argument('--buyers', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=500, help='Запросов чтения для распределения по базам')
+    args = parser.parse_args(argv)
+
+    postgres = args.db.startswith(('postgres://', 'postgresql://'))
+    replicas = args.replica_db if postgres else [f'{args.db}.replica{i}' for i in range(1, args.replicas + 1)]
+    setup_django(args.db, fresh=not args.keep, replicas=replicas)
+    from django.conf import settings
+    from django.db import connections
+    from rest_framework.test import APIClient
+    from benchmarks.seed import seed_catalog
+    from service_app.models import Contact, Order, ProductInfo
+
+    seed = seed_catalog(shops=5, categories=20, skus=args.skus, parameters=5, buyers=args.buyers, orders=5, items=3)
+    if not postgres:
+        connections.close_all()
+        for replica in replicas:
+            copy_sqlite(args.db, replica)
+    # один процесс: закрепления хранятся в локальном кеше, короткий срок для проверки его истечения
+    settings.REPLICA_PIN_CACHE_ALIAS = 'default'
+    settings.REPLICA_PIN_SECONDS = 1
+    aliases = settings.DATABASE_REPLICAS
+
+    def client(user_id):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Token {user_id:040d}')
+        return api
+
+    buyers = seed['buyers']
+    with count_queries() as counts:
+        started = time.perf_counter()
+        for i in range(args.requests):
+            if i % 2:
+                APIClient().get(f'/api/v1/filter_products/?shop_id={seed["shops"][i % len(seed["shops"])]}'
+                                f'&page_size=20')
+            else:
+                client(buyers[i % len(buyers)]).get('/api/v1/order/?page_size=10')
+        elapsed = time.perf_counter() - started
+    print(f'Реплик: {len(replicas)}, запросов чтения: {args.requests}, {args.requests / elapsed:.0f} в секунду')
+    print('Запросов к базам: ' + ', '.join(f'{alias}: {counts[alias]}' for alias in connections))
+
+    checks = []
+    buyer, other = client(buyers[0]), client(buyers[1])
+    product_info_id = ProductInfo.objects.order_by('-id').values_list('id', flat=True).first()
+    ProductInfo.objects.filter(id=product_info_id).update(quantity=1000)
+    basket_id = Order.objects.get(user_id=buyers[0], status='basket').id
+    contact = Contact.objects.create(user_id=buyers[0], city='Москва', street='Тверская', phone='+79990000000')
+
+    def basket_has_item(api):
+        with count_queries() as queries:
+            items = api.get('/api/v1/basket/').json()['Basket'][0]['ordered_items']
+        return any(item['product_info']['id'] == product_info_id for item in items), queries
+
+    buyer.post('/api/v1/basket/', {'items': [{'product_info': product_info_id, 'quantity': 1}]}, format='json')
+    found, queries = basket_has_item(buyer)
+    checks.append(('корзина сразу после изменения читается с основной базы', found and queries['default'] > 0
+                   and not any(queries[alias] for alias in aliases)))
+    with count_queries() as queries:
+        other.get('/api/v1/basket/')
+    checks.append(('другой покупатель читает корзину с реплики', any(queries[alias] for alias in aliases)))
+
+    response = buyer.post('/api/v1/order/', {'id': basket_id, 'contact': contact.id}, format='json').json()
+    history = buyer.get('/api/v1/order/?page_size=50').json()['results']
+    checks.append(('новый заказ виден в истории сразу после оформления',
+                   response.get('Status') is True and any(order['id'] == basket_id for order in history)))
+
+    time.sleep(settings.REPLICA_PIN_SECONDS + 0.1)
+    with count_queries() as queries:
+        buyer.get('/api/v1/order/?page_size=50')
+    checks.append(('после REPLICA_PIN_SECONDS история заказов снова читается с реплики',
+                   any(queries[alias] for alias in aliases)))
+
+    for name, passed in checks:
+        print(f'{"OK    " if passed else "ОШИБКА"} {name}')
+    return 0 if all(passed for _, passed in checks) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
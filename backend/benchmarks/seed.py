@@ -0,0 +1,87 @@
+import random
+
+"""
+Заполнение базы данных синтетическим каталогом и заказами:
+shops магазинов x categories категорий x skus товаров x parameters параметров на товар,
+buyers покупателей с корзиной и orders оформленными заказами у каждого
+"""
+
+
+STATUSES = ('new', 'in_progress', 'confirmed', 'sent', 'done')
+COLORS = ('черный', 'белый', 'красный', 'синий', 'золотистый', 'серебристый')
+
+
+def seed_catalog(shops=5, categories=20, skus=10000, parameters=5, buyers=50, orders=10, items=5, seed=0):
+    from django.db import transaction
+    from rest_framework.authtoken.models import Token
+    from service_app.models import (User, Shop, Category, Goods, ProductInfo, Parameter, ProductParameter,
+                                    Order, OrderItem)
+    from service_app.basket import recalculate_totals
+    from service_app.cache import invalidate_catalog
+    from service_app.facets import rebuild_facets
+    from service_app.search import rebuild_search_index
+
+    rng = random.Random(seed)
+    with transaction.atomic():
+        User.objects.bulk_create(
+            [User(email=f'shop{i}@example.com', username=f'shop{i}', type_of_user='shop', is_active=True)
+             for i in range(shops)] +
+            [User(email=f'buyer{i}@example.com', username=f'buyer{i}', type_of_user='buyer', is_active=True)
+             for i in range(buyers)])
+        users = list(User.objects.order_by('id'))
+        shop_users, buyer_users = users[:shops], users[shops:]
+        Token.objects.bulk_create([Token(key=f'{user.id:040d}', user=user) for user in users])
+
+        Shop.objects.bulk_create(
+            [Shop(name=f'Магазин {i}', url=f'http://example.com/shop{i}', user=user)
+             for i, user in enumerate(shop_users)])
+        shop_ids = list(Shop.objects.order_by('id').values_list('id', flat=True))
+        category_ids = list(range(1, categories + 1))
+        Category.objects.bulk_create([Category(id=i, name=f'Категория {i}') for i in category_ids])
+        Category.shops.through.objects.bulk_create(
+            [Category.shops.through(category_id=category_id, shop_id=shop_id)
+             for category_id in category_ids for shop_id in shop_ids])
+        Parameter.objects.bulk_create([Parameter(name=f'Параметр {i}') for i in range(parameters - 1)] +
+                                      [Parameter(name='Цвет')])
+        parameter_ids = list(Parameter.objects.order_by('id').values_list('id', flat=True))
+
+        Goods.objects.bulk_create([Goods(id=i, name=f'Товар {i}', category_id=rng.choice(category_ids))
+                                   for i in range(1, skus + 1)], batch_size=1000)
+        ProductInfo.objects.bulk_create([ProductInfo(product_id=i, external_id=i, model=f'model/{i}',
+                                                     price=rng.randint(100, 200000), price_rrc=rng.randint(100, 200000),
+                                                     quantity=rng.randint(0, 100), shop_id=rng.choice(shop_ids))
+                                         for i in range(1, skus + 1)], batch_size=1000)
+        prices = dict(ProductInfo.objects.values_list('id', 'price'))
+        product_info_ids = sorted(prices)
+        product_parameters = []
+        for product_info_id in product_info_ids:
+            for parameter_id in parameter_ids[:-1]:
+                product_parameters.append(ProductParameter(product_info_id=product_info_id, parameter_id=parameter_id,
+                                                           value=str(rng.randint(1, 20))))
+            product_parameters.append(ProductParameter(product_info_id=product_info_id, parameter_id=parameter_ids[-1],
+                                                       value=rng.choice(COLORS)))
+            if len(product_parameters) >= 10000:
+                ProductParameter.objects.bulk_create(product_parameters, batch_size=1000)
+                product_parameters = []
+        ProductParameter.objects.bulk_create(product_parameters, batch_size=1000)
+
+        Order.objects.bulk_create([Order(user=user, status=status) for user in buyer_users
+                                   for status in ['basket'] + [rng.choice(STATUSES) for _ in range(orders)]],
+                                  batch_size=1000)
+        order_items = []
+        for order_id in Order.objects.values_list('id', flat=True):
+            for product_info_id in rng.sample(product_info_ids, min(items, len(product_info_ids))):
+                order_items.append(OrderItem(order_id=order_id, product_info_id=product_info_id,
+                                             quantity=rng.randint(1, 3), price=prices[product_info_id]))
+        OrderItem.objects.bulk_create(order_items, batch_size=1000)
+        recalculate_totals(Order.objects.all())
+        rebuild_facets()
+        rebuild_search_index()
+    invalidate_catalog()
+    return {
+        'shop_users': [user.id for user in shop_users],
+        'buyers': [user.id for user in buyer_users],
+        'shops': shop_ids,
+        'categories': category_ids,
+        'product_infos': len(product_info_ids),
+    }
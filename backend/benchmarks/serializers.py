@@ -0,0 +1,78 @@
+import argparse
+import sys
+import time
+from benchmarks import setup_django, add_database_argument
+
+"""
+Сравнение сериализаторов DRF с быстрой сериализацией из service_app.fast_serializers.
+Для страницы предложений и для заказов с позициями измеряется время чтения из базы данных
+и сериализации, отдельно время рендеринга JSON стандартным JSONRenderer и UJSONRenderer.
+Перед замером проверяется, что оба варианта дают одинаковый JSON
+
+python -m benchmarks.serializers --offers 1000 --orders 100 --repeat 5
+"""
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Сравнение сериализаторов DRF и быстрой сериализации')
+    add_database_argument(parser)
+    parser.add_argument('--offers', type=int, default=1000, help='Количество предложений в выборке')
+    parser.add_argument('--orders', type=int, default=100, help='Количество заказов в выборке')
+    parser.add_argument('--parameters', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5, help='Повторов замера, выводится лучший')
+    args = parser.parse_args(argv)
+
+    setup_django(args.db, fresh=not args.keep)
+    from rest_framework.renderers import JSONRenderer
+    from benchmarks.seed import seed_catalog
+    from service_app.fast_serializers import product_info_values, product_info_rows, order_values, order_rows
+    from service_app.models import ProductInfo, Order
+    from service_app.renderers import UJSONRenderer
+    from service_app.serializers import ProductInfoSerializer, OrderSerializer
+
+    seed_catalog(shops=10, categories=20, skus=args.offers, parameters=args.parameters,
+                 buyers=max(1, args.orders // 10), orders=10)
+    offers = ProductInfo.objects.order_by('id')[:args.offers]
+    orders = Order.objects.exclude(status='basket').order_by('id')[:args.orders]
+
+    cases = [
+        (f'предложения ({args.offers})',
+         lambda: ProductInfoSerializer(offers.select_related('product__category').prefetch_related(
+             'product_parameters__parameter'), many=True).data,
+         lambda: product_info_rows(list(product_info_values(offers))), args.offers),
+        (f'заказы ({args.orders})',
+         lambda: OrderSerializer(orders.select_related('contact').prefetch_related(
+             'ordered_items__product_info__product__category',
+             'ordered_items__product_info__product_parameters__parameter'), many=True).data,
+         lambda: order_rows(list(order_values(orders))), args.orders),
+    ]
+    failed = False
+    for name, drf, fast, count in cases:
+        drf_time, drf_data = best_of(args.repeat, drf)
+        fast_time, fast_data = best_of(args.repeat, fast)
+        json_time, drf_json = best_of(args.repeat, lambda: JSONRenderer().render(drf_data))
+        ujson_time, fast_json = best_of(args.repeat, lambda: UJSONRenderer().render(fast_data))
+        identical = drf_json == fast_json
+        failed = failed or not identical
+        print(f'{name}: одинаковый JSON: {"да" if identical else "НЕТ"}, размер {len(fast_json)} байт')
+        print(f'  DRF: {drf_time * 1000:.1f} мс, {count / drf_time:.0f} объектов/с, '
+              f'JSONRenderer: {json_time * 1000:.1f} мс')
+        print(f'  fast: {fast_time * 1000:.1f} мс, {count / fast_time:.0f} объектов/с, '
+              f'UJSONRenderer: {ujson_time * 1000:.1f} мс')
+        print(f'  ускорение: сериализация x{drf_time / fast_time:.1f}, рендеринг x{json_time / ujson_time:.1f}, '
+              f'на 1000 объектов: {(drf_time + json_time) / count * 1e6:.0f} мс -> '
+              f'{(fast_time + ujson_time) / count * 1e6:.0f} мс')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
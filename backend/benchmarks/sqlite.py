@@ -0,0 +1,225 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from benchmarks import setup_django, add_database_argument
+
+"""
+Чтение и запись в SQLite во время импорта прайс-листа (профиль service_app.sqlite).
+Для каждого профиля в отдельном потоке импортируется прайс-лист нового магазина (PriceListImporter, пакеты
+по batch_size товаров), одновременно --readers клиентов читают каталог (filter_products/) и корзину (basket/),
+а --writers покупателей изменяют корзину (POST basket/) с паузой --write-interval мс. Сначала нагрузка
+--idle секунд идет без импорта, затем до его завершения. Профили:
+default - настройки SQLite по умолчанию (журнал отката, synchronous=FULL, BEGIN DEFERRED, без очереди записи);
+production - OPTIONS базы данных из настроек (WAL, mmap, BEGIN IMMEDIATE) и очередь записи write_transaction.
+Выводятся задержки p50/p99/max чтения и записи по фазам, ошибки (в том числе database is locked)
+и длительность импорта, результат записывается в reports/sqlite.json. Импорт, чтение и запись выполняются
+потоками одного процесса и делят GIL, поэтому импорт медленнее, чем в отдельном обработчике
+
+python -m benchmarks.sqlite --skus 20000 --import-goods 10000 --readers 4 --writers 4
+python -m benchmarks.sqlite --batch-size 100 --profiles production
+"""
+
+
+REPORTS = os.path.join(os.path.dirname(__file__), 'reports')
+PHASES = ('idle', 'import')
+
+
+def get_profiles():
+    from django.conf import settings
+    return {
+        'default': {'options': {'init_command': 'PRAGMA journal_mode = DELETE; PRAGMA synchronous = FULL'},
+                    'queue': False},
+        'production': {'options': dict(settings.DATABASES['default']['OPTIONS']), 'queue': True},
+    }
+
+
+def use_profile(profile):
+    from django.conf import settings
+    from django.db import connections
+    from service_app.snapshots import wait_for_rebuilds
+    # профиль применяется к новым соединениям, переключение журнала требует закрыть все остальные,
+    # в том числе соединение фонового перестроения снимков каталога после загрузки данных
+    wait_for_rebuilds()
+    connections.close_all()
+    # соединения всех потоков читают OPTIONS из общего словаря настроек базы данных
+    settings.DATABASES['default']['OPTIONS'] = dict(profile['options'])
+    settings.SQLITE_WRITE_QUEUE = profile['queue']
+    with connections['default'].cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        return cursor.fetchone()[0]
+
+
+def make_price_list(name, count, categories, rng):
+    from service_app.models import Shop, User
+    user = User.objects.create(email=f'{name}@example.com', username=name, type_of_user='shop', is_active=True)
+    shop = Shop.objects.create(name=name, url=f'http://example.com/{name}', user=user)
+    goods = [{'id': i, 'name': f'{name} товар {i}', 'category': rng.choice(categories), 'model': f'{name}/{i}',
+              'price': rng.randint(100, 200000), 'price_rrc': rng.randint(100, 200000),
+              'quantity': rng.randint(0, 100),
+              'parameters': {'Цвет': rng.choice(('черный', 'белый')), 'Параметр 0': rng.randint(1, 20)}}
+             for i in range(1, count + 1)]
+    return shop, goods
+
+
+def run_import(shop, goods, batch_size, result):
+    from django.db import connection
+    from service_app.importer import PriceListImporter
+    importer = PriceListImporter(shop, batch_size=batch_size)
+    batches = []
+    started = time.perf_counter()
+    try:
+        importer.import_goods(goods, on_batch=lambda processed, stats: batches.append(processed))
+    except Exception as error:
+        result['error'] = f'{type(error).__name__}: {error}'
+    result['seconds'] = round(time.perf_counter() - started, 2)
+    result['imported'] = sum(batches)
+    connection.close()
+
+
+def run_load(seed, readers, writers, write_interval, phase, stop):
+    from django.db import connection
+    from django.test import Client
+
+    lock = threading.Lock()
+    samples = {(kind, name): [] for kind in ('read', 'write') for name in PHASES}
+    errors = {key: 0 for key in samples}
+    buyers, shops, categories = seed['buyers'], seed['shops'], seed['categories']
+
+    def record(kind, started, ok):
+        elapsed = time.perf_counter() - started
+        with lock:
+            samples[(kind, phase[0])].append(elapsed)
+            if not ok:
+                errors[(kind, phase[0])] += 1
+
+    def reader(number):
+        client = Client(raise_request_exception=False)
+        rng = random.Random(number)
+        while not stop.is_set():
+            started = time.perf_counter()
+            if rng.random() < 0.5:
+                response = client.get(f'/api/v1/filter_products/?shop_id={rng.choice(shops)}'
+                                      f'&category_id={rng.choice(categories)}&page_size=50')
+            else:
+                response = client.get('/api/v1/basket/',
+                                      headers={'Authorization': f'Token {rng.choice(buyers):040d}'})
+            record('read', started, response.status_code == 200)
+        connection.close()
+
+    def writer(number):
+        client = Client(raise_request_exception=False)
+        rng = random.Random(1000 + number)
+        headers = {'Authorization': f'Token {buyers[number % len(buyers)]:040d}'}
+        # товар, который уже есть в корзине, не добавляется повторно, у него меняется количество
+        basket = client.get('/api/v1/basket/', headers=headers).json()['Basket']
+        positions = {item['product_info']['id']: item['id'] for order in basket for item in order['ordered_items']}
+        while not stop.is_set():
+            product_info_id, quantity = rng.randint(1, seed['product_infos']), rng.randint(1, 5)
+            started = time.perf_counter()
+            if product_info_id in positions:
+                response = client.put('/api/v1/basket/', {'items': [{'id': positions[product_info_id],
+                                                                     'quantity': quantity}]},
+                                      content_type='application/json', headers=headers)
+            else:
+                response = client.post('/api/v1/basket/', {'items': [{'product_info': product_info_id,
+                                                                      'quantity': quantity}]},
+                                       content_type='application/json', headers=headers)
+            ok = response.status_code == 200 and response.json().get('Status') is True
+            record('write', started, ok)
+            if ok and product_info_id not in positions:
+                positions[product_info_id] = response.json()['Items'][0]['id']
+            time.sleep(write_interval)
+        connection.close()
+
+    threads = ([threading.Thread(target=reader, args=(i,)) for i in range(readers)] +
+               [threading.Thread(target=writer, args=(i,)) for i in range(writers)])
+    for thread in threads:
+        thread.start()
+    return threads, samples, errors
+
+
+def summarize(latencies, errors):
+    from benchmarks.api import percentile
+    latencies = sorted(latencies)
+    return {'requests': len(latencies), 'errors': errors,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Чтение и запись в SQLite во время импорта прайс-листа')
+    add_database_argument(parser)
+    parser.add_argument('--skus', type=int, default=20000)
+    parser.add_argument('--buyers', type=int, default=50)
+    parser.add_argument('--import-goods', type=int, default=10000, help='Товаров в импортируемом прайс-листе')
+    parser.add_argument('--batch-size', type=int, default=500, help='Товаров в пакете импорта')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--write-interval', type=float, default=10, help='Пауза между записями покупателя, мс')
+    parser.add_argument('--idle', type=float, default=3, help='Секунд нагрузки до начала импорта')
+    parser.add_argument('--profiles', default='default,production', help='Профили через запятую')
+    parser.add_argument('--output', help='Файл JSON с результатами, по умолчанию reports/sqlite.json')
+    args = parser.parse_args(argv)
+    if args.db.startswith(('postgres://', 'postgresql://')):
+        parser.error('Бенчмарк только для SQLite')
+
+    setup_django(args.db, fresh=not args.keep)
+    # ошибки запросов считаются в результатах, трассировки database is locked не выводятся
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    from benchmarks.seed import seed_catalog
+    seed = seed_catalog(shops=5, categories=20, skus=args.skus, parameters=5, buyers=args.buyers, orders=5, items=3)
+    profiles = get_profiles()
+
+    print(f'Товаров {args.skus}, импорт {args.import_goods} товаров пакетами по {args.batch_size}, '
+          f'читателей {args.readers}, писателей {args.writers}')
+    print(f'{"профиль":<11} {"журнал":<7} {"фаза":<7} {"чтение p50/p99/max мс":>24} {"ошибки":>7} '
+          f'{"запись p50/p99/max мс":>24} {"ошибки":>7}')
+    results = {}
+    failed = False
+    for name in args.profiles.split(','):
+        journal_mode = use_profile(profiles[name])
+        shop, goods = make_price_list(f'import-{name}', args.import_goods, seed['categories'], random.Random(0))
+        phase, stop = ['idle'], threading.Event()
+        threads, samples, errors = run_load(seed, args.readers, args.writers, args.write_interval / 1000, phase, stop)
+        time.sleep(args.idle)
+        phase[0] = 'import'
+        imported = {'error': None}
+        run_import(shop, goods, args.batch_size, imported)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        result = {'journal_mode': journal_mode, 'import': imported}
+        for phase_name in PHASES:
+            result[phase_name] = {kind: summarize(samples[(kind, phase_name)], errors[(kind, phase_name)])
+                                  for kind in ('read', 'write')}
+            row = result[phase_name]
+            print(f'{name:<11} {journal_mode:<7} {phase_name:<7} ' + ' '.join(
+                f'{row[kind]["p50_ms"]:>8.1f}/{row[kind]["p99_ms"]:>7.1f}/{row[kind]["max_ms"]:>7.1f} '
+                f'{row[kind]["errors"]:>7}' for kind in ('read', 'write')))
+        print(f'{"":<11} импорт {imported["imported"]} товаров за {imported["seconds"]} с'
+              + (f', ошибка {imported["error"]}' if imported['error'] else ''))
+        results[name] = result
+        if name == 'production':
+            failed = bool(imported['error']) or any(result[phase_name][kind]['errors'] for phase_name in PHASES
+                                                    for kind in ('read', 'write'))
+
+    output = args.output or os.path.join(REPORTS, 'sqlite.json')
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump({'config': {'skus': args.skus, 'buyers': args.buyers, 'import_goods': args.import_goods,
+                              'batch_size': args.batch_size, 'readers': args.readers, 'writers': args.writers,
+                              'write_interval_ms': args.write_interval, 'idle_seconds': args.idle},
+                   'profiles': results}, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
+    print(f'Результаты записаны в {output}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+from .authentication import CachedTokenAuthentication
+from .facets import parse_facet_filters, aget_parameter_ids, afacet_counts
+from .fast_serializers import product_info_values, aproduct_info_rows, order_values, aorder_rows
+from .pagination import KeysetPagination
+from .renderers import UJSONRenderer
+from .serializers import OrderSummarySerializer, ShopSerializer
+from .views import ProductInfoFiltersView, BasketView, OrderView, ShopStatus, parse_bool
+
+"""
+Async views для чтения каталога и заказов.
+Под ASGI синхронный APIView выполняется в отдельном потоке через sync_to_async, и поток занят, пока
+запрос ждет базу данных. Эти views - корутины: GET и HEAD читают данные через async ORM (async for,
+aget, afirst, aaggregate) и async-кеш, аутентификация по токену - CachedTokenAuthentication.aauthenticate.
+Фильтры, пагинация и формат ответа те же, что у синхронных views, тело ответа совпадает побайтно.
+Остальные методы (изменение корзины, оформление заказа, смена статуса магазина) передаются синхронному
+view sync_view. Маршруты используют эти views при ASYNC_VIEWS = True (по умолчанию в backend/asgi.py)
+"""
+
+
+class AsyncReadView(View):
+    """
+    Базовый async view: GET и HEAD выполняются корутиной get с запросом DRF Request,
+    остальные методы - синхронным view sync_view
+    """
+    sync_view = None
+    sync_handler = None
+    authentication_classes = [CachedTokenAuthentication]
+    requires_authentication = False
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        sync_handler = sync_to_async(cls.sync_view.as_view()) if cls.sync_view is not None else None
+        # как APIView: CSRF проверяется аутентификацией DRF, а не middleware
+        return csrf_exempt(super().as_view(sync_handler=sync_handler, **initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            if self.sync_handler is None:
+                return await self.http_method_not_allowed(request, *args, **kwargs)
+            return await self.sync_handler(request, *args, **kwargs)
+        request = Request(request, authenticators=())
+        try:
+            await self.authenticate(request)
+            return await self.get(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    async def authenticate(self, request):
+        for authentication_class in self.authentication_classes:
+            result = await authentication_class().aauthenticate(request._request)
+            if result is not None:
+                request.user, request.auth = result
+                return
+        if self.requires_authentication:
+            raise exceptions.NotAuthenticated()
+        request.user, request.auth = AnonymousUser(), None
+
+    # ответ об ошибке в формате rest_framework.views.exception_handler
+    def handle_exception(self, exc):
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = self.render(data, status=exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response.status_code = 401
+            response.headers['WWW-Authenticate'] = self.authentication_classes[0]().authenticate_header(None)
+        return response
+
+    def render(self, data, status=200):
+        return HttpResponse(UJSONRenderer().render(data), content_type='application/json', status=status)
+
+
+class AsyncProductInfoFiltersView(AsyncReadView):
+    """
+    ProductInfoFiltersView для ASGI: те же фильтры, курсорная пагинация, поля и фасеты
+    """
+    sync_view = ProductInfoFiltersView
+    pagination_class = KeysetPagination
+    keyset_orderings = ProductInfoFiltersView.keyset_orderings
+
+    async def get(self, request, *args, **kwargs):
+        view = self.sync_view()
+        try:
+            filters = parse_facet_filters(request.query_params, await aget_parameter_ids())
+            with_facets = parse_bool(request.query_params.get('facets', 'false'))
+            fields = view.get_fields(request)
+            queryset = view.get_queryset(request, filters)
+        except ValueError as error:
+            return self.render({'Status': False, 'Errors': str(error)}, status=400)
+        paginator = self.pagination_class()
+        rows = await paginator.apaginate_queryset(product_info_values(queryset, fields), request, view=self)
+        data = paginator.get_paginated_data(await aproduct_info_rows(rows, fields))
+        if with_facets:
+            data['facets'] = await afacet_counts(queryset)
+        return self.render(data)
+
+
+class AsyncBasketView(AsyncReadView):
+    """
+    BasketView для ASGI: get возвращает корзину, изменение корзины выполняет BasketView
+    """
+    sync_view = BasketView
+    requires_authentication = True
+
+    async def get(self, request, *args, **kwargs):
+        basket = [row async for row in order_values(self.sync_view().get_queryset(request))]
+        return self.render({'Status': True, 'Basket': await aorder_rows(basket) if basket else []})
+
+
+class AsyncOrderView(AsyncReadView):
+    """
+    OrderView для ASGI: get возвращает историю заказов, оформление и смену статуса выполняет OrderView
+    """
+    sync_view = OrderView
+    requires_authentication = True
+    pagination_class = KeysetPagination
+    keyset_orderings = OrderView.keyset_orderings
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            queryset = self.sync_view().get_queryset(request)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(queryset, request, view=self)
+        return self.render(paginator.get_paginated_data(OrderSummarySerializer(page, many=True).data))
+
+
+class AsyncShopStatus(AsyncReadView):
+    """
+    ShopStatus для ASGI: get возвращает магазин пользователя, смену статуса выполняет ShopStatus
+    """
+    sync_view = ShopStatus
+    requires_authentication = True
+
+    async def get(self, request, *args, **kwargs):
+        if request.user.type_of_user != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+        shop = await request.user.shops.afirst()
+        return self.render(ShopSerializer(shop).data)
@@ -0,0 +1,161 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+"""
+Аутентификация по токену с кешем.
+TokenAuthentication на каждый запрос читает Token вместе с User, CachedTokenAuthentication хранит
+пару (пользователь, токен) в LRU-кеше процесса на AUTH_TOKEN_CACHE_TIMEOUT секунд, попадание в кеш
+не выполняет запросов к базе данных. Если задан AUTH_TOKEN_CACHE_ALIAS, пара также хранится в общем
+кеше Django вместе с поколением токена, а текущее поколение - отдельным ключом общего кеша (как версия
+каталога в cache.py). Запись действительна, только пока ее поколение совпадает с текущим, поэтому
+попадание в локальный кеш стоит одного чтения общего кеша.
+Удаление токена (выход) и любое сохранение пользователя (смена пароля, is_active, типа пользователя)
+записывают токену новое случайное поколение через сигналы, и все процессы перечитывают пару из базы данных
+при следующем запросе. Без общего кеша сброс виден только в текущем процессе.
+aauthenticate - та же проверка для async views, промах кеша читает токен через async ORM
+"""
+
+
+KEY_PREFIX = 'auth:token:'
+GENERATION_PREFIX = 'auth:generation:'
+
+_local = OrderedDict()
+_lock = threading.Lock()
+
+
+def _timeout():
+    return getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 60)
+
+
+def _shared_cache():
+    alias = getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def _get_local(key):
+    with _lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return entry[0]
+
+
+def _set_local(key, value):
+    size = getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000)
+    with _lock:
+        _local[key] = (value, time.monotonic() + _timeout())
+        _local.move_to_end(key)
+        while len(_local) > size:
+            _local.popitem(last=False)
+
+
+def _new_generation():
+    return uuid.uuid4().hex
+
+
+def _get_generation(shared, key):
+    generation = shared.get(GENERATION_PREFIX + key)
+    if generation is None:
+        shared.add(GENERATION_PREFIX + key, _new_generation(), timeout=None)
+        generation = shared.get(GENERATION_PREFIX + key)
+    return generation
+
+
+async def _aget_generation(shared, key):
+    generation = await shared.aget(GENERATION_PREFIX + key)
+    if generation is None:
+        await shared.aadd(GENERATION_PREFIX + key, _new_generation(), timeout=None)
+        generation = await shared.aget(GENERATION_PREFIX + key)
+    return generation
+
+
+def invalidate_token(key):
+    with _lock:
+        _local.pop(key, None)
+    shared = _shared_cache()
+    if shared is not None:
+        # записи с прежним поколением в локальных кешах других процессов больше не действительны
+        shared.set(GENERATION_PREFIX + key, _new_generation(), timeout=None)
+        shared.delete(KEY_PREFIX + key)
+
+
+def invalidate_user_tokens(user_id):
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+def clear_token_cache():
+    with _lock:
+        _local.clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication с кешем пар (пользователь, токен), ключ кеша - значение токена
+    """
+
+    def authenticate_credentials(self, key):
+        shared = _shared_cache()
+        generation = _get_generation(shared, key) if shared is not None else None
+        cached = _get_local(key)
+        if cached is None or cached[0] != generation:
+            cached = shared.get(KEY_PREFIX + key) if shared is not None else None
+            if cached is None or cached[0] != generation:
+                user, token = super().authenticate_credentials(key)
+                cached = (generation, user, token)
+                if shared is not None:
+                    shared.set(KEY_PREFIX + key, cached, timeout=_timeout())
+            _set_local(key, cached)
+        user, token = cached[1:]
+        # каждый запрос получает свою копию, изменения request.user не попадают в кеш
+        return copy.copy(user), token
+
+    async def aauthenticate(self, request):
+        # разбор заголовка Authorization как в TokenAuthentication.authenticate
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. Token string should not contain invalid characters.'))
+        return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        shared = _shared_cache()
+        generation = await _aget_generation(shared, key) if shared is not None else None
+        cached = _get_local(key)
+        if cached is None or cached[0] != generation:
+            cached = await shared.aget(KEY_PREFIX + key) if shared is not None else None
+            if cached is None or cached[0] != generation:
+                model = self.get_model()
+                try:
+                    token = await model.objects.select_related('user').aget(key=key)
+                except model.DoesNotExist:
+                    raise exceptions.AuthenticationFailed(_('Invalid token.'))
+                if not token.user.is_active:
+                    raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+                cached = (generation, token.user, token)
+                if shared is not None:
+                    await shared.aset(KEY_PREFIX + key, cached, timeout=_timeout())
+            _set_local(key, cached)
+        user, token = cached[1:]
+        return copy.copy(user), token
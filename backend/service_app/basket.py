@@ -0,0 +1,142 @@
+import ujson
+from django.db.models import F, OuterRef, Subquery, Sum, Count
+from django.db.models.functions import Coalesce
+from .models import Order, OrderItem, ProductInfo
+from .sqlite import write_transaction
+
+"""
+Пакетное изменение корзины.
+Весь список позиций проверяется целиком, ИД информации о продуктах и позиций корзины сопоставляются
+одним запросом, изменения записываются одним bulk_create, bulk_update или delete(id__in=...)
+в одной транзакции. Проверка позиций выполняется в той же транзакции после блокировки строки корзины,
+поэтому параллельное изменение той же корзины не может вклиниться между проверкой и записью.
+Если хотя бы одна позиция некорректна, корзина не изменяется. Товар, который уже есть в корзине,
+повторно не добавляется: количество меняет update_items.
+Позиция хранит цену товара на момент добавления, сумма и количество позиций заказа
+пересчитываются одним UPDATE после каждого изменения.
+Функции возвращают (успех, результаты по позициям, количество измененных позиций),
+в результатах некорректных позиций указывается Errors
+"""
+
+
+def parse_items(items):
+    """
+    Приводит параметр items (список или json-строка со списком объектов) к списку словарей,
+    при ошибке формата вызывает ValueError
+    """
+    if isinstance(items, str):
+        try:
+            items = ujson.loads(items)
+        except ValueError:
+            raise ValueError('Неверный формат запроса')
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError('Неверный формат запроса')
+    return items
+
+
+# пересчет суммы и количества позиций для заказов из queryset одним UPDATE
+def recalculate_totals(orders):
+    items = OrderItem.objects.filter(order_id=OuterRef('id')).order_by().values('order_id')
+    orders.update(
+        total_sum=Coalesce(Subquery(items.annotate(total=Sum(F('quantity') * F('price'))).values('total')), 0),
+        items_count=Coalesce(Subquery(items.annotate(count=Count('id')).values('count')), 0))
+
+
+def _is_positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def _change(basket, results, validate, apply):
+    with write_transaction():
+        # блокировка строки корзины (SQLite и так выполняет транзакции записи по одной); корзина,
+        # оформленная в заказ после get_or_create, уже не меняется
+        if not list(Order.objects.select_for_update().filter(id=basket.id, status='basket').values_list('id')):
+            for result in results:
+                result['Errors'] = 'Корзина уже оформлена в заказ'
+            return False, results, 0
+        validate()
+        if any('Errors' in result for result in results):
+            return False, results, 0
+        count = apply()
+        recalculate_totals(Order.objects.filter(id=basket.id))
+    return True, results, count
+
+
+def add_items(basket, items):
+    results = [{'product_info': item.get('product_info'), 'quantity': item.get('quantity')} for item in items]
+    product_info_ids = [result['product_info'] for result in results if _is_positive_int(result['product_info'])]
+    prices = {}
+
+    def validate():
+        prices.update(ProductInfo.objects.filter(id__in=product_info_ids).values_list('id', 'price'))
+        in_basket = set(OrderItem.objects.filter(order_id=basket.id, product_info_id__in=product_info_ids)
+                        .values_list('product_info_id', flat=True))
+        seen = set()
+        for result in results:
+            if not _is_positive_int(result['product_info']) or not _is_positive_int(result['quantity']):
+                result['Errors'] = 'Некорректные product_info или quantity'
+            elif result['product_info'] not in prices:
+                result['Errors'] = 'Товар не найден'
+            elif result['product_info'] in seen:
+                result['Errors'] = 'Товар указан несколько раз'
+            elif result['product_info'] in in_basket:
+                result['Errors'] = 'Товар уже есть в корзине'
+            seen.add(result['product_info'])
+
+    def apply():
+        OrderItem.objects.bulk_create([OrderItem(order_id=basket.id, product_info_id=result['product_info'],
+                                                 quantity=result['quantity'], price=prices[result['product_info']])
+                                       for result in results])
+        ids = dict(OrderItem.objects.filter(order_id=basket.id, product_info_id__in=product_info_ids)
+                   .values_list('product_info_id', 'id'))
+        for result in results:
+            result['id'] = ids[result['product_info']]
+        return len(results)
+
+    return _change(basket, results, validate, apply)
+
+
+def update_items(basket, items):
+    results = [{'id': item.get('id'), 'quantity': item.get('quantity')} for item in items]
+    order_items = {}
+
+    def validate():
+        order_items.update(OrderItem.objects.filter(
+            order_id=basket.id, id__in=[result['id'] for result in results if _is_positive_int(result['id'])])
+            .in_bulk())
+        seen = set()
+        for result in results:
+            if not _is_positive_int(result['id']) or not _is_positive_int(result['quantity']):
+                result['Errors'] = 'Некорректные id или quantity'
+            elif result['id'] not in order_items:
+                result['Errors'] = 'Позиция не найдена в корзине'
+            elif result['id'] in seen:
+                result['Errors'] = 'Позиция указана несколько раз'
+            seen.add(result['id'])
+
+    def apply():
+        for result in results:
+            order_items[result['id']].quantity = result['quantity']
+        return OrderItem.objects.bulk_update([order_items[result['id']] for result in results], ['quantity'])
+
+    return _change(basket, results, validate, apply)
+
+
+def delete_items(basket, items):
+    results = [{'id': item.get('id')} for item in items]
+    existing = set()
+
+    def validate():
+        existing.update(OrderItem.objects.filter(
+            order_id=basket.id, id__in=[result['id'] for result in results if _is_positive_int(result['id'])])
+            .values_list('id', flat=True))
+        for result in results:
+            if not _is_positive_int(result['id']):
+                result['Errors'] = 'Некорректный id'
+            elif result['id'] not in existing:
+                result['Errors'] = 'Позиция не найдена в корзине'
+
+    def apply():
+        return OrderItem.objects.filter(order_id=basket.id, id__in=existing).delete()[0]
+
+    return _change(basket, results, validate, apply)
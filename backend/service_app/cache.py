@@ -0,0 +1,134 @@
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import Signal
+from .replicas import read_from_primary
+
+"""
+Версионированный кеш каталога.
+Версия каталога хранится в общем кеше (settings.CATALOG_CACHE_ALIAS), данные - в общем кеше и
+в памяти процесса с привязкой к версии. invalidate_catalog записывает новую случайную версию (uuid),
+после чего все процессы перестраивают данные при следующем чтении, читая основную базу, а не реплику.
+Версия не увеличивается через incr: в FileBasedCache incr - чтение и запись без блокировки, и два процесса
+могли бы записать одну и ту же версию. Попадание в кеш не выполняет запросов к базе данных.
+Остатки меняются при каждом оформлении и отмене заказа, поэтому у них отдельные версии: по магазину
+и общая для данных нескольких магазинов. invalidate_stock меняет только их, и перестраиваются только
+данные с остатками (cached_catalog с stock=True и снимки каталога затронутых магазинов).
+acached_catalog - вариант для async views, build - корутина.
+После изменения версии отправляется сигнал catalog_invalidated или stock_invalidated (по ним
+перестраиваются снимки каталога)
+"""
+
+
+VERSION_KEY = 'catalog:version'
+STOCK_VERSION_KEY = 'catalog:stock:'
+# версия остатков всех магазинов
+ALL_SHOPS = '*'
+
+catalog_invalidated = Signal()
+# аргумент shop_ids - магазины, остатки которых изменились
+stock_invalidated = Signal()
+
+_local = {}
+
+
+def _cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def _get_version(cache, key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def _aget_version(cache, key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _new_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def get_catalog_version():
+    return _get_version(_cache(), VERSION_KEY)
+
+
+async def aget_catalog_version():
+    return await _aget_version(_cache(), VERSION_KEY)
+
+
+def get_stock_version(shop_id=None):
+    return _get_version(_cache(), f'{STOCK_VERSION_KEY}{shop_id or ALL_SHOPS}')
+
+
+async def aget_stock_version(shop_id=None):
+    return await _aget_version(_cache(), f'{STOCK_VERSION_KEY}{shop_id or ALL_SHOPS}')
+
+
+def invalidate_stock(shop_ids):
+    """
+    Новые версии остатков магазинов shop_ids и общей версии остатков, версия каталога не меняется
+    """
+    shop_ids = sorted(set(shop_ids))
+    if not shop_ids:
+        return
+    _cache().set_many({f'{STOCK_VERSION_KEY}{shop_id}': _new_version() for shop_id in [*shop_ids, ALL_SHOPS]},
+                      timeout=None)
+    stock_invalidated.send(sender=None, shop_ids=shop_ids)
+
+
+def invalidate_catalog():
+    # каждая инвалидация дает версию, которой еще не было, даже если несколько процессов пишут ключ одновременно
+    version = _new_version()
+    _cache().set(VERSION_KEY, version, timeout=None)
+    _local.clear()
+    catalog_invalidated.send(sender=None, version=version)
+    return version
+
+
+# данные привязаны к версии каталога (при stock=True - и к общей версии остатков),
+# поэтому timeout только ограничивает время хранения
+def cached_catalog(name, build, timeout=None, stock=False):
+    version = get_catalog_version()
+    if stock:
+        version = f'{version}:{get_stock_version()}'
+    local = _local.get(name)
+    if local is not None and local[0] == version and local[2] > time.monotonic():
+        return local[1]
+    cache = _cache()
+    timeout = timeout or getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+    key = f'catalog:{version}:{name}'
+    value = cache.get(key)
+    if value is None:
+        with read_from_primary():
+            value = build()
+        cache.set(key, value, timeout=timeout)
+    _local[name] = (version, value, time.monotonic() + timeout)
+    return value
+
+
+async def acached_catalog(name, build, timeout=None, stock=False):
+    version = await aget_catalog_version()
+    if stock:
+        version = f'{version}:{await aget_stock_version()}'
+    local = _local.get(name)
+    if local is not None and local[0] == version and local[2] > time.monotonic():
+        return local[1]
+    cache = _cache()
+    timeout = timeout or getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+    key = f'catalog:{version}:{name}'
+    value = await cache.aget(key)
+    if value is None:
+        with read_from_primary():
+            value = await build()
+        await cache.aset(key, value, timeout=timeout)
+    _local[name] = (version, value, time.monotonic() + timeout)
+    return value
@@ -0,0 +1,161 @@
+import math
+from django.db.models import Count, Min, Max
+from .cache import cached_catalog, acached_catalog
+from .models import Parameter, ProductInfo, ProductParameter, ProductFacet
+
+"""
+Фасетный поиск по параметрам предложений.
+Параметры хранятся в EAV-таблице ProductParameter, поэтому для фильтров по значениям и диапазонам
+используется денормализованный индекс ProductFacet: категория товара и числовое значение параметра
+хранятся в той же строке, каждый фильтр выполняется одним поиском по составному индексу.
+refresh_facets перестраивает индекс для измененных при импорте предложений.
+Фильтры передаются параметрами запроса:
+param=Цвет:красный (повторение одного параметра - любое из значений),
+param_range=Диагональ (дюйм):6:7 (границу можно не указывать), price_min, price_max
+"""
+
+
+FACET_CHUNK_SIZE = 500
+FACET_VALUES_LIMIT = 50
+
+
+def parse_number(value):
+    try:
+        number = float(str(value).replace(',', '.'))
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def refresh_facets(product_info_ids):
+    product_info_ids = list(product_info_ids)
+    for start in range(0, len(product_info_ids), FACET_CHUNK_SIZE):
+        chunk = product_info_ids[start:start + FACET_CHUNK_SIZE]
+        ProductFacet.objects.filter(product_info_id__in=chunk).delete()
+        ProductFacet.objects.bulk_create(
+            [ProductFacet(product_info_id=product_info_id, parameter_id=parameter_id, category_id=category_id,
+                          value=value, value_number=parse_number(value))
+             for product_info_id, parameter_id, category_id, value in
+             ProductParameter.objects.filter(product_info_id__in=chunk).values_list(
+                 'product_info_id', 'parameter_id', 'product_info__product__category_id', 'value')])
+
+
+def rebuild_facets():
+    product_info_ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+    ProductFacet.objects.exclude(product_info_id__in=ProductInfo.objects.values('id')).delete()
+    refresh_facets(product_info_ids)
+    return len(product_info_ids)
+
+
+# при совпадающих названиях параметров используется параметр с меньшим ИД, как и при импорте
+def get_parameter_ids():
+    return cached_catalog('parameter_ids', lambda: dict(
+        (name, parameter_id) for parameter_id, name in Parameter.objects.order_by('-id').values_list('id', 'name')))
+
+
+async def aget_parameter_ids():
+    async def build():
+        return {name: parameter_id async for parameter_id, name in
+                Parameter.objects.order_by('-id').values_list('id', 'name')}
+    return await acached_catalog('parameter_ids', build)
+
+
+def _parse_bound(value, name):
+    if value == '':
+        return None
+    number = parse_number(value)
+    if number is None:
+        raise ValueError(f'Некорректная граница диапазона параметра {name}: {value}')
+    return number
+
+
+def parse_facet_filters(query_params, parameter_ids=None):
+    """
+    Разбирает фильтры из параметров запроса, при ошибке формата вызывает ValueError.
+    Неизвестный параметр не вызывает ошибку, а дает пустой результат (ИД None).
+    parameter_ids - ИД параметров по названиям, если уже получены (в async views - aget_parameter_ids)
+    """
+    if parameter_ids is None:
+        parameter_ids = get_parameter_ids()
+    filters = {'values': {}, 'ranges': {}, 'price': [None, None]}
+    for item in query_params.getlist('param'):
+        name, separator, value = item.partition(':')
+        if not separator:
+            raise ValueError(f'Фильтр param должен иметь вид название:значение, получено {item}')
+        filters['values'].setdefault(parameter_ids.get(name), set()).add(value)
+    for item in query_params.getlist('param_range'):
+        parts = item.rsplit(':', 2)
+        if len(parts) != 3:
+            raise ValueError(f'Фильтр param_range должен иметь вид название:от:до, получено {item}')
+        name, low, high = parts
+        filters['ranges'][parameter_ids.get(name)] = (_parse_bound(low, name), _parse_bound(high, name))
+    for position, key in enumerate(('price_min', 'price_max')):
+        if query_params.get(key):
+            try:
+                filters['price'][position] = int(query_params[key])
+            except ValueError:
+                raise ValueError(f'Некорректное значение {key}: {query_params[key]}')
+    return filters
+
+
+def apply_facet_filters(queryset, filters, category_id=None):
+    price_min, price_max = filters['price']
+    if price_min is not None:
+        queryset = queryset.filter(price__gte=price_min)
+    if price_max is not None:
+        queryset = queryset.filter(price__lte=price_max)
+    facets = ProductFacet.objects.all()
+    if category_id:
+        facets = facets.filter(category_id=category_id)
+    for parameter_id, values in filters['values'].items():
+        if parameter_id is None:
+            return queryset.none()
+        queryset = queryset.filter(id__in=facets.filter(parameter_id=parameter_id, value__in=values)
+                                   .values('product_info_id'))
+    for parameter_id, (low, high) in filters['ranges'].items():
+        if parameter_id is None:
+            return queryset.none()
+        matching = facets.filter(parameter_id=parameter_id, value_number__isnull=False)
+        if low is not None:
+            matching = matching.filter(value_number__gte=low)
+        if high is not None:
+            matching = matching.filter(value_number__lte=high)
+        queryset = queryset.filter(id__in=matching.values('product_info_id'))
+    return queryset
+
+
+def _facet_queries(queryset):
+    counts = ProductFacet.objects.filter(product_info_id__in=queryset.values('id')).values(
+        'parameter_id', 'value').annotate(count=Count('id')).order_by('parameter_id', '-count', 'value').values_list(
+        'parameter_id', 'value', 'count')
+    return counts, queryset.order_by()
+
+
+def _facet_result(parameter_ids, counts, price):
+    names = {parameter_id: name for name, parameter_id in parameter_ids.items()}
+    parameters = {}
+    for parameter_id, value, count in counts:
+        facet = parameters.setdefault(parameter_id, {'parameter': names.get(parameter_id), 'values': [],
+                                                     'min': None, 'max': None})
+        if len(facet['values']) < FACET_VALUES_LIMIT:
+            facet['values'].append({'value': value, 'count': count})
+        number = parse_number(value)
+        if number is not None:
+            facet['min'] = number if facet['min'] is None else min(facet['min'], number)
+            facet['max'] = number if facet['max'] is None else max(facet['max'], number)
+    return {'price': price, 'parameters': list(parameters.values())}
+
+
+def facet_counts(queryset):
+    """
+    Количество предложений по каждому значению параметров и диапазоны цены и числовых параметров
+    для всех предложений, подходящих под фильтры (двумя запросами независимо от числа параметров)
+    """
+    counts, prices = _facet_queries(queryset)
+    return _facet_result(get_parameter_ids(), counts, prices.aggregate(min=Min('price'), max=Max('price')))
+
+
+async def afacet_counts(queryset):
+    counts, prices = _facet_queries(queryset)
+    return _facet_result(await aget_parameter_ids(), [row async for row in counts],
+                         await prices.aaggregate(min=Min('price'), max=Max('price')))
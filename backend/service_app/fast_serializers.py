@@ -0,0 +1,189 @@
+from operator import itemgetter
+from rest_framework import serializers
+from .metrics import serialization
+from .models import OrderItem, ProductInfo, ProductParameter
+from .serializers import ProductInfoSerializer, OrderSerializer, ContactSerializer
+
+"""
+Быстрая сериализация для чтения.
+Словари строятся напрямую из строк .values() по заранее составленному списку функций полей,
+без создания экземпляров моделей и обхода полей вложенных сериализаторов DRF.
+Результат совпадает с ProductInfoSerializer и OrderSerializer (набор и порядок ключей, типы значений),
+сериализаторы DRF остаются описанием схемы и используются для записи.
+Позиции заказов, товары и параметры читаются одним запросом на уровень вложенности, как при prefetch_related.
+aproduct_info_rows и aorder_rows - те же функции для async views, запросы выполняются через async ORM
+"""
+
+
+PRODUCT_INFO_FIELDS = ProductInfoSerializer.Meta.fields
+ORDER_FIELDS = OrderSerializer.Meta.fields
+CONTACT_FIELDS = ContactSerializer.Meta.fields
+
+# колонки, которые нужны для каждого поля ProductInfoSerializer; id и price читаются всегда,
+# по ним строится курсор пагинации
+PRODUCT_INFO_COLUMNS = {
+    'id': ('id',),
+    'model': ('model',),
+    'product': ('product_id', 'product__name', 'product__category__name'),
+    'shop': ('shop_id',),
+    'quantity': ('quantity',),
+    'price': ('price',),
+    'price_rrc': ('price_rrc',),
+    'product_parameters': (),
+}
+
+_product_info_getters = {
+    'id': itemgetter('id'),
+    'model': itemgetter('model'),
+    'product': lambda row: {'id': row['product_id'], 'name': row['product__name'],
+                            'category': row['product__category__name']},
+    'shop': itemgetter('shop_id'),
+    'quantity': itemgetter('quantity'),
+    'price': itemgetter('price'),
+    'price_rrc': itemgetter('price_rrc'),
+}
+
+_datetime = serializers.DateTimeField()
+
+
+def parse_product_info_fields(value):
+    """
+    Поля ProductInfoSerializer из параметра fields (через запятую), для неизвестного поля - ValueError
+    """
+    fields = [field for field in (value or '').split(',') if field]
+    unknown = [field for field in fields if field not in PRODUCT_INFO_FIELDS]
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def get_product_info_fields(fields=None):
+    return [field for field in PRODUCT_INFO_FIELDS if not fields or field in fields]
+
+
+def product_info_values(queryset, fields=None):
+    """
+    Строки ProductInfo с колонками для полей fields (все поля, если fields пуст)
+    """
+    columns = {'id': None, 'price': None}
+    for field in get_product_info_fields(fields):
+        columns.update(dict.fromkeys(PRODUCT_INFO_COLUMNS[field]))
+    return queryset.select_related(None).prefetch_related(None).values(*columns)
+
+
+def _product_parameters_query(product_info_ids):
+    # без сортировки, как при prefetch_related: параметры читаются в порядке индекса (product_info, parameter)
+    return ProductParameter.objects.filter(product_info_id__in=product_info_ids).values_list(
+        'product_info_id', 'parameter__name', 'value')
+
+
+def _group_parameters(rows):
+    parameters = {}
+    for product_info_id, name, value in rows:
+        parameters.setdefault(product_info_id, []).append({'parameter': name, 'value': value})
+    return parameters
+
+
+def product_parameters_by_id(product_info_ids):
+    return _group_parameters(_product_parameters_query(product_info_ids))
+
+
+@serialization()
+def _build_product_info_rows(rows, fields, parameters):
+    getters = dict(_product_info_getters)
+    getters['product_parameters'] = lambda row: parameters.get(row['id'], [])
+    getters = [(field, getters[field]) for field in fields]
+    return [{field: getter(row) for field, getter in getters} for row in rows]
+
+
+def product_info_rows(rows, fields=None):
+    """
+    Список словарей в формате ProductInfoSerializer(fields=fields) для строк product_info_values
+    """
+    fields = get_product_info_fields(fields)
+    parameters = {}
+    if 'product_parameters' in fields:
+        parameters = product_parameters_by_id([row['id'] for row in rows])
+    return _build_product_info_rows(rows, fields, parameters)
+
+
+async def aproduct_info_rows(rows, fields=None):
+    fields = get_product_info_fields(fields)
+    parameters = {}
+    if 'product_parameters' in fields:
+        parameters = _group_parameters([row async for row in _product_parameters_query([row['id'] for row in rows])])
+    return _build_product_info_rows(rows, fields, parameters)
+
+
+def order_values(queryset, extra_fields=()):
+    """
+    Строки Order с колонками для OrderSerializer, контакт читается тем же запросом
+    """
+    return queryset.select_related(None).prefetch_related(None).values(
+        'id', 'user_id', 'dt', 'status', 'total_sum', 'items_count', 'contact_id', *extra_fields,
+        *(f'contact__{field}' for field in CONTACT_FIELDS if field != 'id'))
+
+
+def _contact(row):
+    if row['contact_id'] is None:
+        return None
+    return {field: row['contact_id'] if field == 'id' else row[f'contact__{field}'] for field in CONTACT_FIELDS}
+
+
+def _order_items_query(rows, items):
+    return (items if items is not None else OrderItem.objects.all()).filter(
+        order_id__in=[row['id'] for row in rows]).order_by('id').values(
+        'id', 'order_id', 'product_info_id', 'quantity', 'price')
+
+
+def _group_items(items):
+    items_by_order = {}
+    for item in items:
+        items_by_order.setdefault(item['order_id'], []).append(item)
+    return items_by_order
+
+
+def _items_product_infos(items_by_order):
+    product_info_ids = {item['product_info_id'] for order_items in items_by_order.values() for item in order_items}
+    return product_info_values(ProductInfo.objects.filter(id__in=product_info_ids).order_by('id'))
+
+
+@serialization()
+def _build_order_rows(rows, items_by_order, product_infos, fields):
+    product_infos = {item['id']: item for item in product_infos}
+    result = []
+    for row in rows:
+        order = {}
+        for field in fields:
+            if field == 'ordered_items':
+                order[field] = [{'id': item['id'], 'product_info': product_infos[item['product_info_id']],
+                                 'quantity': item['quantity'], 'price': item['price']}
+                                for item in items_by_order.get(row['id'], [])]
+            elif field == 'shop_total':
+                order[field] = sum(item['price'] * item['quantity'] for item in items_by_order.get(row['id'], []))
+            elif field == 'user':
+                order[field] = row['user_id']
+            elif field == 'contact':
+                order[field] = _contact(row)
+            elif field in ('dt', 'updated_at'):
+                order[field] = _datetime.to_representation(row[field])
+            elif field in row:
+                order[field] = row[field]
+        result.append(order)
+    return result
+
+
+def order_rows(rows, items=None, fields=ORDER_FIELDS):
+    """
+    Список словарей в формате OrderSerializer (или SupplierOrderSerializer с fields и shop_total) для строк
+    order_values. items - queryset позиций, из которого берутся позиции заказов (по умолчанию все позиции)
+    """
+    items_by_order = _group_items(_order_items_query(rows, items))
+    product_infos = product_info_rows(list(_items_product_infos(items_by_order)))
+    return _build_order_rows(rows, items_by_order, product_infos, fields)
+
+
+async def aorder_rows(rows, items=None, fields=ORDER_FIELDS):
+    items_by_order = _group_items([item async for item in _order_items_query(rows, items)])
+    product_infos = await aproduct_info_rows([row async for row in _items_product_infos(items_by_order)])
+    return _build_order_rows(rows, items_by_order, product_infos, fields)
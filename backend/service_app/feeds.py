@@ -0,0 +1,186 @@
+import os
+import ujson
+import yaml
+from yaml.composer import ComposerError
+from yaml.constructor import ConstructorError, SafeConstructor
+from yaml.nodes import ScalarNode
+from yaml.resolver import Resolver
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+"""
+Потоковый разбор прайс-листов.
+iter_feed_sections читает yaml-документ по событиям парсера libyaml (CSafeLoader) или
+построчный JSON (ndjson) и возвращает разделы верхнего уровня по одному. Списки users, categories
+и goods не собираются целиком, а отдаются пакетами по batch_size элементов в виде {'goods': [...]},
+поэтому потребление памяти не зависит от размера прайс-листа. Якоря, ссылки и ключи слияния << разбираются
+как в yaml.safe_load; раздел или список, помеченный якорем, хранится целиком до конца разбора
+"""
+
+
+STREAMED_KEYS = ('users', 'categories', 'goods')
+BATCH_SIZE = 500
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+MERGE_TAG = 'tag:yaml.org,2002:merge'
+_NO_KEY = object()
+_MERGE = object()
+
+
+class _ScalarConstructor(SafeConstructor, Resolver):
+    """
+    Определение тега и построение значения скаляра по правилам yaml.safe_load
+    """
+
+    def construct(self, event):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = self.resolve(ScalarNode, event.value, event.implicit)
+        if tag == MERGE_TAG:
+            return _MERGE
+        node = ScalarNode(tag, event.value, style=event.style)
+        if tag in self.yaml_constructors:
+            return self.yaml_constructors[tag](self, node)
+        return self.construct_undefined(node)
+
+
+class _Frame:
+    __slots__ = ('value', 'key', 'section', 'streamed', 'anchor', 'items', 'merge', 'start_mark')
+
+    def __init__(self, value, section, streamed, event):
+        self.value = value
+        self.key = _NO_KEY
+        self.section = section
+        self.streamed = streamed
+        self.anchor = event.anchor
+        # элементы помеченного якорем потокового списка сохраняются целиком для ссылок на него
+        self.items = [] if streamed and event.anchor else None
+        self.merge = None
+        self.start_mark = event.start_mark
+
+    def set_item(self, key, value, mark):
+        if key is not _MERGE:
+            self.value[key] = value
+            return
+        # ключ слияния <<: значения явных ключей важнее, из списка словарей важнее первый
+        mappings = value if isinstance(value, list) else [value]
+        merged = {}
+        for mapping in reversed(mappings):
+            if not isinstance(mapping, dict):
+                raise ConstructorError('while constructing a mapping', self.start_mark,
+                                       'expected a mapping or list of mappings for merging', mark)
+            merged.update(mapping)
+        if self.merge is None:
+            self.merge = {}
+        self.merge.update(merged)
+
+    def finish(self):
+        if self.merge:
+            self.value = {**self.merge, **self.value}
+        return self.value
+
+
+def detect_feed_format(name='', content_type=''):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in NDJSON_CONTENT_TYPES or os.path.splitext(name or '')[1].lower() in NDJSON_EXTENSIONS:
+        return 'ndjson'
+    return 'yaml'
+
+
+def iter_feed_sections(stream, feed_format='yaml', batch_size=BATCH_SIZE):
+    if feed_format == 'ndjson':
+        return iter_ndjson_sections(stream, batch_size)
+    return iter_yaml_sections(stream, batch_size)
+
+
+def iter_yaml_sections(stream, batch_size=BATCH_SIZE):
+    constructor = _ScalarConstructor()
+    anchors = {}
+    stack = []
+    for event in yaml.parse(stream, Loader=SafeLoader):
+        if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            is_mapping = isinstance(event, yaml.MappingStartEvent)
+            parent = stack[-1] if stack else None
+            # разделом считается корневой словарь или словарь - элемент корневого списка
+            section = is_mapping and (parent is None or (len(stack) == 1 and isinstance(parent.value, list)))
+            streamed = None
+            # раздел с якорем не разбивается на пакеты, на него могут ссылаться целиком
+            if (not is_mapping and parent is not None and parent.section and not parent.anchor
+                    and parent.key in STREAMED_KEYS):
+                streamed = parent.key
+            stack.append(_Frame({} if is_mapping else [], section, streamed, event))
+            continue
+        if isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            frame = stack.pop()
+            if frame.streamed:
+                if frame.value:
+                    yield {frame.streamed: frame.value}
+                if frame.anchor:
+                    anchors[frame.anchor] = frame.items
+                stack[-1].key = _NO_KEY
+                continue
+            value = frame.finish()
+            anchor = frame.anchor
+            if frame.section:
+                if anchor:
+                    anchors[anchor] = value
+                if value:
+                    yield value
+                continue
+        elif isinstance(event, yaml.ScalarEvent):
+            value = constructor.construct(event)
+            anchor = event.anchor
+        elif isinstance(event, yaml.AliasEvent):
+            if event.anchor not in anchors:
+                raise ComposerError(None, None, f'found undefined alias {event.anchor!r}', event.start_mark)
+            value = anchors[event.anchor]
+            anchor = None
+            # ссылка на словарь в корневом списке - тоже раздел
+            if len(stack) == 1 and isinstance(stack[0].value, list) and isinstance(value, dict):
+                yield value
+                continue
+        else:
+            continue
+        if anchor:
+            anchors[anchor] = value
+        if not stack:
+            continue
+        frame = stack[-1]
+        if isinstance(frame.value, dict):
+            if frame.key is _NO_KEY:
+                frame.key = value
+            else:
+                frame.set_item(frame.key, value, event.start_mark)
+                frame.key = _NO_KEY
+        else:
+            frame.value.append(value)
+            if frame.items is not None:
+                frame.items.append(value)
+            if frame.streamed and len(frame.value) >= batch_size:
+                yield {frame.streamed: frame.value}
+                frame.value = []
+
+
+# каждая строка - либо раздел ({"users": [...]}, {"categories": [...]}), либо отдельный товар
+def iter_ndjson_sections(stream, batch_size=BATCH_SIZE):
+    goods = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        item = ujson.loads(line)
+        if any(key in item for key in STREAMED_KEYS):
+            if goods:
+                yield {'goods': goods}
+                goods = []
+            yield item
+            continue
+        goods.append(item)
+        if len(goods) >= batch_size:
+            yield {'goods': goods}
+            goods = []
+    if goods:
+        yield {'goods': goods}
@@ -0,0 +1,277 @@
+from .facets import refresh_facets
+from .search import refresh_search_index
+from .sqlite import write_transaction
+from .models import User, Shop, Category, Goods, ProductInfo, Parameter, ProductParameter
+
+"""
+PriceListImporter - импорт прайс-листа магазина пакетными запросами.
+Вместо get_or_create на каждую категорию, товар и параметр импорт разбивает список товаров
+на пакеты и для каждого пакета выполняет фиксированное количество запросов
+(bulk_create с update_conflicts и выборки по __in).
+Существующие строки сопоставляются по ключу (товар, внешний ИД, магазин) и обновляются только при изменении
+цены, остатка, модели или параметров, отсутствующие в прайс-листе товары снимаются с продажи.
+CatalogLoader - начальная загрузка каталога нескольких магазинов из файлов формата data/shop1.yaml
+"""
+
+
+PRODUCT_INFO_FIELDS = ('model', 'price', 'price_rrc', 'quantity')
+
+
+def _select_products(keys):
+    return {(name, category_id): product_id for product_id, name, category_id in
+            Goods.objects.filter(name__in={name for name, _ in keys}).values_list('id', 'name', 'category_id')
+            if (name, category_id) in keys}
+
+
+def resolve_products(goods):
+    """
+    ИД товаров по паре (название, категория). Недостающие товары создаются, ИД им назначает база данных:
+    внешний ИД поставщика первичным ключом товара не используется. Товар, созданный параллельным импортом
+    между выборкой и записью, не дублируется: запись выполняется с update_conflicts по unique_goods
+    """
+    keys = {(item['name'], item['category']) for item in goods}
+    products = _select_products(keys)
+    missing = keys - set(products)
+    if missing:
+        Goods.objects.bulk_create([Goods(name=name, category_id=category_id) for name, category_id in missing],
+                                  update_conflicts=True, unique_fields=['name', 'category'], update_fields=['name'])
+        products.update(_select_products(missing))
+    return products
+
+
+class PriceListImporter:
+    """
+    Импорт категорий, товаров, информации о продуктах и их параметров для одного магазина.
+    Статистика по информации о продуктах накапливается в stats: inserted, updated, unchanged, retired.
+    Ключи (товар, внешний ИД) всех строк прайс-листа собираются в seen, по ним retire_missing находит остальные
+    """
+
+    batch_size = 500
+
+    def __init__(self, shop, batch_size=None):
+        self.shop = shop
+        if batch_size:
+            self.batch_size = batch_size
+        self.stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'retired': 0}
+        self.seen = set()
+
+    def import_categories(self, categories):
+        categories = {category['id']: category['name'] for category in categories}
+        if not categories:
+            return []
+        Category.objects.bulk_create([Category(id=category_id, name=name)
+                                      for category_id, name in categories.items()],
+                                     update_conflicts=True, unique_fields=['id'], update_fields=['name'])
+        self.shop.categories.add(*categories)
+        return list(categories)
+
+    # каждый пакет записывается в отдельной транзакции, on_batch вызывается после фиксации пакета
+    def import_goods(self, goods, on_batch=None):
+        goods = list(goods)
+        for start in range(0, len(goods), self.batch_size):
+            batch = goods[start:start + self.batch_size]
+            with write_transaction():
+                self._import_batch(batch)
+            if on_batch:
+                on_batch(len(batch), self.stats)
+        return self.stats
+
+    def _import_batch(self, batch):
+        products = resolve_products(batch)
+        parameters = self._resolve_parameters(batch)
+        changed_parameters, stale_parameters, changed = self._diff_product_infos(batch, products, parameters)
+        self._write_product_parameters(changed_parameters, stale_parameters)
+        refresh_facets(changed)
+        refresh_search_index(changed)
+
+    def _resolve_parameters(self, batch):
+        names = {name for item in batch for name in item.get('parameters', {})}
+        parameters = {}
+        for parameter_id, name in Parameter.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+            parameters[name] = parameter_id
+        missing = names - set(parameters)
+        if missing:
+            Parameter.objects.bulk_create([Parameter(name=name) for name in missing])
+            parameters.update({name: parameter_id for parameter_id, name in
+                               Parameter.objects.filter(name__in=missing).values_list('id', 'name')})
+        return parameters
+
+    # информация о продукте сопоставляется с уже загруженной по ключу ограничения уникальности
+    # (товар, внешний ИД, магазин); записываются только строки и параметры, которые действительно изменились,
+    # третьим значением возвращаются ИД строк, для которых нужно обновить фасетный и поисковый индексы
+    def _diff_product_infos(self, batch, products, parameters):
+        rows = {}
+        for item in batch:
+            product_id = products[(item['name'], item['category'])]
+            row = ProductInfo(product_id=product_id, external_id=item['id'], model=item.get('model', ''),
+                              price=item['price'], price_rrc=item['price_rrc'], quantity=item['quantity'],
+                              shop_id=self.shop.id)
+            rows[(product_id, item['id'])] = (row, {parameters[name]: str(value)
+                                                    for name, value in item.get('parameters', {}).items()})
+        self.seen.update(rows)
+        existing = {(product_info.product_id, product_info.external_id): product_info
+                    for product_info in ProductInfo.objects.filter(
+                        shop_id=self.shop.id, external_id__in={external_id for _, external_id in rows})
+                    .only('id', 'product_id', 'external_id', *PRODUCT_INFO_FIELDS).in_bulk().values()}
+        existing_parameters = {}
+        for product_parameter in ProductParameter.objects.filter(
+                product_info_id__in=[product_info.id for product_info in existing.values()]).in_bulk().values():
+            existing_parameters.setdefault(product_parameter.product_info_id, {})[product_parameter.parameter_id] = \
+                product_parameter
+
+        new_rows, changed_rows, changed_parameters, stale_parameters, changed = [], [], {}, [], set()
+        for key, (row, row_parameters) in rows.items():
+            current = existing.get(key)
+            if current is None:
+                new_rows.append(row)
+                changed_parameters[key] = row_parameters
+                self.stats['inserted'] += 1
+                continue
+            current_parameters = existing_parameters.get(current.id, {})
+            fields_changed = [field for field in PRODUCT_INFO_FIELDS if getattr(current, field) != getattr(row, field)]
+            parameters_changed = {parameter_id: value for parameter_id, value in row_parameters.items()
+                                  if parameter_id not in current_parameters
+                                  or current_parameters[parameter_id].value != value}
+            removed = [product_parameter.id for parameter_id, product_parameter in current_parameters.items()
+                       if parameter_id not in row_parameters]
+            if fields_changed:
+                for field in fields_changed:
+                    setattr(current, field, getattr(row, field))
+                changed_rows.append(current)
+            if parameters_changed:
+                changed_parameters[key] = parameters_changed
+            stale_parameters.extend(removed)
+            if parameters_changed or removed or 'model' in fields_changed:
+                changed.add(current.id)
+            if fields_changed or parameters_changed or removed:
+                self.stats['updated'] += 1
+            else:
+                self.stats['unchanged'] += 1
+
+        if new_rows:
+            ProductInfo.objects.bulk_create(new_rows, update_conflicts=True,
+                                            unique_fields=['product', 'external_id', 'shop'],
+                                            update_fields=list(PRODUCT_INFO_FIELDS))
+            existing.update({(product_info.product_id, product_info.external_id): product_info
+                             for product_info in ProductInfo.objects.filter(
+                                 shop_id=self.shop.id, external_id__in={row.external_id for row in new_rows})
+                             .only('id', 'product_id', 'external_id').in_bulk().values()})
+        if changed_rows:
+            ProductInfo.objects.bulk_update(changed_rows, fields=list(PRODUCT_INFO_FIELDS))
+        changed.update(existing[(row.product_id, row.external_id)].id for row in new_rows)
+        return ({existing[key].id: row_parameters for key, row_parameters in changed_parameters.items()},
+                stale_parameters, changed)
+
+    def _write_product_parameters(self, changed_parameters, stale_parameters):
+        product_parameters = [ProductParameter(product_info_id=product_info_id, parameter_id=parameter_id, value=value)
+                              for product_info_id, row_parameters in changed_parameters.items()
+                              for parameter_id, value in row_parameters.items()]
+        if product_parameters:
+            ProductParameter.objects.bulk_create(product_parameters, update_conflicts=True,
+                                                 unique_fields=['product_info', 'parameter'],
+                                                 update_fields=['value'])
+        if stale_parameters:
+            ProductParameter.objects.filter(id__in=stale_parameters).delete()
+
+    def retire_missing(self):
+        """
+        Снимает с продажи (обнуляет остаток) товары магазина, которых не было в прайс-листе: ключи строк
+        магазина с остатком сравниваются в памяти с ключами прайс-листа, остаток обнуляется UPDATE
+        по ИД пакетами по batch_size. Строки не удаляются, чтобы не терять позиции заказов и параметры
+        """
+        with write_transaction():
+            missing = [product_info_id for product_info_id, product_id, external_id in
+                       ProductInfo.objects.filter(shop_id=self.shop.id, quantity__gt=0)
+                       .values_list('id', 'product_id', 'external_id')
+                       if (product_id, external_id) not in self.seen]
+            for start in range(0, len(missing), self.batch_size):
+                self.stats['retired'] += ProductInfo.objects.filter(
+                    id__in=missing[start:start + self.batch_size]).update(quantity=0)
+        return self.stats
+
+
+class CatalogLoader:
+    """
+    Начальная загрузка каталога в формате data/shop1.yaml для нескольких магазинов.
+    Внешние ключи проверяются по словарям идентификаторов в памяти, каждый раздел записывается
+    в отдельной транзакции. Статистика накапливается в stats
+    """
+
+    def __init__(self):
+        self.users = set(User.objects.values_list('id', flat=True))
+        self.shops = {(name, url): shop_id for shop_id, name, url in Shop.objects.values_list('id', 'name', 'url')}
+        self.shop_ids = set(self.shops.values())
+        self.categories = set(Category.objects.values_list('id', flat=True))
+        self.parameters = {}
+        for parameter_id, name in Parameter.objects.order_by('-id').values_list('id', 'name'):
+            self.parameters[name] = parameter_id
+        self.stats = {'shops': 0, 'categories': 0, 'goods': 0, 'parameters': 0}
+
+    def load_section(self, section):
+        with write_transaction():
+            if 'shop' in section:
+                self._load_shop(section)
+            if 'categories' in section:
+                self._load_categories(section['categories'])
+            if 'goods' in section:
+                self._load_goods(section['goods'])
+
+    def _load_shop(self, item):
+        if item.get('user_id') not in self.users:
+            raise ValueError(f'Пользователь {item.get("user_id")} не найден')
+        key = (item['shop']['name'], item['shop']['url'])
+        if key not in self.shops:
+            shop = Shop.objects.create(name=key[0], url=key[1], user_id=item['user_id'])
+            self.shops[key] = shop.id
+            self.shop_ids.add(shop.id)
+        self.stats['shops'] += 1
+
+    def _load_categories(self, categories):
+        Category.objects.bulk_create([Category(id=category['id'], name=category['name']) for category in categories],
+                                     update_conflicts=True, unique_fields=['id'], update_fields=['name'])
+        self.categories.update(category['id'] for category in categories)
+        self.stats['categories'] += len(categories)
+
+    def _load_goods(self, goods):
+        for item in goods:
+            if item['category'] not in self.categories:
+                raise ValueError(f'Категория {item["category"]} товара {item["id"]} не найдена')
+            if item['shop'] not in self.shop_ids:
+                raise ValueError(f'Магазин {item["shop"]} товара {item["id"]} не найден')
+        self._resolve_parameters(goods)
+        # товары разных магазинов сопоставляются по паре (название, категория), как в PriceListImporter:
+        # внешний ИД одного поставщика не перезаписывает товар другого
+        products = resolve_products(goods)
+        rows = {(products[(item['name'], item['category'])], item['id'], item['shop']): item for item in goods}
+        Category.shops.through.objects.bulk_create(
+            [Category.shops.through(category_id=category_id, shop_id=shop_id)
+             for category_id, shop_id in {(item['category'], item['shop']) for item in goods}],
+            ignore_conflicts=True)
+        ProductInfo.objects.bulk_create([ProductInfo(product_id=product_id, external_id=external_id,
+                                                     model=item.get('model', ''), price=item['price'],
+                                                     price_rrc=item['price_rrc'], quantity=item['quantity'],
+                                                     shop_id=shop_id)
+                                         for (product_id, external_id, shop_id), item in rows.items()],
+                                        update_conflicts=True, unique_fields=['product', 'external_id', 'shop'],
+                                        update_fields=list(PRODUCT_INFO_FIELDS))
+        product_infos = {(product_id, external_id, shop_id): product_info_id
+                         for product_info_id, product_id, external_id, shop_id in
+                         ProductInfo.objects.filter(product_id__in={key[0] for key in rows})
+                         .values_list('id', 'product_id', 'external_id', 'shop_id')
+                         if (product_id, external_id, shop_id) in rows}
+        product_parameters = [ProductParameter(product_info_id=product_infos[key], parameter_id=self.parameters[name],
+                                               value=str(value))
+                              for key, item in rows.items() for name, value in item.get('parameters', {}).items()]
+        ProductParameter.objects.bulk_create(product_parameters, update_conflicts=True,
+                                             unique_fields=['product_info', 'parameter'], update_fields=['value'])
+        refresh_facets(product_infos.values())
+        refresh_search_index(product_infos.values())
+        self.stats['goods'] += len(goods)
+        self.stats['parameters'] += len(product_parameters)
+
+    def _resolve_parameters(self, goods):
+        missing = {name for item in goods for name in item.get('parameters', {})} - set(self.parameters)
+        if missing:
+            Parameter.objects.bulk_create([Parameter(name=name) for name in missing])
+            self.parameters.update({name: parameter_id for parameter_id, name in
+                                    Parameter.objects.filter(name__in=missing).values_list('id', 'name')})
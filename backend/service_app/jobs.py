@@ -0,0 +1,144 @@
+import io
+import logging
+import time
+from datetime import timedelta
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+from requests import get
+from .cache import invalidate_catalog
+from .feeds import detect_feed_format, iter_feed_sections
+from .importer import PriceListImporter
+from .models import ImportJob, Shop
+from .sqlite import checkpoint, write_transaction
+
+"""
+Очередь задач импорта прайс-листов на таблице ImportJob.
+enqueue_import ставит задачу в очередь, claim_next_job забирает задачу условным UPDATE,
+поэтому несколько процессов-обработчиков могут работать с одной очередью без внешнего брокера,
+run_import_job скачивает прайс-лист потоково (yaml или ndjson) и импортирует его пакетами,
+сохраняя прогресс и отметку активности heartbeat_at после каждого пакета. worker_loop периодически
+возвращает в очередь задачи без отметки активности дольше stale_after секунд (обработчик завершился
+аварийно) со сброшенным прогрессом. Ошибка базы данных при опросе очереди или сохранении результата
+не завершает обработчик, а откладывает следующий опрос
+"""
+
+
+DOWNLOAD_TIMEOUT = 60
+REQUEUE_INTERVAL = 60
+MAX_ERROR_DELAY = 60
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_import(user, url):
+    return ImportJob.objects.create(user=user, url=url)
+
+
+def claim_next_job():
+    while True:
+        job_id = ImportJob.objects.filter(status='pending').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        # задачу получает только тот обработчик, чей UPDATE изменил строку
+        now = timezone.now()
+        if ImportJob.objects.filter(id=job_id, status='pending').update(status='running', started_at=now,
+                                                                       heartbeat_at=now):
+            return ImportJob.objects.get(id=job_id)
+
+
+# задачи, обработчик которых завершился аварийно (нет отметки активности дольше timeout секунд),
+# возвращаются в очередь, повторный импорт начинается с начала прайс-листа
+def requeue_stale_jobs(timeout):
+    return ImportJob.objects.filter(status='running',
+                                    heartbeat_at__lt=timezone.now() - timedelta(seconds=timeout)).update(
+        status='pending', started_at=None, heartbeat_at=None, processed=0, stats={}, error='')
+
+
+def run_import_job(job):
+    try:
+        with get(job.url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            feed_format = detect_feed_format(job.url, response.headers.get('Content-Type'))
+            job.stats = import_feed(io.BufferedReader(response.raw), feed_format, job)
+        job.status = 'done'
+    except Exception as error:
+        job.status = 'failed'
+        job.error = f'{type(error).__name__}: {error}'
+    try:
+        # даже неудачный импорт мог зафиксировать часть пакетов
+        invalidate_catalog()
+        checkpoint()
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'stats', 'error', 'finished_at'])
+    except Exception:
+        # задача остается в статусе running и без отметки активности вернется в очередь
+        logger.exception('Не удалось завершить задачу импорта %s', job.id)
+        close_old_connections()
+    return job
+
+
+def _total_stats(importers):
+    stats = {}
+    for importer in importers:
+        for key, value in importer.stats.items():
+            stats[key] = stats.get(key, 0) + value
+    return stats
+
+
+# прайс-лист читается потоково: категории и товары импортируются пакетами по мере разбора;
+# на каждый магазин прайс-листа один импортер, отсутствующие товары снимаются с продажи после разбора всего файла
+def import_feed(stream, feed_format, job):
+    importers = {}
+    importer = None
+
+    def save_progress(processed, stats):
+        job.processed += processed
+        job.stats = _total_stats(importers.values())
+        ImportJob.objects.filter(id=job.id).update(processed=job.processed, stats=job.stats,
+                                                   heartbeat_at=timezone.now())
+
+    for section in iter_feed_sections(stream, feed_format, batch_size=PriceListImporter.batch_size):
+        for user in section.get('users', []):
+            shop, _ = Shop.objects.get_or_create(name=user['shop']['name'], url=user['shop']['url'],
+                                                 user_id=job.user_id)
+            importer = importers.get(shop.id)
+            if importer is None:
+                importer = importers[shop.id] = PriceListImporter(shop)
+        if ('categories' in section or 'goods' in section) and importer is None:
+            raise ValueError('В прайс-листе не указан магазин')
+        if 'categories' in section:
+            with write_transaction():
+                importer.import_categories(section['categories'])
+        if 'goods' in section:
+            importer.import_goods(section['goods'], on_batch=save_progress)
+    if not importers:
+        raise ValueError('В прайс-листе не указан магазин')
+    for importer in importers.values():
+        importer.retire_missing()
+    return _total_stats(importers.values())
+
+
+def worker_loop(poll_interval=1.0, once=False, stale_after=None):
+    next_requeue = time.monotonic()
+    error_delay = poll_interval
+    while True:
+        try:
+            if stale_after and time.monotonic() >= next_requeue:
+                requeue_stale_jobs(stale_after)
+                next_requeue = time.monotonic() + REQUEUE_INTERVAL
+            job = claim_next_job()
+        except DatabaseError:
+            logger.exception('Ошибка базы данных при опросе очереди импорта, повтор через %s с', error_delay)
+            # разорванное соединение закрывается, следующий опрос откроет новое
+            close_old_connections()
+            time.sleep(error_delay)
+            error_delay = min(error_delay * 2, MAX_ERROR_DELAY)
+            continue
+        error_delay = poll_interval
+        if job is not None:
+            run_import_job(job)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import queue as queues
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from service_app.cache import invalidate_catalog
+from service_app.feeds import iter_feed_sections, detect_feed_format, BATCH_SIZE
+from service_app.importer import CatalogLoader
+
+
+DEFAULT_FILE = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'shop1.yaml')
+
+# через сколько секунд без разделов в очереди проверяется, что процессы разбора живы
+QUEUE_TIMEOUT = 5
+
+
+# разбор файлов выполняется в процессах разбора, разделы передаются в основной процесс через очередь
+def _parse_files(paths, batch_size, queue):
+    for path in paths:
+        try:
+            with open(path, 'rb') as file:
+                for section in iter_feed_sections(file, detect_feed_format(path), batch_size):
+                    queue.put((path, section, None))
+        except Exception as error:
+            queue.put((path, None, f'{type(error).__name__}: {error}'))
+            return
+        queue.put((path, None, None))
+
+
+class Command(BaseCommand):
+    """
+    Начальная загрузка каталога из yaml-файлов в базу данных
+    """
+
+    help = ('Загружает магазины, категории, товары и параметры из одного или нескольких файлов, '
+            'разбирая файлы в отдельных процессах, и сбрасывает кеш каталога')
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', default=[os.path.normpath(DEFAULT_FILE)],
+                            help='Пути к yaml- или ndjson-файлам каталога')
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help='Количество процессов для разбора файлов, не меньше 1')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Количество товаров в одной транзакции')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('Количество процессов --workers должно быть не меньше 1')
+        # один и тот же файл, указанный несколько раз, загружается один раз
+        files = list(dict.fromkeys(os.path.realpath(path) for path in options['files']))
+        for path in files:
+            if not os.path.isfile(path):
+                raise CommandError(f'Файл {path} не найден')
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        # процессы разбора не должны наследовать открытые соединения с базой данных
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        # ограниченная очередь не дает процессам разбора обогнать запись в базу данных
+        queue = context.Queue(maxsize=options['workers'] * 4)
+        count = min(options['workers'], len(files))
+        parsers = [context.Process(target=_parse_files, args=(files[index::count], options['batch_size'], queue),
+                                   daemon=True) for index in range(count)]
+        started = time.monotonic()
+        for parser in parsers:
+            parser.start()
+        try:
+            with connection.execute_wrapper(count_queries):
+                loader = CatalogLoader()
+                remaining = set(files)
+                while remaining:
+                    try:
+                        path, section, error = queue.get(timeout=QUEUE_TIMEOUT)
+                    except queues.Empty:
+                        # аварийно завершившийся процесс разбора больше ничего не пришлет
+                        failed = [parser.exitcode for parser in parsers if parser.exitcode]
+                        if failed or not any(parser.is_alive() for parser in parsers):
+                            raise CommandError(f'Процессы разбора завершились (коды {failed or [0]}), '
+                                               f'не разобраны файлы: {", ".join(sorted(remaining))}')
+                        continue
+                    if error:
+                        raise CommandError(f'{path}: {error}')
+                    if section is None:
+                        remaining.discard(path)
+                        self.stdout.write(f'{path}: разбор завершен')
+                        continue
+                    try:
+                        loader.load_section(section)
+                    except ValueError as error:
+                        raise CommandError(f'{path}: {error}')
+        finally:
+            for parser in parsers:
+                if parser.is_alive():
+                    parser.terminate()
+        elapsed = time.monotonic() - started
+        invalidate_catalog()
+
+        stats = loader.stats
+        rows = sum(stats.values())
+        self.stdout.write(f'Магазинов: {stats["shops"]}, категорий: {stats["categories"]}, '
+                          f'товаров: {stats["goods"]}, параметров: {stats["parameters"]}')
+        self.stdout.write(f'Время: {elapsed:.2f} с, строк в секунду: {rows / elapsed:.0f}, '
+                          f'товаров в секунду: {stats["goods"] / elapsed:.0f}, запросов: {queries[0]}')
@@ -0,0 +1,52 @@
+import ujson
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Сводка отчета о N+1 запросах (service_app.query_detector): находки группируются по view и форме запроса,
+    сортируются по количеству HTTP-запросов с находкой, для каждой выводятся наибольшее число повторов,
+    поле сериализатора, SQL и последние кадры стека в коде проекта
+    """
+
+    help = 'Сводка отчета QUERY_DETECTOR_REPORT о повторяющихся запросах к базе данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Файл отчета, по умолчанию QUERY_DETECTOR_REPORT')
+        parser.add_argument('--limit', type=int, default=20, help='Сколько находок вывести')
+        parser.add_argument('--stack', type=int, default=3, help='Сколько кадров стека вывести')
+
+    def handle(self, *args, **options):
+        path = options['file'] or getattr(settings, 'QUERY_DETECTOR_REPORT', None)
+        groups = {}
+        try:
+            # отчет создается при первой находке
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    report = ujson.loads(line)
+                    group = groups.setdefault((report['view'], report['fingerprint']), {
+                        'requests': 0, 'max_count': 0, 'report': report})
+                    group['requests'] += 1
+                    if report['count'] > group['max_count']:
+                        group['max_count'], group['report'] = report['count'], report
+        except FileNotFoundError:
+            pass
+        except (OSError, TypeError) as error:
+            raise CommandError(f'Не удалось прочитать отчет {path}: {error}')
+
+        if not groups:
+            self.stdout.write('Повторяющихся запросов не найдено')
+            return
+        ordered = sorted(groups.values(), key=lambda group: (group['requests'], group['max_count']), reverse=True)
+        for group in ordered[:options['limit']]:
+            report = group['report']
+            self.stdout.write(f'{report["method"]} {report["route"]} ({report["view"]}): '
+                              f'HTTP-запросов {group["requests"]}, повторов до {group["max_count"]} '
+                              f'из {report["request_queries"]} запросов')
+            if report['serializer_field']:
+                self.stdout.write(f'  поле сериализатора: {report["serializer_field"]}')
+            self.stdout.write(f'  SQL: {report["sql"]}')
+            for frame in report['stack'][-options['stack']:]:
+                self.stdout.write(f'    {frame}')
+        self.stdout.write(f'Находок: {len(groups)}, файл {path}')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from service_app.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    """
+    Полное перестроение фасетного индекса ProductFacet по таблице ProductParameter
+    """
+
+    help = 'Перестраивает фасетный индекс для всех предложений (после миграции или ручной правки параметров)'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_facets()
+        self.stdout.write(f'Фасетный индекс перестроен, предложений: {count}')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from service_app.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    """
+    Полное перестроение поискового индекса SearchTerm по товарам, моделям и параметрам
+    """
+
+    help = 'Перестраивает поисковый индекс для всех предложений (после миграции или ручной правки каталога)'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_search_index()
+        self.stdout.write(f'Поисковый индекс перестроен, предложений: {count}')
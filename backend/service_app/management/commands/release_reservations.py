@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from service_app.reservations import release_expired_reservations
+
+
+class Command(BaseCommand):
+    """
+    Отмена новых заказов с истекшим резервом и возврат товара на остаток
+    """
+
+    help = 'Отменяет новые заказы, не подтвержденные за ORDER_RESERVATION_TIMEOUT секунд, и возвращает товар (запускать по расписанию)'
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        self.stdout.write(f'Отменено заказов с истекшим резервом: {released}')
@@ -0,0 +1,44 @@
+import multiprocessing
+from django.core.management.base import BaseCommand
+from django.db import connections
+from service_app.jobs import worker_loop, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    """
+    Запуск пула процессов-обработчиков очереди импорта прайс-листов. Зависшие задачи возвращаются в очередь
+    при запуске и затем периодически в каждом обработчике
+    """
+
+    help = 'Запускает процессы, которые забирают задачи импорта из таблицы ImportJob и выполняют их'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help='Количество процессов-обработчиков')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза между опросами пустой очереди, секунды')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Через сколько секунд без отметки активности выполняющаяся задача '
+                                 'считается зависшей')
+        parser.add_argument('--once', action='store_true',
+                            help='Завершиться, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь зависших задач: {requeued}')
+        # дочерние процессы не должны наследовать открытые соединения с базой данных
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=worker_loop,
+                                   args=(options['poll_interval'], options['once'], options['stale_after']))
+                   for _ in range(options['workers'])]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Запущено обработчиков: {len(workers)}')
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
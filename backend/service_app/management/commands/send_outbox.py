@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from service_app.outbox import outbox_loop, requeue_stale_emails
+
+
+class Command(BaseCommand):
+    """
+    Отправка писем из очереди OutgoingEmail: отложенных после ошибки и оставшихся после перезапуска сервера
+    """
+
+    help = 'Отправляет письма из очереди outbox (запускать по расписанию с --once или как постоянный процесс)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Пауза между опросами пустой очереди, секунды')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Через сколько секунд отправляемое письмо считается зависшим')
+        parser.add_argument('--once', action='store_true',
+                            help='Завершиться, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_emails(options['stale_after'])
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь зависших писем: {requeued}')
+        sent = outbox_loop(options['poll_interval'], options['once'])
+        self.stdout.write(f'Отправлено писем: {sent}')
@@ -0,0 +1,196 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+"""
+Метрики запросов к API.
+request_metrics_middleware для каждого запроса с путем, начинающимся с REQUEST_METRICS_PREFIX, считает
+количество и время запросов к базе данных, время сериализации и общее время view, добавляет их в ответ
+заголовком Server-Timing (db, serialize, view) и в гистограммы по маршруту (шаблон пути из urls.py) и методу.
+Запросы к базе данных считает record_query, который добавляется в execute_wrappers каждого соединения
+(сигнал connection_created) и ничего не делает вне запроса к API. Сериализация - время внутри serialization():
+data сериализаторов DRF (TimedModelSerializer), сборка строк в fast_serializers и рендеринг JSON
+(UJSONRenderer), время запросов к базе данных внутри этих блоков из сериализации вычитается.
+Гистограммы хранятся в памяти процесса и отдаются MetricsView в текстовом формате Prometheus:
+при нескольких процессах (gunicorn) каждый процесс отдает свои значения
+"""
+
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# имя метрики, описание, границы корзин
+HISTOGRAMS = (
+    ('api_request_duration_seconds', 'Время обработки запроса view', DURATION_BUCKETS),
+    ('api_db_duration_seconds', 'Время запросов к базе данных', DURATION_BUCKETS),
+    ('api_serialize_duration_seconds', 'Время сериализации ответа', DURATION_BUCKETS),
+    ('api_db_queries', 'Количество запросов к базе данных', QUERY_BUCKETS),
+)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'serialize_time', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # последняя корзина - +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def install_query_recorder(connection):
+    connection.execute_wrappers.append(record_query)
+
+
+@contextlib.contextmanager
+def serialization():
+    """
+    Учитывает время блока как сериализацию, вложенные блоки не учитываются повторно.
+    Можно использовать как декоратор синхронной функции
+    """
+    metrics = _current.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started, db_time = time.perf_counter(), metrics.db_time
+    try:
+        yield
+    finally:
+        metrics.serializing = False
+        metrics.serialize_time += time.perf_counter() - started - (metrics.db_time - db_time)
+
+
+def get_route(request):
+    match = getattr(request, 'resolver_match', None)
+    # маршрут, а не путь: ИД в пути не создают новые гистограммы, неизвестные пути собираются в одну
+    return match.route if match is not None else 'unmatched'
+
+
+def observe(route, method, metrics, duration):
+    values = (duration, metrics.db_time, metrics.serialize_time, metrics.queries)
+    with _histograms_lock:
+        for (name, _, buckets), value in zip(HISTOGRAMS, values):
+            key = (name, route, method)
+            histogram = _histograms.get(key)
+            if histogram is None:
+                histogram = _histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+
+def server_timing(metrics, duration):
+    return (f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries", '
+            f'serialize;dur={metrics.serialize_time * 1000:.2f}, view;dur={duration * 1000:.2f}')
+
+
+def _finish(request, response, metrics, duration):
+    observe(get_route(request), request.method, metrics, duration)
+    response.headers['Server-Timing'] = server_timing(metrics, duration)
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus():
+    """
+    Гистограммы всех маршрутов в текстовом формате Prometheus
+    """
+    with _histograms_lock:
+        snapshot = {key: (list(histogram.counts), histogram.sum, histogram.count)
+                    for key, histogram in _histograms.items()}
+    lines = []
+    for name, description, buckets in HISTOGRAMS:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} histogram')
+        for (metric, route, method), (counts, total, count) in sorted(snapshot.items()):
+            if metric != name:
+                continue
+            labels = f'route="{_label(route)}",method="{_label(method)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{labels},le="{float(bound)}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{{labels}}} {total}')
+            lines.append(f'{name}_count{{{labels}}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+@sync_and_async_middleware
+def request_metrics_middleware(get_response):
+    """
+    Метрики и заголовок Server-Timing для запросов к API, последний в MIDDLEWARE: view - время
+    разрешения маршрута, view DRF (аутентификация, обработчик) и рендеринга ответа
+    """
+    prefix = getattr(settings, 'REQUEST_METRICS_PREFIX', '/api/v1/')
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not request.path.startswith(prefix):
+                return await get_response(request)
+            metrics = RequestMetrics()
+            token = _current.set(metrics)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            _finish(request, response, metrics, time.perf_counter() - started)
+            return response
+    else:
+        def middleware(request):
+            if not request.path.startswith(prefix):
+                return get_response(request)
+            metrics = RequestMetrics()
+            token = _current.set(metrics)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            _finish(request, response, metrics, time.perf_counter() - started)
+            return response
+    return middleware
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.3 on 2026-10-18 02:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_app', '0004_catalog_and_order_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('value_number', models.FloatField(blank=True, null=True, verbose_name='Числовое значение')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='service_app.category', verbose_name='Категория')),
+                ('parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='service_app.parameter', verbose_name='Параметр')),
+                ('product_info', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='service_app.productinfo', verbose_name='Информация о продукте')),
+            ],
+            options={
+                'verbose_name': 'Фасет',
+                'verbose_name_plural': 'Фасетный индекс',
+                'indexes': [models.Index(fields=['parameter', 'value', 'product_info'], name='facet_value_idx'), models.Index(fields=['parameter', 'value_number', 'product_info'], name='facet_number_idx'), models.Index(fields=['category', 'parameter', 'value'], name='facet_category_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productfacet',
+            constraint=models.UniqueConstraint(fields=('product_info', 'parameter'), name='unique_product_facet'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_app', '0006_searchterm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reserved_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Резерв товара до'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('basket', 'Статус корзины'), ('new', 'Новый'), ('in_progress', 'В процессе'), ('confirmed', 'Подтвержден'), ('sent', 'Отправлен'), ('done', 'Завершена'), ('canceled', 'Отменен')], default='new', max_length=15, verbose_name='Статус'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('reserved_until__isnull', False)), fields=['reserved_until'], name='order_reserved_until_idx'),
+        ),
+    ]
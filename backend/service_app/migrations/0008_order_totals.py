@@ -0,0 +1,47 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:01
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Count
+from django.db.models.functions import Coalesce
+
+
+# цены позиций берутся из текущего прайса, итоги заказов пересчитываются по позициям
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model('service_app', 'Order')
+    OrderItem = apps.get_model('service_app', 'OrderItem')
+    ProductInfo = apps.get_model('service_app', 'ProductInfo')
+    OrderItem.objects.update(price=Subquery(ProductInfo.objects.filter(id=OuterRef('product_info_id')).values('price')))
+    items = OrderItem.objects.filter(order_id=OuterRef('id')).order_by().values('order_id')
+    Order.objects.update(
+        total_sum=Coalesce(Subquery(items.annotate(total=Sum(F('quantity') * F('price'))).values('total')), 0),
+        items_count=Coalesce(Subquery(items.annotate(count=Count('id')).values('count')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_app', '0007_order_reservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество позиций'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма заказа'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.PositiveIntegerField(default=0, verbose_name='Цена'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'dt'], name='order_user_dt_idx'),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:10
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+# существующие заказы считаются измененными в момент создания
+def fill_updated_at(apps, schema_editor):
+    Order = apps.get_model('service_app', 'Order')
+    Order.objects.update(updated_at=F('dt'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_app', '0008_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Изменен'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at', 'id'], name='order_updated_at_idx'),
+        ),
+    ]
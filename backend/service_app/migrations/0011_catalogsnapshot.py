@@ -0,0 +1,33 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_app', '0010_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=64, verbose_name='Магазин и категория')),
+                ('digest', models.CharField(max_length=64, verbose_name='Версия')),
+                ('rows', models.JSONField(default=dict, verbose_name='Хеши строк')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+            ],
+            options={
+                'verbose_name': 'Снимок каталога',
+                'verbose_name_plural': 'Список снимков каталога',
+                'ordering': ('-created_at', '-id'),
+                'indexes': [models.Index(fields=['scope', 'created_at'], name='catalog_snapshot_scope_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='catalogsnapshot',
+            constraint=models.UniqueConstraint(fields=('scope', 'digest'), name='unique_catalog_snapshot'),
+        ),
+    ]
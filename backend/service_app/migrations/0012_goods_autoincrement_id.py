@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_app', '0011_catalogsnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='goods',
+            name='id',
+            field=models.AutoField(primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:41
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+# дубликаты (название, категория), созданные параллельными импортами, сводятся к товару с меньшим ИД:
+# информация о продуктах переносится на него, а совпадающая по ключу unique_product_info передает ему
+# позиции заказов и удаляется вместе с дубликатом
+def merge_duplicate_goods(apps, schema_editor):
+    Goods = apps.get_model('service_app', 'Goods')
+    ProductInfo = apps.get_model('service_app', 'ProductInfo')
+    OrderItem = apps.get_model('service_app', 'OrderItem')
+    groups = Goods.objects.values('name', 'category_id').annotate(count=Count('id'), keep=Min('id')).filter(count__gt=1)
+    for group in groups:
+        duplicates = list(Goods.objects.filter(name=group['name'], category_id=group['category_id'])
+                          .exclude(id=group['keep']).values_list('id', flat=True))
+        kept = dict(((external_id, shop_id), product_info_id) for product_info_id, external_id, shop_id in
+                    ProductInfo.objects.filter(product_id=group['keep']).values_list('id', 'external_id', 'shop_id'))
+        for product_info_id, external_id, shop_id in ProductInfo.objects.filter(
+                product_id__in=duplicates).values_list('id', 'external_id', 'shop_id'):
+            target = kept.get((external_id, shop_id))
+            if target is None:
+                ProductInfo.objects.filter(id=product_info_id).update(product_id=group['keep'])
+                kept[(external_id, shop_id)] = product_info_id
+            else:
+                OrderItem.objects.filter(product_info_id=product_info_id).exclude(
+                    order_id__in=OrderItem.objects.filter(product_info_id=target).values('order_id')).update(
+                    product_info_id=target)
+        Goods.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_app', '0012_goods_autoincrement_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_goods, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='goods',
+            constraint=models.UniqueConstraint(fields=('name', 'category'), name='unique_goods'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:42
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+# выполняющиеся задачи получают отметку активности по времени начала, иначе они не вернутся в очередь
+def fill_heartbeat_at(apps, schema_editor):
+    ImportJob = apps.get_model('service_app', 'ImportJob')
+    ImportJob.objects.filter(status='running').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_app', '0013_goods_unique_name_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Активность'),
+        ),
+        migrations.RunPython(fill_heartbeat_at, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django_rest_passwordreset.tokens import get_token_generator
 
@@ -7,10 +8,10 @@ from django_rest_passwordreset.tokens import get_token_generator
 Ниже представлены следующие модели:
 UserManager - миксин для управления пользователями, User - стандартная модель пользователя,
 ConfirmEmailUser - модель подтверждения почты пользователя, Contact - модель контактов пользователя,
-YamlLoaderMixin - миксин для импорта информации из yaml-файла, Shop - модель магазина, Category - модель категории,
+Shop - модель магазина, Category - модель категории,
 Goods - модель товара, ProductInfo - модель информации о продукте, Parameter - модель параметра,
 ProductParameter - модель параметра продукта, Order - модель заказа,
-OrderItem - модель позиции заказа
+OrderItem - модель позиции заказа, ImportJob - модель задачи импорта прайс-листа
 
 """
 
@@ -23,7 +24,20 @@ status_of_orders = (
     ('in_progress', 'В процессе'),
     ('confirmed', 'Подтвержден'),
     ('sent', 'Отправлен'),
-    ('done', 'Завершена'),)
+    ('done', 'Завершена'),
+    ('canceled', 'Отменен'),)
+
+status_of_import_jobs = (
+    ('pending', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершена'),
+    ('failed', 'Ошибка'),)
+
+status_of_emails = (
+    ('pending', 'В очереди'),
+    ('sending', 'Отправляется'),
+    ('sent', 'Отправлено'),
+    ('failed', 'Ошибка'),)
 
 
 class UserManager(BaseUserManager):
@@ -137,30 +151,9 @@ class Contact(models.Model):
         return f'{self.user}{self.city}{self.street}'
 
 
-class YamlLoaderMixin:
-    """
-    Миксин для импорта информации из yaml-файла
-    """
-
-    @classmethod
-    def load_from_yaml(cls, file_path):
-        import yaml
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = yaml.safe_load(file)
-        instances = []
-        for item in data:
-            instance = cls._create_instance_from_yaml(item)
-            if isinstance(instance, list):
-                instances.extend(instance)
-            if isinstance(instance, cls):
-                instances.append(instance)
-        return instances
-
-
-
-class Shop(models.Model, YamlLoaderMixin):
+class Shop(models.Model):
     """
-    Модель магазина с функцией импорта информации о магазинах из yaml-файла
+    Модель магазина
     """
 
     name = models.CharField(max_length=50, verbose_name='Название')
@@ -169,20 +162,6 @@ class Shop(models.Model, YamlLoaderMixin):
                              on_delete=models.CASCADE)
     status = models.BooleanField(verbose_name='Статус получения заказа', default=True)
 
-    @classmethod
-    def _create_instance_from_yaml(cls, item):
-        if 'user_id' in item:
-            user_id = item.get('user_id')
-            user = User.objects.get(id=user_id)
-            name = item.get('shop').get('name')
-            url = item.get('shop').get('url')
-            existing_shop = cls.objects.filter(name=name, url=url).first()
-            if not existing_shop:
-                return cls.objects.create(name=name,
-                                      url=url, user_id=user.id)
-            else:
-                return existing_shop
-
     class Meta:
         verbose_name = 'Магазин'
         verbose_name_plural = "Список магазинов"
@@ -191,32 +170,14 @@ class Shop(models.Model, YamlLoaderMixin):
         return f'{self.name} {self.url}'
 
 
-class Category(models.Model, YamlLoaderMixin):
+class Category(models.Model):
     """
-    Модель категории с функцией импорта информации о категориях из yaml-файла
+    Модель категории
     """
 
     name = models.CharField(max_length=50, verbose_name='Название')
     shops = models.ManyToManyField(Shop, verbose_name='Магазины', related_name='categories')
 
-    @classmethod
-    def _create_instance_from_yaml(cls, item):
-        instances = []
-        if 'categories' in item:
-            categories_data = item['categories']
-            for category_data in categories_data:
-                category_id = category_data.get('id')
-                name = category_data.get('name')
-                existing_category = cls.objects.filter(id=category_id, name=name).first()
-                if not existing_category:
-                    new_category = cls.objects.create(id=category_id,
-                                              name=name)
-                    instances.append(new_category)
-                else:
-                    instances.append(existing_category)
-        return instances
-
-
     class Meta:
         verbose_name = 'Категория'
         verbose_name_plural = "Список категорий"
@@ -225,47 +186,31 @@ class Category(models.Model, YamlLoaderMixin):
         return f'{self.name}'
 
 
-class Goods(models.Model, YamlLoaderMixin):
+class Goods(models.Model):
     """
-    Модель товара с функцией импорта информации о товарах из yaml-файла
+    Модель товара
     """
 
-    id = models.IntegerField(primary_key=True)
+    id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=50, verbose_name='Название')
     category = models.ForeignKey(Category, verbose_name='Категория', related_name='products',
                                  on_delete=models.CASCADE)
 
-    @classmethod
-    def _create_instance_from_yaml(cls, item):
-        instances = []
-        if 'goods' in item:
-            goods_data = item['goods']
-            for product in goods_data:
-                category_id = product.get('category')
-                name = product.get('name')
-                id = product.get('id')
-                print(id)
-                category = Category.objects.get(pk=category_id)
-                existing_goods = cls.objects.filter(id=id, name=name).first()
-                if not existing_goods:
-                    new_product = cls.objects.create(id=id, name=name, category=category)
-                    instances.append(new_product)
-                else:
-                    instances.append(existing_goods)
-            return instances
-
-
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = "Список товаров"
+        constraints = [
+            # импорт сопоставляет товары по паре (название, категория)
+            models.UniqueConstraint(fields=['name', 'category'], name='unique_goods'),
+        ]
 
     def __str__(self):
         return f'{self.name}'
 
 
-class ProductInfo(models.Model, YamlLoaderMixin):
+class ProductInfo(models.Model):
     """
-    Модель информации о продукте с функцией импорта информации о продуктах из yaml-файла
+    Модель информации о продукте
     """
     external_id = models.PositiveIntegerField(verbose_name='Внешний ИД')
     model = models.CharField(max_length=100, verbose_name='Модель')
@@ -277,29 +222,6 @@ class ProductInfo(models.Model, YamlLoaderMixin):
     shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='product_info',
                              on_delete=models.CASCADE)
 
-    @classmethod
-    def _create_instance_from_yaml(cls, item):
-        instances = []
-        if 'goods' in item:
-            goods_data = item['goods']
-            for product_info in goods_data:
-                external_id = product_info.get('id')
-                model = product_info.get('model')
-                price = product_info.get('price')
-                price_rrc = product_info.get('price_rrc')
-                quantity = product_info.get('quantity')
-                shop_id = product_info.get('shop')
-                shop = Shop.objects.get(pk=shop_id)
-                product = Goods.objects.get(pk=external_id)
-                existing_product_info = cls.objects.filter(external_id=external_id, shop=shop).first()
-                if not existing_product_info:
-                    new_product_info = cls.objects.create(external_id=external_id, model=model, price=price, product=product,
-                                                          price_rrc=price_rrc, quantity=quantity, shop=shop)
-                    instances.append(new_product_info)
-                else:
-                    instances.append(existing_product_info)
-            return instances
-
     class Meta:
         verbose_name = 'Информация о продукте'
         verbose_name_plural = "Список информации о продуктах"
@@ -307,6 +229,14 @@ class ProductInfo(models.Model, YamlLoaderMixin):
             models.UniqueConstraint(fields=['product', 'external_id', 'shop'],
                                     name='unique_product_info')
         ]
+        indexes = [
+            # фильтр каталога по магазину с сортировкой по цене
+            models.Index(fields=['shop', 'price'], name='product_info_shop_price_idx'),
+            # курсорная пагинация каталога по (price, id)
+            models.Index(fields=['price', 'id'], name='product_info_price_id_idx'),
+            # сопоставление прайс-листа с загруженными товарами по (магазин, внешний ИД)
+            models.Index(fields=['shop', 'external_id'], name='product_info_shop_ext_idx'),
+        ]
 
     def __str__(self):
         return f'{self.product.name} {self.shop.name}'
@@ -327,9 +257,9 @@ class Parameter(models.Model):
         return f'{self.name}'
 
 
-class ProductParameter(models.Model, YamlLoaderMixin):
+class ProductParameter(models.Model):
     """
-    Модель связи продукта и параметра с функцией импорта информации о параметрах из yaml-файла
+    Модель связи продукта и параметра
     """
     product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте',
                                      related_name='product_parameters', on_delete=models.CASCADE)
@@ -337,26 +267,6 @@ class ProductParameter(models.Model, YamlLoaderMixin):
                                   on_delete=models.CASCADE)
     value = models.CharField(max_length=100, verbose_name='Значение')
 
-
-    @classmethod
-    def _create_instance_from_yaml(cls, item):
-        instances = []
-        if 'goods' in item:
-            goods_data = item['goods']
-            for product_data in goods_data:
-                product_info = ProductInfo.objects.get(id=product_data['id'])
-            for param_name, param_value in product_data['parameters'].items():
-                parameter, created = Parameter.objects.get_or_create(name=param_name)
-                product_parameter = ProductParameter.objects.create(product_info=product_info,
-                                                                    parameter=parameter, value=param_value)
-                existing_product_parameter = cls.objects.filter(parameter=product_parameter,
-                                                                product_info=product_info).first()
-                if not existing_product_parameter:
-                    instances.append(product_parameter)
-                else:
-                    instances.append(existing_product_parameter)
-            return instances
-
     class Meta:
         verbose_name = 'Параметр'
         verbose_name_plural = "Список параметров"
@@ -369,6 +279,64 @@ class ProductParameter(models.Model, YamlLoaderMixin):
         return f'{self.product_info} {self.parameter} {self.value}'
 
 
+class ProductFacet(models.Model):
+    """
+    Модель фасетного индекса: денормализованная копия параметров предложения с категорией товара
+    и числовым значением параметра. Перестраивается при импорте (service_app.facets.refresh_facets)
+    """
+    # поиск по предложению обслуживает уникальный индекс (product_info, parameter)
+    product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте', related_name='facets',
+                                     on_delete=models.CASCADE, db_index=False)
+    parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='facets',
+                                  on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='facets',
+                                 on_delete=models.CASCADE)
+    value = models.CharField(max_length=100, verbose_name='Значение')
+    value_number = models.FloatField(verbose_name='Числовое значение', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Фасет'
+        verbose_name_plural = "Фасетный индекс"
+        constraints = [
+            models.UniqueConstraint(fields=['product_info', 'parameter'],
+                                    name='unique_product_facet')
+        ]
+        indexes = [
+            # фильтр по значению параметра (Цвет = красный)
+            models.Index(fields=['parameter', 'value', 'product_info'], name='facet_value_idx'),
+            # фильтр по диапазону числового параметра (Диагональ от 6 до 7)
+            models.Index(fields=['parameter', 'value_number', 'product_info'], name='facet_number_idx'),
+            # фильтр по значению параметра внутри категории
+            models.Index(fields=['category', 'parameter', 'value'], name='facet_category_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_info_id} {self.parameter_id} {self.value}'
+
+
+class SearchTerm(models.Model):
+    """
+    Модель поискового индекса: слово из названия товара, модели или значения параметра предложения
+    с весом поля, в котором оно встретилось. Перестраивается при импорте (service_app.search.refresh_search_index)
+    """
+    term = models.CharField(max_length=64, verbose_name='Слово')
+    product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте', related_name='search_terms',
+                                     on_delete=models.CASCADE)
+    weight = models.PositiveSmallIntegerField(verbose_name='Вес')
+
+    class Meta:
+        verbose_name = 'Слово поискового индекса'
+        verbose_name_plural = "Поисковый индекс"
+        constraints = [
+            # поиск по слову и префиксу слова читает этот индекс по диапазону
+            models.UniqueConstraint(fields=['term', 'product_info'],
+                                    name='unique_search_term')
+        ]
+
+    def __str__(self):
+        return f'{self.term} {self.product_info_id}'
+
+
 class Order(models.Model):
     """
     Модель заказа
@@ -377,14 +345,32 @@ class Order(models.Model):
     user = models.ForeignKey(User, verbose_name='Пользователь', related_name='orders', blank=True,
                              on_delete=models.CASCADE)
     dt = models.DateTimeField(verbose_name='Дата', auto_now_add=True)
+    # время последнего изменения, по нему поставщики забирают новые и измененные заказы
+    updated_at = models.DateTimeField(verbose_name='Изменен', auto_now=True)
     status = models.CharField(verbose_name='Статус', max_length=15, choices=status_of_orders, default='new')
     contact = models.ForeignKey(Contact, verbose_name='Контакты', blank=True, null=True, on_delete=models.CASCADE)
+    reserved_until = models.DateTimeField(verbose_name='Резерв товара до', null=True, blank=True)
+    # хранимые итоги заказа, пересчитываются при изменении корзины и фиксируются при оформлении
+    total_sum = models.PositiveIntegerField(verbose_name='Сумма заказа', default=0)
+    items_count = models.PositiveIntegerField(verbose_name='Количество позиций', default=0)
 
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = "Список заказов"
         ordering = ('-dt',)
+        indexes = [
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+            # список заказов пользователя в порядке Meta.ordering без сортировки
+            models.Index(fields=['user', 'dt'], name='order_user_dt_idx'),
+            # у пользователя ровно одна корзина, частичный индекс хранит только ее
+            models.Index(fields=['user'], condition=models.Q(status='basket'), name='order_basket_user_idx'),
+            # поиск просроченных резервов
+            models.Index(fields=['reserved_until'], condition=models.Q(reserved_until__isnull=False),
+                         name='order_reserved_until_idx'),
+            # лента заказов поставщика в порядке (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='order_updated_at_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} {self.dt} {self.status}'
@@ -400,6 +386,8 @@ class OrderItem(models.Model):
     product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте',
                                      related_name='ordered_items', on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
+    # цена товара на момент добавления в корзину, при оформлении заказа обновляется и больше не меняется
+    price = models.PositiveIntegerField(verbose_name='Цена', default=0)
 
 
     class Meta:
@@ -408,6 +396,96 @@ class OrderItem(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['order_id', 'product_info'], name='unique_order_item'),
         ]
+        indexes = [
+            models.Index(fields=['order', 'id'], name='order_item_order_id_idx'),
+        ]
 
     def __str__(self):
         return f'{self.order} {self.product_info} {self.quantity}'
+
+
+class ImportJob(models.Model):
+    """
+    Модель задачи импорта прайс-листа, очередь задач хранится в этой же таблице
+    """
+    objects = models.Manager()
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='import_jobs',
+                             on_delete=models.CASCADE)
+    url = models.URLField(verbose_name='Ссылка на прайс-лист')
+    status = models.CharField(verbose_name='Статус', max_length=15, choices=status_of_import_jobs,
+                              default='pending')
+    processed = models.PositiveIntegerField(verbose_name='Обработано товаров', default=0)
+    stats = models.JSONField(verbose_name='Статистика импорта', default=dict, blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(verbose_name='Создана', auto_now_add=True)
+    started_at = models.DateTimeField(verbose_name='Начата', null=True, blank=True)
+    # обработчик обновляет отметку после каждого пакета, по ней находятся зависшие задачи
+    heartbeat_at = models.DateTimeField(verbose_name='Активность', null=True, blank=True)
+    finished_at = models.DateTimeField(verbose_name='Завершена', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = "Список задач импорта"
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['status', 'id'], name='import_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.url} {self.status}'
+
+
+class OutgoingEmail(models.Model):
+    """
+    Модель исходящего письма, очередь отправки хранится в этой же таблице
+    """
+    objects = models.Manager()
+    subject = models.CharField(verbose_name='Тема', max_length=255)
+    body = models.TextField(verbose_name='Текст')
+    from_email = models.CharField(verbose_name='Отправитель', max_length=254)
+    to = models.JSONField(verbose_name='Получатели', default=list)
+    status = models.CharField(verbose_name='Статус', max_length=15, choices=status_of_emails, default='pending')
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток отправки', default=0)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(verbose_name='Создано', auto_now_add=True)
+    # письмо с ошибкой отправки откладывается до этого времени
+    send_after = models.DateTimeField(verbose_name='Отправить после', default=timezone.now)
+    claimed_at = models.DateTimeField(verbose_name='Взято в отправку', null=True, blank=True)
+    sent_at = models.DateTimeField(verbose_name='Отправлено', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = "Очередь исходящих писем"
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['status', 'send_after'], name='outgoing_email_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} {self.to} {self.status}'
+
+
+class CatalogSnapshot(models.Model):
+    """
+    Модель версии снимка каталога: хеши строк снимка нужны для расчета изменений относительно
+    версии, которая уже есть у клиента
+    """
+    objects = models.Manager()
+    scope = models.CharField(verbose_name='Магазин и категория', max_length=64)
+    digest = models.CharField(verbose_name='Версия', max_length=64)
+    rows = models.JSONField(verbose_name='Хеши строк', default=dict)
+    created_at = models.DateTimeField(verbose_name='Создан', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Снимок каталога'
+        verbose_name_plural = "Список снимков каталога"
+        ordering = ('-created_at', '-id')
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'digest'], name='unique_catalog_snapshot'),
+        ]
+        indexes = [
+            models.Index(fields=['scope', 'created_at'], name='catalog_snapshot_scope_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope} {self.digest}'
@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+from .models import OutgoingEmail
+from .sqlite import write_transaction
+
+"""
+Очередь исходящих писем на таблице OutgoingEmail (outbox).
+queue_email записывает письмо в текущей транзакции, поэтому письмо о заказе или регистрации
+не уходит, если транзакция откатилась, и не теряется, если почтовый сервер недоступен.
+После фиксации транзакции отправка передается пулу потоков EMAIL_OUTBOX_WORKERS, запрос не ждет SMTP.
+Письма забираются пакетами условным UPDATE (как задачи импорта в jobs.py) и отправляются через одно
+SMTP-соединение на пакет. Неудачная отправка повторяется с удваивающейся паузой до MAX_ATTEMPTS раз,
+отложенные и оставшиеся после перезапуска письма отправляет команда send_outbox
+"""
+
+
+OUTBOX_BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 30
+MAX_RETRY_DELAY = 3600
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def queue_email(subject, body, to, from_email=None):
+    email = OutgoingEmail.objects.create(subject=subject, body=body, to=list(to),
+                                         from_email=from_email or settings.EMAIL_HOST_USER)
+    transaction.on_commit(dispatch)
+    return email
+
+
+def dispatch():
+    """
+    Запускает отправку очереди в пуле потоков, при EMAIL_OUTBOX_WORKERS = 0 - в текущем потоке
+    """
+    workers = getattr(settings, 'EMAIL_OUTBOX_WORKERS', 2)
+    if not workers:
+        send_pending_emails()
+        return
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox')
+    _executor.submit(_send_in_worker)
+
+
+def _send_in_worker():
+    # у потока пула свое соединение с базой данных
+    close_old_connections()
+    try:
+        send_pending_emails()
+    finally:
+        close_old_connections()
+
+
+def claim_emails(batch_size=OUTBOX_BATCH_SIZE):
+    now = timezone.now()
+    ids = list(OutgoingEmail.objects.filter(status='pending', send_after__lte=now).order_by(
+        'send_after', 'id').values_list('id', flat=True)[:batch_size])
+    claimed = []
+    with write_transaction():
+        for email_id in ids:
+            # письмо получает только тот обработчик, чей UPDATE изменил строку
+            if OutgoingEmail.objects.filter(id=email_id, status='pending').update(status='sending',
+                                                                                 claimed_at=now):
+                claimed.append(email_id)
+    return list(OutgoingEmail.objects.filter(id__in=claimed))
+
+
+def _retry(email, error):
+    attempts = email.attempts + 1
+    fields = {'attempts': attempts, 'error': f'{type(error).__name__}: {error}', 'claimed_at': None}
+    if attempts >= MAX_ATTEMPTS:
+        fields['status'] = 'failed'
+    else:
+        fields['status'] = 'pending'
+        fields['send_after'] = timezone.now() + timedelta(
+            seconds=min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY))
+    OutgoingEmail.objects.filter(id=email.id).update(**fields)
+
+
+def send_batch(emails):
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        for email in emails:
+            _retry(email, error)
+        return 0
+    sent = []
+    try:
+        for email in emails:
+            try:
+                EmailMessage(email.subject, email.body, email.from_email, email.to,
+                             connection=connection).send()
+            except Exception as error:
+                _retry(email, error)
+                # после ошибки соединение может быть разорвано, следующие письма откроют новое
+                connection.close()
+            else:
+                sent.append(email.id)
+    finally:
+        connection.close()
+    OutgoingEmail.objects.filter(id__in=sent).update(status='sent', sent_at=timezone.now(), claimed_at=None,
+                                                     error='')
+    return len(sent)
+
+
+def send_pending_emails(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Отправляет готовые к отправке письма пакетами, пока очередь не опустеет, возвращает количество отправленных
+    """
+    sent = 0
+    while True:
+        emails = claim_emails(batch_size)
+        if not emails:
+            return sent
+        sent += send_batch(emails)
+
+
+# письма, обработчик которых завершился аварийно, возвращаются в очередь
+def requeue_stale_emails(timeout):
+    return OutgoingEmail.objects.filter(status='sending',
+                                        claimed_at__lt=timezone.now() - timedelta(seconds=timeout)).update(
+        status='pending', claimed_at=None)
+
+
+def outbox_loop(poll_interval=5.0, once=False):
+    while True:
+        sent = send_pending_emails()
+        if once:
+            return sent
+        if not sent:
+            time.sleep(poll_interval)
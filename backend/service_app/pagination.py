@@ -0,0 +1,151 @@
+import base64
+import datetime
+import json
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+"""
+KeysetPagination - курсорная (keyset) пагинация.
+Следующая страница выбирается условием по значениям полей упорядочивания последней строки
+(например, price > x OR (price = x AND id > y)), а не смещением, поэтому любая страница
+стоит столько же, сколько первая. Допустимые варианты упорядочивания задаются во view
+атрибутом keyset_orderings, последним полем каждого варианта должен быть уникальный ключ.
+В async views страница читается через apaginate_queryset, а ответ строится из get_paginated_data
+"""
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder отбрасывает микросекунды, а значения в курсоре должны совпадать с хранимыми точно
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    max_page_size = 200
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE or self.max_page_size
+        self.ordering = None
+        self.ordering_name = None
+        self.current_page_size = self.page_size
+        self.next_cursor = None
+        self.cursor = None
+
+    def get_orderings(self, view):
+        return getattr(view, 'keyset_orderings', {'id': ('id',)})
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    # запрос страницы с лишней строкой, по наличию которой определяется следующая страница
+    def get_page_queryset(self, queryset, request, view=None):
+        orderings = self.get_orderings(view)
+        self.ordering_name = request.query_params.get(self.ordering_query_param)
+        if self.ordering_name not in orderings:
+            self.ordering_name = next(iter(orderings))
+        self.ordering = orderings[self.ordering_name]
+        self.current_page_size = self.get_page_size(request)
+
+        self.cursor = request.query_params.get(self.cursor_query_param)
+        if self.cursor:
+            keyset_filter = self.get_keyset_filter(self.decode_cursor(self.cursor, self.ordering_name))
+            try:
+                queryset = queryset.filter(keyset_filter)
+            except (TypeError, ValueError, ValidationError):
+                # значения курсора приводятся к типам полей упорядочивания при построении условия
+                raise NotFound(self.invalid_cursor_message)
+        return queryset.order_by(*self.ordering)[:self.current_page_size + 1]
+
+    def get_page(self, rows):
+        if len(rows) > self.current_page_size:
+            rows = rows[:self.current_page_size]
+            self.next_cursor = self.encode_cursor(self.ordering_name, rows[-1])
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.get_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.get_page([row async for row in self.get_page_queryset(queryset, request, view)])
+
+    def get_keyset_filter(self, values):
+        keyset_filter = Q()
+        for position, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = Q(**{f'{name}__{lookup}': values[position]})
+            for previous, previous_field in enumerate(self.ordering[:position]):
+                condition &= Q(**{previous_field.lstrip('-'): values[previous]})
+            keyset_filter |= condition
+        if len(self.ordering) == 1:
+            return keyset_filter
+        # условие на первое поле без OR позволяет базе данных читать индекс по диапазону
+        first = self.ordering[0]
+        lookup = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{lookup}': values[0]}) & keyset_filter
+
+    def encode_cursor(self, ordering_name, row):
+        # строки страницы - объекты моделей или словари из values()
+        if isinstance(row, dict):
+            values = [row[field.lstrip('-')] for field in self.ordering]
+        else:
+            values = [getattr(row, field.lstrip('-')) for field in self.ordering]
+        data = json.dumps({'o': ordering_name, 'v': values}, cls=CursorEncoder)
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor, ordering_name):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            values = data['v']
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if data.get('o') != ordering_name or not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_paginated_data(self, data):
+        return {'Status': True, 'next': self.next_cursor, 'results': data}
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class SyncPagination(KeysetPagination):
+    """
+    Инкрементальная синхронизация: курсор передается параметром since и возвращается и на последней
+    странице, чтобы следующий опрос получил только строки, измененные после уже полученных.
+    has_more показывает, что следующую страницу можно запросить сразу, не дожидаясь следующего опроса
+    """
+    cursor_query_param = 'since'
+
+    def __init__(self):
+        super().__init__()
+        self.has_more = False
+
+    def get_page(self, rows):
+        rows = super().get_page(rows)
+        self.has_more = self.next_cursor is not None
+        if not self.has_more:
+            self.next_cursor = self.encode_cursor(self.ordering_name, rows[-1]) if rows else self.cursor
+        return rows
+
+    def get_paginated_data(self, data):
+        return {'Status': True, 'next': self.next_cursor, 'has_more': self.has_more, 'results': data}
@@ -0,0 +1,173 @@
+import contextvars
+import datetime
+import functools
+import hashlib
+import os
+import random
+import re
+import sys
+import threading
+import traceback
+import ujson
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.serializers import BaseSerializer
+from . import metrics
+
+"""
+Поиск N+1 запросов во время работы приложения.
+query_detector_middleware для доли QUERY_DETECTOR_SAMPLE_RATE запросов к API (в разработке - для всех,
+в production - для выборки) собирает отпечатки SQL: запрос без параметров, списки значений IN (...)
+и VALUES (...), (...) сворачиваются, поэтому запросы одной формы с разными ИД дают один отпечаток.
+Если запрос одной формы выполнен за HTTP-запрос QUERY_DETECTOR_THRESHOLD раз и больше, в отчет
+QUERY_DETECTOR_REPORT (JSON по строке на находку) записываются маршрут и view, SQL, количество
+повторов, поле сериализатора DRF, при сериализации которого выполнялся запрос, и стек вызовов
+в коде проекта. Стек снимается один раз на отпечаток, когда количество повторов достигает порога.
+Отчет сводит команда query_report. Запросы считает record_query, который добавляется
+в execute_wrappers каждого соединения (сигнал connection_created) и ничего не делает вне выборки
+"""
+
+
+_current = contextvars.ContextVar('query_detector', default=None)
+_report_lock = threading.Lock()
+
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+_VALUES = re.compile(r'(\(\.\.\.\))(?:, \(\.\.\.\))+')
+_NUMBER = re.compile(r'\b\d+\b')
+# обертки execute_wrappers не показываются в стеке
+_SKIPPED_FILES = {__file__, metrics.__file__}
+
+
+class RequestQueries:
+    __slots__ = ('counts', 'sql', 'findings', 'total')
+
+    def __init__(self):
+        self.counts = {}
+        self.sql = {}
+        self.findings = {}
+        self.total = 0
+
+
+def get_threshold():
+    return getattr(settings, 'QUERY_DETECTOR_THRESHOLD', 5)
+
+
+# текст SQL одного queryset повторяется, отпечаток вычисляется для него один раз
+@functools.lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """
+    Форма запроса: списки параметров свернуты, числа в тексте запроса (LIMIT, OFFSET) заменены на N
+    """
+    shape = _VALUES.sub(r'\1', _IN_LIST.sub('(...)', sql))
+    shape = _NUMBER.sub('N', shape)
+    return hashlib.sha1(shape.encode('utf-8')).hexdigest()[:16], shape
+
+
+def _serializer_field(frame):
+    # ближайший Serializer.to_representation в стеке: поле, значение которого получалось при запросе
+    while frame is not None:
+        if frame.f_code.co_name == 'to_representation':
+            serializer, field = frame.f_locals.get('self'), frame.f_locals.get('field')
+            if isinstance(serializer, BaseSerializer) and field is not None:
+                return f'{type(serializer).__name__}.{field.field_name}'
+        frame = frame.f_back
+    return None
+
+
+def _project_stack(frame):
+    base_dir = str(settings.BASE_DIR) + os.sep
+    stack = []
+    for summary in traceback.extract_stack(frame):
+        if summary.filename.startswith(base_dir) and summary.filename not in _SKIPPED_FILES:
+            stack.append(f'{os.path.relpath(summary.filename, base_dir)}:{summary.lineno} '
+                         f'in {summary.name}: {summary.line}')
+    return stack
+
+
+def record_query(execute, sql, params, many, context):
+    queries = _current.get()
+    if queries is not None:
+        key, shape = fingerprint(sql)
+        count = queries.counts[key] = queries.counts.get(key, 0) + 1
+        queries.total += 1
+        if count == get_threshold():
+            frame = sys._getframe(1)
+            queries.sql[key] = shape
+            queries.findings[key] = {'serializer_field': _serializer_field(frame), 'stack': _project_stack(frame)}
+    return execute(sql, params, many, context)
+
+
+def install_query_detector(connection):
+    connection.execute_wrappers.append(record_query)
+
+
+def is_sampled(request):
+    if not request.path.startswith(getattr(settings, 'REQUEST_METRICS_PREFIX', '/api/v1/')):
+        return False
+    rate = getattr(settings, 'QUERY_DETECTOR_SAMPLE_RATE', 0)
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def get_reports(request, queries):
+    match = getattr(request, 'resolver_match', None)
+    reports = []
+    for key, finding in queries.findings.items():
+        reports.append({
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'method': request.method,
+            'path': request.path,
+            'route': match.route if match is not None else None,
+            'view': match._func_path if match is not None else None,
+            'fingerprint': key,
+            'sql': queries.sql[key],
+            'count': queries.counts[key],
+            'request_queries': queries.total,
+            'serializer_field': finding['serializer_field'],
+            'stack': finding['stack'],
+        })
+    return reports
+
+
+def write_reports(reports):
+    path = getattr(settings, 'QUERY_DETECTOR_REPORT', None)
+    if not reports or not path:
+        return
+    lines = ''.join(ujson.dumps(report, ensure_ascii=False) + '\n' for report in reports)
+    with _report_lock, open(path, 'a', encoding='utf-8') as file:
+        file.write(lines)
+
+
+def _finish(request, queries):
+    if queries.findings:
+        write_reports(get_reports(request, queries))
+
+
+@sync_and_async_middleware
+def query_detector_middleware(get_response):
+    """
+    Собирает отпечатки запросов к базе данных для выборки запросов к API и записывает найденные N+1
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not is_sampled(request):
+                return await get_response(request)
+            queries = RequestQueries()
+            token = _current.set(queries)
+            try:
+                return await get_response(request)
+            finally:
+                _current.reset(token)
+                _finish(request, queries)
+    else:
+        def middleware(request):
+            if not is_sampled(request):
+                return get_response(request)
+            queries = RequestQueries()
+            token = _current.set(queries)
+            try:
+                return get_response(request)
+            finally:
+                _current.reset(token)
+                _finish(request, queries)
+    return middleware
@@ -0,0 +1,145 @@
+import contextlib
+import contextvars
+import hashlib
+import random
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+"""
+Чтение каталога и заказов с реплик.
+ReplicaRouter направляет чтение моделей из REPLICATED_MODELS на одну из баз DATABASE_REPLICAS
+(алиасы из DATABASES, реплика выбирается один раз на HTTP-запрос), запись и все остальные модели (пользователи, токены, задачи, очередь писем) -
+на основную базу. С репликами работают только HTTP-запросы через replica_pin_middleware: фоновые
+обработчики и команды читают основную базу, как и любой код внутри транзакции на основной базе.
+Чтение собственных изменений: после запроса, который записал что-либо в базу, клиент (токен
+или сессия) на REPLICA_PIN_SECONDS секунд закрепляется за основной базой, чтобы корзина и заказы,
+измененные им, не читались с отстающей реплики; в самом запросе чтение после первой записи
+тоже идет на основную базу. Закрепления хранятся в кеше REPLICA_PIN_CACHE_ALIAS, общем для процессов.
+Данные, которые кешируются под версией каталога (cache.cached_catalog, снимки каталога), строятся
+внутри read_from_primary: после сброса кеша отстающая реплика не должна попасть в кеш на все время его жизни.
+Без DATABASE_REPLICAS маршрутизация не меняется
+"""
+
+
+REPLICATED_MODELS = {
+    'service_app.Shop', 'service_app.Category', 'service_app.Goods', 'service_app.ProductInfo',
+    'service_app.Parameter', 'service_app.ProductParameter', 'service_app.ProductFacet', 'service_app.SearchTerm',
+    'service_app.Order', 'service_app.OrderItem', 'service_app.Contact',
+}
+PIN_PREFIX = 'replica:pin:'
+
+# состояние текущего HTTP-запроса: {'replica': реплика запроса, 'pinned': чтение с основной базы,
+# 'written': была запись, 'primary': глубина вложенности read_from_primary}
+_request_state = contextvars.ContextVar('replica_request_state', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def _pin_cache():
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')]
+
+
+def _pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def get_client_key(request):
+    """
+    Ключ закрепления: токен из заголовка Authorization или ключ сессии, None для анонимного клиента
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        return PIN_PREFIX + hashlib.sha256(authorization.encode('utf-8')).hexdigest()[:32]
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return PIN_PREFIX + session.session_key
+    return None
+
+
+def _new_state(pinned):
+    replicas = get_replicas()
+    # одна реплика на запрос: запросы одного ответа не читают реплики с разным отставанием
+    return {'replica': random.choice(replicas) if replicas else None, 'pinned': pinned, 'written': False,
+            'primary': 0}
+
+
+@contextlib.contextmanager
+def read_from_primary():
+    """
+    Чтение с основной базы внутри блока, вне HTTP-запроса ничего не меняет
+    """
+    state = _request_state.get()
+    if state is None:
+        yield
+        return
+    state['primary'] += 1
+    try:
+        yield
+    finally:
+        state['primary'] -= 1
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or state['pinned'] or state['primary'] or model._meta.label not in REPLICATED_MODELS:
+            return None
+        # внутри транзакции на основной базе реплика не видит ее незафиксированных изменений
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return state['replica']
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['pinned'] = state['written'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и основная база
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+@sync_and_async_middleware
+def replica_pin_middleware(get_response):
+    """
+    Включает чтение с реплик на время запроса и закрепляет клиента за основной базой после записи
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not get_replicas():
+                return await get_response(request)
+            key = get_client_key(request)
+            state = _new_state(bool(key) and bool(await _pin_cache().aget(key)))
+            token = _request_state.set(state)
+            try:
+                response = await get_response(request)
+            finally:
+                _request_state.reset(token)
+            if key and state['written']:
+                await _pin_cache().aset(key, 1, timeout=_pin_seconds())
+            return response
+    else:
+        def middleware(request):
+            if not get_replicas():
+                return get_response(request)
+            key = get_client_key(request)
+            state = _new_state(bool(key) and bool(_pin_cache().get(key)))
+            token = _request_state.set(state)
+            try:
+                response = get_response(request)
+            finally:
+                _request_state.reset(token)
+            if key and state['written']:
+                _pin_cache().set(key, 1, timeout=_pin_seconds())
+            return response
+    return middleware
@@ -0,0 +1,163 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+from .basket import recalculate_totals
+from .cache import invalidate_stock
+from .models import Order, OrderItem, ProductInfo
+from .signals import order_status_changed
+from .sqlite import write_transaction
+
+"""
+Резервирование товара при оформлении заказа.
+Остаток уменьшается условным UPDATE ... SET quantity = quantity - n WHERE quantity >= n без предварительного
+чтения и блокировки строки, поэтому параллельные заказы одного товара не могут уйти в минус: из двух
+конкурирующих UPDATE второй видит уже уменьшенный остаток и не изменяет строку.
+Переходы статуса заказа тоже выполняются условным UPDATE и только по ORDER_TRANSITIONS, поэтому повторное
+оформление или отмена не списывают и не возвращают товар дважды, а отправленный заказ не отменяется.
+Новый заказ держит резерв ORDER_RESERVATION_TIMEOUT секунд, после чего release_expired_reservations
+отменяет его и возвращает товар.
+UPDATE в обход save() не обновляет auto_now, поэтому updated_at, по которому поставщики забирают
+измененные заказы, задается явно. Списание и возврат остатков после фиксации транзакции меняют
+версии остатков магазинов заказа (cache.invalidate_stock), а не версию всего каталога
+"""
+
+
+# статусы, в которых товар заказа списан с остатка и возвращается при отмене
+RESERVED_STATUSES = ('new', 'in_progress', 'confirmed')
+# допустимые переходы статуса: только вперед, отмена - только до отправки
+ORDER_TRANSITIONS = {
+    'new': ('in_progress', 'confirmed', 'canceled'),
+    'in_progress': ('confirmed', 'canceled'),
+    'confirmed': ('sent', 'canceled'),
+    'sent': ('done',),
+}
+# статусы, которые покупатель может задать своему заказу
+BUYER_STATUSES = ('canceled',)
+
+
+class OutOfStock(Exception):
+    """
+    Недостаточно товара для оформления заказа, product_info_ids - ИД позиций без нужного остатка
+    """
+
+    def __init__(self, product_info_ids):
+        super().__init__(f'Недостаточно товара: {product_info_ids}')
+        self.product_info_ids = product_info_ids
+
+
+def get_reservation_timeout():
+    return timedelta(seconds=getattr(settings, 'ORDER_RESERVATION_TIMEOUT', 1800))
+
+
+def checkout(order_id, user_id, contact_id=None):
+    """
+    Оформляет корзину как новый заказ и резервирует товар.
+    Вызывает ValueError, если корзина не найдена или пуста, и OutOfStock, если товара не хватает;
+    в обоих случаях корзина и остатки не изменяются
+    """
+    with write_transaction():
+        # первым выполняется запись: корзину забирает только один из параллельных запросов
+        if not Order.objects.filter(id=order_id, user_id=user_id, status='basket').update(status='new'):
+            raise ValueError('Корзина не найдена')
+        # позиции обходятся в порядке ИД товара, чтобы параллельные заказы блокировали строки в одном порядке
+        items = list(OrderItem.objects.filter(order_id=order_id).order_by('product_info_id')
+                     .values_list('product_info_id', 'quantity', 'product_info__shop_id'))
+        if not items:
+            raise ValueError('Корзина пуста')
+        shortage = [product_info_id for product_info_id, quantity, _ in items
+                    if not ProductInfo.objects.filter(id=product_info_id, quantity__gte=quantity)
+                    .update(quantity=F('quantity') - quantity)]
+        if shortage:
+            raise OutOfStock(shortage)
+        # остатки магазинов заказа изменились: их кеш и снимки сбрасываются после фиксации
+        _invalidate_stock_on_commit(shop_id for _, _, shop_id in items)
+        # цены позиций и итоги заказа фиксируются по прайсу на момент оформления
+        OrderItem.objects.filter(order_id=order_id).update(
+            price=Subquery(ProductInfo.objects.filter(id=OuterRef('product_info_id')).values('price')))
+        recalculate_totals(Order.objects.filter(id=order_id))
+        order = Order.objects.get(id=order_id)
+        order.contact_id = contact_id
+        order.reserved_until = timezone.now() + get_reservation_timeout()
+        order.save()
+        order_status_changed.send(sender=Order, order_id=order.id, user_id=order.user_id, status=order.status)
+    return order
+
+
+def _invalidate_stock_on_commit(shop_ids):
+    shop_ids = set(shop_ids)
+    transaction.on_commit(lambda: invalidate_stock(shop_ids))
+
+
+def _return_items(order_id):
+    items = list(OrderItem.objects.filter(order_id=order_id).order_by('product_info_id').values_list(
+        'product_info_id', 'quantity', 'product_info__shop_id'))
+    for product_info_id, quantity, _ in items:
+        ProductInfo.objects.filter(id=product_info_id).update(quantity=F('quantity') + quantity)
+    _invalidate_stock_on_commit(shop_id for _, _, shop_id in items)
+
+
+def _send_canceled(order_id):
+    user_id = Order.objects.filter(id=order_id).values_list('user_id', flat=True).first()
+    order_status_changed.send(sender=Order, order_id=order_id, user_id=user_id, status='canceled')
+
+
+def cancel_order(order_id, user_id=None):
+    """
+    Отменяет заказ в одном из RESERVED_STATUSES и возвращает товар на остаток.
+    Возвращает False, если заказ не найден или уже не может быть отменен
+    """
+    with write_transaction():
+        orders = Order.objects.filter(id=order_id, status__in=RESERVED_STATUSES)
+        if user_id is not None:
+            orders = orders.filter(user_id=user_id)
+        if not orders.update(status='canceled', reserved_until=None, updated_at=timezone.now()):
+            return False
+        _return_items(order_id)
+        _send_canceled(order_id)
+    return True
+
+
+def release_expired_reservations(now=None):
+    """
+    Отменяет новые заказы с истекшим резервом, возвращает количество отмененных заказов
+    """
+    now = now or timezone.now()
+    released = 0
+    for order_id in Order.objects.filter(status='new', reserved_until__lt=now).values_list('id', flat=True):
+        with write_transaction():
+            # заказ мог быть подтвержден между выборкой и отменой
+            if Order.objects.filter(id=order_id, status='new', reserved_until__lt=now).update(
+                    status='canceled', reserved_until=None, updated_at=timezone.now()):
+                _return_items(order_id)
+                _send_canceled(order_id)
+                released += 1
+    return released
+
+
+def set_order_status(order_id, user_id, status, allowed_statuses=BUYER_STATUSES):
+    """
+    Изменение статуса заказа: допускаются только переходы из ORDER_TRANSITIONS в статусы allowed_statuses
+    (покупатель может только отменить заказ), user_id=None - заказ любого пользователя. Отмена возвращает
+    товар, срок резерва снимается, только когда заказ выходит из RESERVED_STATUSES.
+    Вызывает ValueError для недопустимого статуса или перехода и для неизвестного заказа
+    """
+    if status not in allowed_statuses:
+        raise ValueError('Недопустимый статус заказа')
+    if status == 'canceled':
+        if not cancel_order(order_id, user_id):
+            raise ValueError('Заказ не найден или не может быть отменен')
+        return
+    sources = [source for source, targets in ORDER_TRANSITIONS.items() if status in targets]
+    changes = {'status': status, 'updated_at': timezone.now()}
+    if status not in RESERVED_STATUSES:
+        changes['reserved_until'] = None
+    with write_transaction():
+        orders = Order.objects.filter(id=order_id, status__in=sources)
+        if user_id is not None:
+            orders = orders.filter(user_id=user_id)
+        if not orders.update(**changes):
+            raise ValueError('Заказ не найден или статус не может быть изменен')
+        user_id = Order.objects.filter(id=order_id).values_list('user_id', flat=True).first()
+        order_status_changed.send(sender=Order, order_id=order_id, user_id=user_id, status=status)
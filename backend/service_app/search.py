@@ -0,0 +1,111 @@
+import operator
+import re
+from functools import reduce
+from django.db.models import Q, Sum, Max, Case, When, Value
+from .models import ProductInfo, ProductParameter, SearchTerm
+
+"""
+Полнотекстовый поиск предложений по названию товара, модели и значениям параметров.
+Индекс SearchTerm - обратный индекс (слово, предложение, вес) в обычной таблице, поэтому работает
+на любой поддерживаемой базе данных. Слова запроса, кроме последнего, ищутся точно, последнее - по префиксу
+(диапазон term >= префикс AND term < префикс + '\uffff' читается по уникальному индексу (term, product_info)).
+В результат попадают предложения, содержащие все слова запроса, упорядоченные по сумме весов полей,
+в которых слова встретились: название товара, затем модель, затем значения параметров.
+refresh_search_index перестраивает индекс для измененных при импорте предложений
+"""
+
+
+NAME_WEIGHT = 3
+MODEL_WEIGHT = 2
+PARAMETER_WEIGHT = 1
+SEARCH_CHUNK_SIZE = 500
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+MAX_QUERY_TERMS = 8
+CANDIDATE_LIMIT = 1000
+MIN_PREFIX_LENGTH = 2
+TERM_MAX_LENGTH = 64
+PREFIX_END = '\uffff'
+
+_word = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [word[:TERM_MAX_LENGTH] for word in _word.findall(str(text).lower().replace('ё', 'е'))]
+
+
+def _add_terms(terms, product_info_id, text, weight):
+    for term in tokenize(text):
+        key = (product_info_id, term)
+        if terms.get(key, 0) < weight:
+            terms[key] = weight
+
+
+def refresh_search_index(product_info_ids):
+    product_info_ids = list(product_info_ids)
+    for start in range(0, len(product_info_ids), SEARCH_CHUNK_SIZE):
+        chunk = product_info_ids[start:start + SEARCH_CHUNK_SIZE]
+        SearchTerm.objects.filter(product_info_id__in=chunk).delete()
+        terms = {}
+        for product_info_id, name, model in ProductInfo.objects.filter(id__in=chunk).values_list(
+                'id', 'product__name', 'model'):
+            _add_terms(terms, product_info_id, name, NAME_WEIGHT)
+            _add_terms(terms, product_info_id, model, MODEL_WEIGHT)
+        for product_info_id, value in ProductParameter.objects.filter(product_info_id__in=chunk).values_list(
+                'product_info_id', 'value'):
+            _add_terms(terms, product_info_id, value, PARAMETER_WEIGHT)
+        SearchTerm.objects.bulk_create([SearchTerm(term=term, product_info_id=product_info_id, weight=weight)
+                                        for (product_info_id, term), weight in terms.items()])
+
+
+def rebuild_search_index():
+    product_info_ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+    SearchTerm.objects.exclude(product_info_id__in=ProductInfo.objects.values('id')).delete()
+    refresh_search_index(product_info_ids)
+    return len(product_info_ids)
+
+
+# кандидаты отбираются по каждому слову запроса отдельно, не более CANDIDATE_LIMIT на слово:
+# точный список для редкого слова сразу сужает ранжирование до нескольких предложений, а частые слова
+# (например, "смартфон") не заставляют группировать весь индекс. Фильтры магазина и категории применяются
+# до ограничения, иначе лимит могли бы занять предложения других магазинов; distinct нужен для префикса,
+# который совпадает с несколькими словами одного предложения
+def _candidates(conditions, scope):
+    complete, partial = [], []
+    for condition in conditions:
+        found = set(SearchTerm.objects.filter(condition, scope).values_list('product_info_id', flat=True)
+                    .distinct()[:CANDIDATE_LIMIT + 1])
+        (complete if len(found) <= CANDIDATE_LIMIT else partial).append(found)
+    if complete:
+        return set.intersection(*complete)
+    return min(partial, key=len)
+
+
+def search_product_infos(query, limit=SEARCH_LIMIT, shop_id=None, category_id=None):
+    """
+    Возвращает список пар (ИД информации о продукте, вес) для активных магазинов, лучшие совпадения первыми.
+    Если все слова запроса встречаются чаще CANDIDATE_LIMIT раз, ранжируются первые CANDIDATE_LIMIT кандидатов
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+    conditions = [Q(term=term) for term in terms[:-1]]
+    if len(terms[-1]) >= MIN_PREFIX_LENGTH:
+        conditions.append(Q(term__gte=terms[-1], term__lt=terms[-1] + PREFIX_END))
+    else:
+        conditions.append(Q(term=terms[-1]))
+    scope = Q(product_info__shop__status=True)
+    if shop_id is not None:
+        scope &= Q(product_info__shop_id=shop_id)
+    if category_id is not None:
+        scope &= Q(product_info__product__category_id=category_id)
+    candidates = _candidates(conditions, scope)
+    if not candidates:
+        return []
+    matches = {f'match_{position}': Max(Case(When(condition, then=Value(1)), default=Value(0)))
+               for position, condition in enumerate(conditions)}
+
+    found = SearchTerm.objects.filter(reduce(operator.or_, conditions), scope, product_info_id__in=candidates)
+    found = found.values('product_info_id').annotate(score=Sum('weight'), **matches).filter(
+        **{name: 1 for name in matches}).order_by('-score', 'product_info_id')
+    return list(found.values_list('product_info_id', 'score')[:limit])
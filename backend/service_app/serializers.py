@@ -1,10 +1,41 @@
 from rest_framework import serializers
 from .models import (User, Contact, Shop, Category, Goods, ProductInfo,
-                     ProductParameter, OrderItem, Order)
+                     ProductParameter, OrderItem, Order, ImportJob)
 from django.contrib.auth.password_validation import validate_password
+from .metrics import serialization
 
 
-class ContactSerializer(serializers.ModelSerializer):
+class TimedListSerializer(serializers.ListSerializer):
+    """
+    Список для many=True: время получения data учитывается в метриках запроса как сериализация
+    """
+
+    @property
+    def data(self):
+        with serialization():
+            return super().data
+
+
+class TimedModelSerializer(serializers.ModelSerializer):
+    """
+    Базовый сериализатор ответов API: время получения data учитывается в метриках запроса
+    (service_app.metrics) как сериализация, для many=True - через TimedListSerializer,
+    если в Meta не указан другой list_serializer_class
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = cls.__dict__.get('Meta')
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        with serialization():
+            return super().data
+
+
+class ContactSerializer(TimedModelSerializer):
     class Meta:
         model = Contact
         fields = ('id', 'city', 'street', 'house', 'structure', 'building', 'apartment', 'phone')
@@ -18,7 +49,7 @@ class ContactSerializer(serializers.ModelSerializer):
         return data
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedModelSerializer):
     contacts = ContactSerializer(read_only=True, many=True)
 
     def validate_email(self, value):
@@ -59,21 +90,21 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', )
 
 
-class ShopSerializer(serializers.ModelSerializer):
+class ShopSerializer(TimedModelSerializer):
     class Meta:
         model = Shop
         fields = ('id', 'name', 'url', 'status')
         read_only_fields = ('id',)
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedModelSerializer):
     class Meta:
         model = Category
         fields = ('id', 'name')
         read_only_fields = ('id',)
 
 
-class GoodsSerializer(serializers.ModelSerializer):
+class GoodsSerializer(TimedModelSerializer):
     category = serializers.StringRelatedField()
 
     class Meta:
@@ -89,21 +120,21 @@ class ProductParameterSerializer(serializers.ModelSerializer):
         fields = ('parameter', 'value')
 
 
-class ProductInfoSerializer(serializers.ModelSerializer):
+class ProductInfoSerializer(TimedModelSerializer):
     product = GoodsSerializer(read_only=True)
-    product_parameter = ProductParameterSerializer(read_only=True, many=True)
+    product_parameters = ProductParameterSerializer(read_only=True, many=True)
 
     class Meta:
         model = ProductInfo
-        fields = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc', 'product_parameter')
+        fields = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc', 'product_parameters')
         read_only_fields = ('id',)
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
-        fields = ('id', 'order', 'product_info', 'quantity')
-        read_only_fields = ('id',)
+        fields = ('id', 'order', 'product_info', 'quantity', 'price')
+        read_only_fields = ('id', 'price')
         extra_kwargs = {
             'order': {'write_only': True}
         }
@@ -113,23 +144,39 @@ class OrderItemCreateSerializer(OrderItemSerializer):
     product_info = ProductInfoSerializer(read_only=True)
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedModelSerializer):
     ordered_items = OrderItemCreateSerializer(read_only=True, many=True)
 
-    total_sum = serializers.IntegerField()
     contact = ContactSerializer(read_only=True)
 
     class Meta:
         model = Order
-        fields = ('id', 'user', 'dt', 'status', 'contact', 'ordered_items', 'total_sum')
-        read_only_fields = ('id',)
+        fields = ('id', 'user', 'dt', 'status', 'contact', 'ordered_items', 'total_sum', 'items_count')
+        read_only_fields = ('id', 'total_sum', 'items_count')
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
 
-        total_sum = 0
-        for item in instance.ordered_items.all():
-            total_sum += item.quantity * item.product_info.price
+class OrderSummarySerializer(TimedModelSerializer):
+    class Meta:
+        model = Order
+        fields = ('id', 'dt', 'status', 'total_sum', 'items_count')
+        read_only_fields = fields
+
 
-        representation['total_sum'] = total_sum
-        return representation
+class SupplierOrderSerializer(OrderSerializer):
+    """
+    Заказ в ленте поставщика: ordered_items содержит только позиции его магазинов,
+    shop_total - их сумма по зафиксированным ценам (считается в fast_serializers.order_rows)
+    """
+    shop_total = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ('id', 'user', 'dt', 'updated_at', 'status', 'contact', 'ordered_items', 'shop_total')
+        read_only_fields = fields
+
+
+class ImportJobSerializer(TimedModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'url', 'status', 'processed', 'stats', 'error', 'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
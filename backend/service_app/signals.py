@@ -1,20 +1,31 @@
 # from django.core.mail import EmailMultiAlternatives
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver, Signal
+from rest_framework.authtoken.models import Token
+from .authentication import invalidate_token, invalidate_user_tokens
+from .cache import catalog_invalidated, stock_invalidated
 from .models import User, ConfirmEmailUser, Order
-from django.core.mail import send_mail
-from django.conf import settings
+from .metrics import install_query_recorder
+from .query_detector import install_query_detector
+from .outbox import queue_email
+from .snapshots import schedule_rebuild, schedule_stock_rebuild
 from typing import Type
-from django.utils import timezone
 
 new_user_registered = Signal()
 
 new_order = Signal()
 
+# статус заказа изменен условным UPDATE в обход save(), аргументы order_id, user_id, status
+order_status_changed = Signal()
+
 """
-Ниже представлены два сигнала: send_activation_email(при регистрации нового пользователя отправляет письмо 
-для подтверждения почты на email пользователя) и send_new_order_email(при создании нового заказа отправляет письмо
-с информацией о заказе и его статусе)
+Ниже представлены два сигнала: send_activation_email(при регистрации нового пользователя отправляет письмо
+для подтверждения почты на email пользователя) и send_new_order_email(при изменении статуса заказа отправляет письмо
+с информацией о заказе и его статусе).
+Письма не отправляются в обработчике сигнала, а записываются в очередь outbox в той же транзакции
+и отправляются в фоне после ее фиксации
 """
 
 
@@ -22,24 +33,78 @@ new_order = Signal()
 def send_activation_email(sender: Type[User], instance: User, created: bool, **kwargs):
     if created and not instance.is_active:
         token = ConfirmEmailUser.object.get_or_create(user_id=instance.pk)
-        from_email = settings.EMAIL_HOST_USER
-        msg = (f'Для подтверждения регистрации перейдите по ссылке: '
+        msg = (f'Для подтверждения регистрации перейдите по ссылке: '
                f'http://127.0.0.1:8000/api/v1/user/register/confirm/?email={instance.email}&token={token[0].key_token}')
-        send_mail('Подтверждение регистрации', msg, from_email, [instance.email], fail_silently=False)
-        print(token[0].key_token)
+        queue_email('Подтверждение регистрации', msg, [instance.email])
 
 
 STATUS_MESSAGES = {
     'new': 'Ваш заказ сформирован.',
     'in_progress': 'Ваш заказ в процессе подтверждения.',
     'sent': 'Ваш заказ отправлен.',
-    'done': 'Ваш заказ доставлен.'
+    'done': 'Ваш заказ доставлен.',
+    'canceled': 'Ваш заказ отменен.',
 }
 
+
+def queue_order_status_email(user_id, status):
+    if status in STATUS_MESSAGES:
+        email = User.objects.filter(id=user_id).values_list('email', flat=True).first()
+        if email:
+            queue_email(f'Заказ {status.capitalize()}', STATUS_MESSAGES[status], [email])
+
+
+# статус, с которым заказ загружен из базы данных, чтобы письмо отправлялось только при его изменении;
+# отложенное поле status (only/defer) не читается, чтобы не выполнять запрос на каждый объект
+@receiver(post_init, sender=Order)
+def remember_order_status(sender: Type[Order], instance: Order, **kwargs):
+    instance._saved_status = instance.__dict__.get('status') if instance.pk else None
+
+
 @receiver(post_save, sender=Order)
-def send_new_order_email(sender: Type[Order], instance: Order, **kwargs):
-    if instance.dt.date() == timezone.now().date() and instance.status in STATUS_MESSAGES:
-        from_email = settings.EMAIL_HOST_USER
-        msg = STATUS_MESSAGES[instance.status]
-        subject = f'Заказ {instance.status.capitalize()}'
-        send_mail(subject, msg, from_email, [instance.user.email], fail_silently=False)
\ No newline at end of file
+def send_new_order_email(sender: Type[Order], instance: Order, created: bool, **kwargs):
+    status = instance.__dict__.get('status')
+    if status is not None and (created or status != instance._saved_status):
+        queue_order_status_email(instance.user_id, status)
+    instance._saved_status = status
+
+
+@receiver(order_status_changed)
+def send_order_status_email(sender, order_id, user_id, status, **kwargs):
+    queue_order_status_email(user_id, status)
+
+
+# кеш аутентификации сбрасывается при выходе и любом изменении пользователя
+@receiver(post_save, sender=User)
+def invalidate_user_auth_cache(sender: Type[User], instance: User, created: bool, **kwargs):
+    if not created:
+        invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_auth_cache(sender: Type[Token], instance: Token, **kwargs):
+    invalidate_token(instance.key)
+
+
+# счетчик запросов к базе данных для метрик API (service_app.metrics)
+@receiver(connection_created)
+def install_request_metrics(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+
+# отпечатки запросов для поиска N+1 (service_app.query_detector)
+@receiver(connection_created)
+def install_n_plus_one_detector(sender, connection, **kwargs):
+    install_query_detector(connection)
+
+
+# снимки каталога (service_app.snapshots) перестраиваются после фиксации транзакции, изменившей каталог
+@receiver(catalog_invalidated)
+def rebuild_catalog_snapshots(sender, **kwargs):
+    transaction.on_commit(schedule_rebuild)
+
+
+# после изменения остатков перестраиваются только снимки с остатками этих магазинов
+@receiver(stock_invalidated)
+def rebuild_stock_snapshots(sender, shop_ids, **kwargs):
+    transaction.on_commit(lambda: schedule_stock_rebuild(shop_ids))
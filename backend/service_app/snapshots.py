@@ -0,0 +1,311 @@
+import gzip
+import hashlib
+import logging
+import threading
+import time
+import ujson
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.utils import timezone
+from .cache import cached_catalog, get_catalog_version, get_stock_version
+from .models import CatalogSnapshot, ProductInfo, Shop, Category
+from .replicas import read_from_primary
+from .fast_serializers import product_info_values, product_info_rows
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+"""
+Снимки каталога для мобильных клиентов.
+Снимок - все предложения активных магазинов (по магазину и/или категории) в формате ProductInfoSerializer,
+заранее отрендеренные в JSON и сжатые gzip и brotli (если установлен пакет brotli).
+Версия области - версия каталога и версия остатков ее магазина (для областей всех магазинов - общая).
+Снимки перестраиваются не в запросе, а после изменения версии: сигнал catalog_invalidated (импорт, смена
+статуса магазина) планирует перестроение всех известных областей, stock_invalidated (оформление и отмена
+заказа) - только областей затронутых магазинов и областей всех магазинов. Перестроение выполняется
+в фоновом потоке (CATALOG_SNAPSHOT_WORKERS, при 0 - в текущем потоке) не раньше чем через
+CATALOG_SNAPSHOT_DEBOUNCE секунд после первого сигнала, все сигналы за это время дают одно перестроение.
+Готовый снимок хранится в кеше каталога и в памяти процесса, поэтому ответ, в том числе 304 на условный
+запрос, не выполняет запросов к базе данных и ничего в нее не записывает. Пока снимок перестраивается,
+отдается предыдущий; снимок новой области в первый раз строится в запросе без записи в базу данных.
+Версия снимка - хеш его содержимого: импорт, не изменивший предложения, не меняет ETag.
+Хеши строк последних SNAPSHOT_HISTORY версий хранятся в CatalogSnapshot, по ним строится дельта:
+измененные и новые предложения и ИД удаленных относительно версии, которая уже есть у клиента
+"""
+
+
+SNAPSHOT_HISTORY = 20
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+ENCODINGS = ('br', 'gzip')
+
+logger = logging.getLogger(__name__)
+
+_local = {}
+_pending = set()
+_pending_lock = threading.Lock()
+_executor = None
+# перестроение всех известных областей, STOCK_SCOPES + ИД магазина - областей с остатками магазина
+ALL_SCOPES = '*'
+STOCK_SCOPES = 'stock:'
+
+
+def get_scope(shop_id=None, category_id=None):
+    return f'{shop_id or "*"}:{category_id or "*"}'
+
+
+def parse_scope(scope):
+    return tuple(None if value == '*' else int(value) for value in scope.split(':'))
+
+
+def get_scope_version(scope):
+    return f'{get_catalog_version()}:{get_stock_version(parse_scope(scope)[0])}'
+
+
+def _cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_SNAPSHOT_TIMEOUT', 86400)
+
+
+def get_scope_ids():
+    """
+    ИД магазинов и категорий, для которых строятся снимки, чтобы несуществующие ИД не создавали снимков
+    """
+    return cached_catalog('snapshot_scope_ids', lambda: (
+        set(Shop.objects.values_list('id', flat=True)), set(Category.objects.values_list('id', flat=True))))
+
+
+def _dumps(data):
+    return ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False)
+
+
+def _compress(body):
+    # mtime=0: одинаковое содержимое дает одинаковые байты и одинаковый ETag во всех процессах
+    bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return bodies
+
+
+def _record(scope, digest, rows):
+    latest = CatalogSnapshot.objects.filter(scope=scope).only('id', 'digest', 'created_at').first()
+    if latest is not None and latest.digest == digest:
+        snapshot = latest
+    else:
+        # содержимое могло вернуться к одной из прошлых версий, она снова становится новейшей,
+        # чтобы Last-Modified не уменьшился
+        snapshot, created = CatalogSnapshot.objects.get_or_create(scope=scope, digest=digest,
+                                                                  defaults={'rows': rows})
+        if not created:
+            snapshot.created_at = timezone.now()
+            snapshot.save(update_fields=['created_at'])
+    history = list(CatalogSnapshot.objects.filter(scope=scope).values_list('id', 'digest'))
+    if len(history) > SNAPSHOT_HISTORY:
+        CatalogSnapshot.objects.filter(id__in=[row[0] for row in history[SNAPSHOT_HISTORY:]]).delete()
+    return snapshot, [row[1] for row in history[:SNAPSHOT_HISTORY]]
+
+
+def build_snapshot(shop_id=None, category_id=None):
+    """
+    Строит снимок области по текущим данным, в базу данных ничего не записывает
+    """
+    version = get_scope_version(get_scope(shop_id, category_id))
+    queryset = ProductInfo.objects.filter(shop__status=True)
+    if shop_id:
+        queryset = queryset.filter(shop_id=shop_id)
+    if category_id:
+        queryset = queryset.filter(product__category_id=category_id)
+    rows, rendered = {}, []
+    for row in product_info_rows(list(product_info_values(queryset.order_by('id')))):
+        text = _dumps(row)
+        rows[str(row['id'])] = hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+        rendered.append(text)
+    rows_json = '[' + ','.join(rendered) + ']'
+    digest = hashlib.sha256(rows_json.encode('utf-8')).hexdigest()[:32]
+    body = f'{{"Status":true,"version":"{digest}","delta":false,"ProductInfo":{rows_json}}}'.encode('utf-8')
+    return {'version': version, 'digest': digest, 'rows': rows, 'bodies': _compress(body)}
+
+
+def rebuild_snapshot(scope):
+    """
+    Строит снимок области, записывает его версию в CatalogSnapshot и сохраняет снимок в кеше каталога
+    """
+    snapshot = build_snapshot(*parse_scope(scope))
+    record, history = _record(scope, snapshot['digest'], snapshot['rows'])
+    snapshot.update(last_modified=record.created_at, history=history)
+    _cache().set_many({f'catalog_snapshot:{scope}': snapshot,
+                       f'catalog_snapshot_build:{scope}': (snapshot['version'], snapshot['digest'])},
+                      timeout=_timeout())
+    _local[scope] = snapshot
+    return snapshot
+
+
+def get_known_scopes():
+    return set(CatalogSnapshot.objects.order_by().values_list('scope', flat=True).distinct()) | {get_scope()}
+
+
+def rebuild_snapshots(scopes=None):
+    scopes = get_known_scopes() if scopes is None else scopes
+    for scope in scopes:
+        rebuild_snapshot(scope)
+    return len(scopes)
+
+
+def _get_target_scopes(target):
+    if target == ALL_SCOPES:
+        return get_known_scopes()
+    if target.startswith(STOCK_SCOPES):
+        shop_id = int(target[len(STOCK_SCOPES):])
+        return {scope for scope in get_known_scopes() if parse_scope(scope)[0] in (None, shop_id)}
+    return {target}
+
+
+def _rebuild_target(target):
+    # снимок области мог уже перестроить другой процесс или предыдущее перестроение
+    for scope in sorted(_get_target_scopes(target)):
+        if _cache().get(f'catalog_snapshot_build:{scope}', (None,))[0] != get_scope_version(scope):
+            rebuild_snapshot(scope)
+
+
+def _rebuild_in_worker(target, due):
+    # сигналы, пришедшие до начала перестроения, не планируют его повторно и учитываются в нем
+    delay = due - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+    with _pending_lock:
+        _pending.discard(target)
+    # у потока пула свое соединение с базой данных
+    close_old_connections()
+    try:
+        _rebuild_target(target)
+    except Exception:
+        logger.exception('Не удалось перестроить снимки каталога %s', target)
+    finally:
+        close_old_connections()
+
+
+def schedule_rebuild(target=ALL_SCOPES):
+    """
+    Планирует перестроение устаревших снимков области или группы областей target (по умолчанию всех
+    известных) в фоновом потоке через CATALOG_SNAPSHOT_DEBOUNCE секунд, при CATALOG_SNAPSHOT_WORKERS = 0 -
+    перестраивает в текущем потоке. Уже запланированное, но еще не начатое перестроение повторно не планируется
+    """
+    if not getattr(settings, 'CATALOG_SNAPSHOT_WORKERS', 1):
+        _rebuild_target(target)
+        return
+    global _executor
+    with _pending_lock:
+        if target in _pending:
+            return
+        _pending.add(target)
+        if _executor is None:
+            # один поток: снимки строятся по очереди, и одна область не строится дважды одновременно
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshots')
+    due = time.monotonic() + getattr(settings, 'CATALOG_SNAPSHOT_DEBOUNCE', 2)
+    _executor.submit(_rebuild_in_worker, target, due)
+
+
+def schedule_stock_rebuild(shop_ids):
+    for shop_id in shop_ids:
+        schedule_rebuild(f'{STOCK_SCOPES}{shop_id}')
+
+
+def wait_for_rebuilds():
+    """
+    Ждет завершения перестроений, запланированных до вызова: поток пула один и выполняет задачи по очереди
+    """
+    with _pending_lock:
+        executor = _executor
+    if executor is not None:
+        executor.submit(lambda: None).result()
+
+
+def _build_in_request(scope):
+    # снимок новой области строится без записи в базу данных, запись выполнит запланированное перестроение;
+    # снимок хранится до следующего изменения каталога, поэтому читается основная база
+    with read_from_primary():
+        snapshot = build_snapshot(*parse_scope(scope))
+    history = list(CatalogSnapshot.objects.filter(scope=scope).values_list('digest', 'created_at')
+                   [:SNAPSHOT_HISTORY])
+    snapshot['history'] = [digest for digest, _ in history]
+    snapshot['last_modified'] = next((created_at for digest, created_at in history
+                                      if digest == snapshot['digest']), timezone.now())
+    return snapshot
+
+
+def get_snapshot(shop_id=None, category_id=None):
+    scope = get_scope(shop_id, category_id)
+    version = get_scope_version(scope)
+    snapshot = _local.get(scope)
+    if snapshot is None or snapshot['version'] != version:
+        # в общем кеше может быть снимок, построенный другим процессом
+        build = _cache().get(f'catalog_snapshot_build:{scope}')
+        if build is not None and (snapshot is None or build != (snapshot['version'], snapshot['digest'])):
+            snapshot = _cache().get(f'catalog_snapshot:{scope}') or snapshot
+        # запрос сам снимок не перестраивает: при CATALOG_SNAPSHOT_WORKERS = 0 снимки перестраиваются
+        # при изменении версии каталога
+        if (snapshot is None or snapshot['version'] != version) and getattr(settings, 'CATALOG_SNAPSHOT_WORKERS', 1):
+            schedule_rebuild(scope)
+        if snapshot is None:
+            snapshot = _build_in_request(scope)
+        _local[scope] = snapshot
+    return snapshot
+
+
+def build_delta(snapshot, scope, since):
+    old = CatalogSnapshot.objects.filter(scope=scope, digest=since).values_list('rows', flat=True).first()
+    if old is None:
+        return None
+    current = snapshot['rows']
+    changed = {row_id for row_id, row_hash in current.items() if old.get(row_id) != row_hash}
+    rows = [row for row in ujson.loads(snapshot['bodies']['identity'])['ProductInfo'] if str(row['id']) in changed]
+    deleted = sorted(int(row_id) for row_id in old if row_id not in current)
+    body = _dumps({'Status': True, 'version': snapshot['digest'], 'since': since, 'delta': True,
+                   'ProductInfo': rows, 'deleted': deleted}).encode('utf-8')
+    return {'digest': snapshot['digest'], 'last_modified': snapshot['last_modified'], 'bodies': _compress(body)}
+
+
+def get_delta(snapshot, shop_id, category_id, since):
+    """
+    Дельта от версии since до текущей версии снимка, None - если версия since неизвестна или устарела
+    """
+    if since not in snapshot['history'] or since == snapshot['digest']:
+        return None
+    scope = get_scope(shop_id, category_id)
+    return cached_catalog(f'snapshot_delta:{scope}:{since}:{snapshot["digest"]}',
+                          lambda: build_delta(snapshot, scope, since), timeout=_timeout())
+
+
+def choose_encoding(accept_encoding, bodies):
+    """
+    Сжатие ответа по Accept-Encoding: из ENCODINGS выбирается кодирование с наибольшим q (при равном q -
+    в порядке ENCODINGS), q=0 запрещает кодирование, * задает q для не указанных явно. Без подходящего
+    кодирования или если identity указан с большим q, ответ не сжимается
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, *params = [value.strip() for value in part.split(';')]
+        if not name:
+            continue
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.lower()] = weight
+    candidates = [(weights.get(encoding, weights.get('*', 0.0)), -position, encoding)
+                  for position, encoding in enumerate(ENCODINGS) if encoding in bodies]
+    weight, _, encoding = max(candidates, default=(0.0, 0, 'identity'))
+    if weight <= 0 or weight < weights.get('identity', 0.0):
+        return 'identity'
+    return encoding
@@ -0,0 +1,81 @@
+import contextlib
+import threading
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+"""
+Профиль SQLite для работы под нагрузкой.
+Настройки соединения задаются в DATABASES['default']['OPTIONS']: init_command выполняет PRAGMA для каждого
+нового соединения: WAL - чтение не блокируется записью и не ждет фиксации импорта, synchronous=NORMAL - fsync
+только при checkpoint (в режиме WAL база не повреждается при сбое, при отключении питания могут потеряться
+последние транзакции), mmap_size и cache_size - страницы читаются из отображенного в память файла и кеша
+соединения; timeout - ожидание блокировки записи вместо немедленной ошибки database is locked.
+Запись выполняется одним писателем: транзакции начинаются с BEGIN IMMEDIATE (transaction_mode), поэтому
+транзакция, которая сначала читает, а потом пишет, не получает ошибку при повышении блокировки, а ждет timeout.
+write_transaction дополнительно выстраивает писателей одного процесса в очередь на блокировке
+(SQLITE_WRITE_QUEUE): поток ждет освобождения блокировки, а не просыпается по таймеру busy handler SQLite.
+Длинный импорт записывает пакеты в отдельных транзакциях write_transaction, и между пакетами блокировку
+получают запросы покупателей. Для других баз данных write_transaction - обычный transaction.atomic
+"""
+
+
+_write_locks = {}
+_write_locks_lock = threading.Lock()
+
+
+class WriteQueue:
+    """
+    Очередь писателей: блокировку получают в порядке обращения. threading.Lock не гарантирует порядок,
+    и импорт, который сразу начинает следующий пакет, снова получал бы блокировку раньше ждущих запросов
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+
+    def __enter__(self):
+        with self._condition:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._condition.wait_for(lambda: self._serving == ticket)
+
+    def __exit__(self, *exc_info):
+        with self._condition:
+            self._serving += 1
+            self._condition.notify_all()
+
+
+def _get_write_lock(using):
+    with _write_locks_lock:
+        return _write_locks.setdefault(using, WriteQueue())
+
+
+@contextlib.contextmanager
+def write_transaction(using=None):
+    """
+    transaction.atomic для записи: в SQLite транзакции одного процесса выполняются по очереди.
+    Вложенный блок (внутри уже открытой транзакции) очередь не ждет - блокировка записи у транзакции уже есть
+    """
+    using = using or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    if (connection.vendor != 'sqlite' or connection.in_atomic_block
+            or not getattr(settings, 'SQLITE_WRITE_QUEUE', True)):
+        with transaction.atomic(using=using):
+            yield
+        return
+    with _get_write_lock(using), transaction.atomic(using=using):
+        yield
+
+
+def checkpoint(using=None):
+    """
+    Переносит журнал WAL в файл базы и обрезает его, после длинного импорта журнал
+    не растет дальше и чтение не просматривает его. Для других баз данных ничего не делает
+    """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return cursor.fetchone()
@@ -1,3 +1,1396 @@
-from django.test import TestCase
+import base64
+import contextlib
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import yaml
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import caches
+from django.db import DatabaseError, connection, connections, transaction
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from asgiref.sync import async_to_sync
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APITestCase, APITransactionTestCase
+from .async_views import AsyncBasketView, AsyncOrderView, AsyncProductInfoFiltersView, AsyncShopStatus
+from .authentication import (_local as local_token_cache, CachedTokenAuthentication, clear_token_cache,
+                             invalidate_token)
+from .cache import get_catalog_version, get_stock_version, invalidate_catalog, invalidate_stock
+from .importer import PriceListImporter, resolve_products, _select_products
+from .feeds import STREAMED_KEYS, iter_feed_sections
+from .jobs import claim_next_job, enqueue_import, requeue_stale_jobs, run_import_job
+from .metrics import _current as current_metrics, RequestMetrics, reset_metrics
+from .models import (User, Shop, Category, Goods, ProductInfo, Parameter, ProductParameter, Order, OrderItem,
+                     ImportJob, OutgoingEmail)
+from .query_detector import fingerprint, query_detector_middleware
+from .outbox import MAX_ATTEMPTS, queue_email, requeue_stale_emails, send_pending_emails
+from .replicas import ReplicaRouter, read_from_primary, replica_pin_middleware
+from .reservations import OutOfStock, checkout, set_order_status
+from .search import rebuild_search_index
+from .serializers import ProductInfoSerializer, ShopSerializer, SupplierOrderSerializer, TimedListSerializer
+from .signals import order_status_changed
+from .snapshots import get_scope, rebuild_snapshot, rebuild_snapshots, schedule_rebuild, wait_for_rebuilds
 
-# Create your tests here.
+"""
+Тесты потокового разбора и импорта прайс-листа, очередей задач импорта и писем, кеша аутентификации, поиска,
+совпадения ответов async views с синхронными, чтения с реплик, метрик запросов, поиска N+1 запросов,
+курсорной пагинации, резервирования товара, статусов и истории заказов, ленты поставщика, корзины, кеша
+и снимков каталога.
+Кеши каталога и аутентификации в тестах - в памяти процесса, а не общие файловые кеши, письма и снимки каталога
+обрабатываются в потоке теста
+"""
+
+
+TEST_SETTINGS = {
+    'CACHES': {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+        'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests_catalog'},
+        'auth': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests_auth'},
+    },
+    'CATALOG_SNAPSHOT_WORKERS': 0,
+    'EMAIL_OUTBOX_WORKERS': 0,
+}
+
+
+def create_user(name, type_of_user='buyer'):
+    return User.objects.create(email=f'{name}@example.com', username=name, type_of_user=type_of_user,
+                               is_active=True)
+
+
+def create_shop(name):
+    return Shop.objects.create(name=name, url=f'http://example.com/{name}', user=create_user(name, 'shop'))
+
+
+def create_product_info(shop, category, external_id, price=100, quantity=10):
+    product = Goods.objects.create(name=f'Товар {external_id}', category=category)
+    return ProductInfo.objects.create(product=product, shop=shop, external_id=external_id,
+                                      model=f'model/{external_id}', price=price, price_rrc=price, quantity=quantity)
+
+
+class CatalogTestMixin:
+    """
+    Каталог из одного магазина и одной категории; кеш каталога сбрасывается перед каждым тестом,
+    данные прошлых тестов хранятся в кеше под другой версией
+    """
+
+    def setUp(self):
+        super().setUp()
+        invalidate_catalog()
+        self.shop = create_shop('shop')
+        self.category = Category.objects.create(name='Смартфоны')
+        self.category.shops.add(self.shop)
+
+
+@override_settings(**TEST_SETTINGS)
+class PriceListImporterTests(TestCase):
+
+    def setUp(self):
+        self.shop = create_shop('importer')
+        self.goods = [
+            {'id': 1, 'name': 'Смартфон A', 'category': 1, 'model': 'a/1', 'price': 100, 'price_rrc': 120,
+             'quantity': 5, 'parameters': {'Цвет': 'черный'}},
+            {'id': 2, 'name': 'Смартфон B', 'category': 1, 'model': 'b/2', 'price': 200, 'price_rrc': 220,
+             'quantity': 3, 'parameters': {'Цвет': 'белый'}},
+            {'id': 3, 'name': 'Смартфон C', 'category': 1, 'model': 'c/3', 'price': 300, 'price_rrc': 320,
+             'quantity': 1, 'parameters': {}},
+        ]
+
+    def import_price_list(self, goods):
+        importer = PriceListImporter(self.shop, batch_size=2)
+        importer.import_categories([{'id': 1, 'name': 'Смартфоны'}])
+        importer.import_goods(goods)
+        return importer.retire_missing()
+
+    def get_product_info(self, external_id):
+        return ProductInfo.objects.get(shop=self.shop, external_id=external_id)
+
+    def test_first_import_inserts_rows(self):
+        stats = self.import_price_list(self.goods)
+        self.assertEqual(stats, {'inserted': 3, 'updated': 0, 'unchanged': 0, 'retired': 0})
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 3)
+        self.assertEqual(ProductParameter.objects.get(product_info=self.get_product_info(2)).value, 'белый')
+
+    def test_repeated_import_changes_nothing(self):
+        self.import_price_list(self.goods)
+        stats = self.import_price_list(self.goods)
+        self.assertEqual(stats, {'inserted': 0, 'updated': 0, 'unchanged': 3, 'retired': 0})
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 3)
+
+    def test_unchanged_import_writes_nothing(self):
+        self.import_price_list(self.goods)
+        with CaptureQueriesContext(connection) as queries:
+            self.import_price_list(self.goods)
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+                  and ('"service_app_productinfo"' in query['sql'] or '"service_app_productparameter"' in query['sql'])]
+        self.assertEqual(writes, [])
+
+    def test_changed_rows_are_updated(self):
+        self.import_price_list(self.goods)
+        ids = {item['id']: self.get_product_info(item['id']).id for item in self.goods}
+        self.goods[0]['price'] = 150
+        self.goods[1]['parameters'] = {'Цвет': 'синий'}
+        self.goods[2]['parameters'] = {'Память': '128'}
+        stats = self.import_price_list(self.goods)
+        self.assertEqual(stats, {'inserted': 0, 'updated': 3, 'unchanged': 0, 'retired': 0})
+        # строки обновляются на месте, ИД не меняются
+        self.assertEqual({item['id']: self.get_product_info(item['id']).id for item in self.goods}, ids)
+        self.assertEqual(self.get_product_info(1).price, 150)
+        self.assertEqual(ProductParameter.objects.get(product_info_id=ids[2]).value, 'синий')
+        self.assertEqual(ProductParameter.objects.get(product_info_id=ids[3]).value, '128')
+
+    def test_removed_parameters_are_deleted(self):
+        self.import_price_list(self.goods)
+        self.goods[0]['parameters'] = {}
+        stats = self.import_price_list(self.goods)
+        self.assertEqual(stats['updated'], 1)
+        self.assertFalse(ProductParameter.objects.filter(product_info=self.get_product_info(1)).exists())
+
+    def test_missing_rows_are_retired(self):
+        self.import_price_list(self.goods)
+        stats = self.import_price_list(self.goods[:2])
+        self.assertEqual(stats, {'inserted': 0, 'updated': 0, 'unchanged': 2, 'retired': 1})
+        # строка остается для позиций заказов, остаток обнуляется
+        self.assertEqual(self.get_product_info(3).quantity, 0)
+        self.assertEqual(self.get_product_info(1).quantity, 5)
+        self.assertEqual(self.import_price_list(self.goods[:2])['retired'], 0)
+
+    def test_shops_share_goods(self):
+        self.import_price_list(self.goods)
+        self.shop = create_shop('second')
+        self.assertEqual(self.import_price_list(self.goods)['inserted'], 3)
+        self.assertEqual(Goods.objects.count(), 3)
+        self.assertEqual(ProductInfo.objects.count(), 6)
+
+    def test_goods_created_concurrently_are_not_duplicated(self):
+        self.import_price_list(self.goods)
+        product_id = Goods.objects.get(name='Смартфон A').id
+        # товар создан параллельным импортом между выборкой и записью: первая выборка его не видит
+        selected = _select_products({('Смартфон A', 1)})
+        with mock.patch('service_app.importer._select_products', side_effect=[{}, selected]):
+            self.assertEqual(resolve_products(self.goods[:1]), {('Смартфон A', 1): product_id})
+        self.assertEqual(Goods.objects.count(), 3)
+
+    def test_retire_missing_keeps_other_shops(self):
+        other = create_product_info(create_shop('other'), Category.objects.create(name='Другое'), 1)
+        self.import_price_list(self.goods[:1])
+        other.refresh_from_db()
+        self.assertEqual(other.quantity, 10)
+
+
+FEED = """
+- users:
+  - shop: {name: feed, url: http://example.com/feed}
+- categories:
+  - {id: 1, name: Смартфоны}
+- goods:
+  - {id: 1, name: Смартфон A, category: 1, model: a/1, price: 100, price_rrc: 120, quantity: 5}
+  - {id: 2, name: Смартфон B, category: 1, model: b/2, price: 200, price_rrc: 220, quantity: 3}
+"""
+
+
+class FeedResponse:
+    """
+    Ответ requests.get с прайс-листом в потоке raw
+    """
+
+    def __init__(self, content, content_type='application/yaml'):
+        self.raw = io.BytesIO(content.encode())
+        self.headers = {'Content-Type': content_type}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+
+def merge_sections(sections):
+    """
+    Содержимое прайс-листа без разбиения на разделы и пакеты: списки users, categories и goods
+    объединяются, остальные ключи берутся из последнего раздела
+    """
+    if isinstance(sections, dict):
+        sections = [sections]
+    merged = {}
+    for section in sections:
+        for key, value in section.items():
+            if key in STREAMED_KEYS:
+                merged.setdefault(key, []).extend(value)
+            else:
+                merged[key] = value
+    return merged
+
+
+class FeedParserTests(SimpleTestCase):
+
+    def assertParsedLikeSafeLoad(self, content, batch_size=2):
+        sections = list(iter_feed_sections(io.BytesIO(content.encode()), 'yaml', batch_size=batch_size))
+        self.assertEqual(merge_sections(sections), merge_sections(yaml.safe_load(content)))
+        self.assertTrue(all(len(section.get('goods', [])) <= batch_size for section in sections))
+        return sections
+
+    def test_example_price_list(self):
+        with open(os.path.join(os.path.dirname(__file__), 'data', 'shop1.yaml'), encoding='utf-8') as file:
+            self.assertParsedLikeSafeLoad(file.read())
+
+    def test_scalar_types(self):
+        self.assertParsedLikeSafeLoad(
+            'shop: Связной\nversion: 1.5\ngoods:\n'
+            '  - {id: 1, price: 10.5, quantity: 0x10, active: yes, date: 2024-01-02, note: ~, model: "007"}\n'
+            '  - {id: 2, name: !!str 123, tags: [a, b], parameters: {Диагональ: 6.5}}\n'
+            '  - {id: 3, big: 12345678901234567890, time: 2024-01-02 10:00:00}\n')
+
+    def test_anchors_and_aliases(self):
+        self.assertParsedLikeSafeLoad(
+            '- categories:\n  - &phones {id: 1, name: Смартфоны}\n'
+            '- goods:\n'
+            '  - {id: 1, category: 1, parameters: &common {Цвет: черный, Память: 64}}\n'
+            '  - {id: 2, category: 1, parameters: *common}\n'
+            '  - {id: 3, category: 1, info: *phones}\n')
+
+    def test_alias_to_streamed_list(self):
+        sections = self.assertParsedLikeSafeLoad(
+            '- goods: &goods\n  - {id: 1}\n  - {id: 2}\n  - {id: 3}\n- categories: *goods\n')
+        self.assertEqual(sections[-1], {'categories': [{'id': 1}, {'id': 2}, {'id': 3}]})
+
+    def test_alias_to_section(self):
+        sections = self.assertParsedLikeSafeLoad('- &shop\n  users: [{shop: {name: a}}]\n- *shop\n')
+        self.assertEqual(len(sections), 2)
+
+    def test_merge_keys(self):
+        self.assertParsedLikeSafeLoad(
+            '- goods:\n'
+            '  - &base {id: 1, category: 1, price: 100, parameters: {Цвет: черный}}\n'
+            '  - {<<: *base, id: 2, price: 200}\n'
+            '  - {<<: [{id: 9, quantity: 1}, *base], id: 3}\n')
+
+    def test_undefined_alias(self):
+        with self.assertRaises(yaml.composer.ComposerError):
+            list(iter_feed_sections(io.BytesIO(b'- goods: [*missing]\n'), 'yaml'))
+
+    def test_ndjson(self):
+        content = ('{"users": [{"shop": {"name": "a"}}]}\n{"categories": [{"id": 1}]}\n\n'
+                   '{"id": 1, "price": 10}\n{"id": 2}\n{"id": 3}\n')
+        sections = list(iter_feed_sections(io.BytesIO(content.encode()), 'ndjson', batch_size=2))
+        self.assertEqual(merge_sections(sections), {'users': [{'shop': {'name': 'a'}}], 'categories': [{'id': 1}],
+                                                    'goods': [{'id': 1, 'price': 10}, {'id': 2}, {'id': 3}]})
+        self.assertEqual([len(section['goods']) for section in sections if 'goods' in section], [2, 1])
+
+
+@override_settings(**TEST_SETTINGS)
+class ImportJobQueueTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('partner', 'shop')
+
+    def test_job_is_claimed_once(self):
+        first = enqueue_import(self.user, 'http://example.com/1.yaml')
+        second = enqueue_import(self.user, 'http://example.com/2.yaml')
+        job = claim_next_job()
+        self.assertEqual(job.id, first.id)
+        self.assertEqual(job.status, 'running')
+        self.assertIsNotNone(job.started_at)
+        self.assertEqual(job.heartbeat_at, job.started_at)
+        self.assertEqual(claim_next_job().id, second.id)
+        self.assertIsNone(claim_next_job())
+
+    def test_stale_jobs_are_requeued_from_start(self):
+        stale = enqueue_import(self.user, 'http://example.com/1.yaml')
+        active = enqueue_import(self.user, 'http://example.com/2.yaml')
+        claim_next_job()
+        claim_next_job()
+        # задача долго выполнялась, но обработчик перестал обновлять отметку активности
+        ImportJob.objects.filter(id=stale.id).update(
+            started_at=timezone.now() - timedelta(hours=2), heartbeat_at=timezone.now() - timedelta(minutes=20),
+            processed=500, stats={'created': 500})
+        ImportJob.objects.filter(id=active.id).update(started_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(requeue_stale_jobs(600), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.processed, stale.stats), ('pending', 0, {}))
+        self.assertIsNone(stale.heartbeat_at)
+        self.assertEqual(ImportJob.objects.get(id=active.id).status, 'running')
+        self.assertEqual(claim_next_job().id, stale.id)
+
+    # контрольная точка WAL невозможна внутри транзакции теста
+    @mock.patch('service_app.jobs.checkpoint')
+    @mock.patch('service_app.jobs.get', return_value=FeedResponse(FEED))
+    def test_run_import_job(self, get, checkpoint):
+        enqueue_import(self.user, 'http://example.com/feed.yaml')
+        job = run_import_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done', job.error)
+        self.assertEqual(job.processed, 2)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(ProductInfo.objects.filter(shop__name='feed').count(), 2)
+
+    @mock.patch('service_app.jobs.checkpoint', side_effect=DatabaseError('database is locked'))
+    @mock.patch('service_app.jobs.get', return_value=FeedResponse(FEED))
+    def test_failed_completion_leaves_job_for_requeue(self, get, checkpoint):
+        enqueue_import(self.user, 'http://example.com/feed.yaml')
+        with self.assertLogs('service_app.jobs', 'ERROR'):
+            job = run_import_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'running')
+        self.assertIsNone(job.finished_at)
+
+
+@override_settings(**TEST_SETTINGS)
+class OutboxTests(TestCase):
+    """
+    Очередь писем с почтовым бэкендом в памяти (django.core.mail.outbox)
+    """
+
+    def test_email_is_sent_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            email = queue_email('Тема', 'Текст', ['buyer@example.com'])
+            self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual([message.to for message in mail.outbox], [['buyer@example.com']])
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('sent', 0))
+        self.assertIsNotNone(email.sent_at)
+
+    def test_rolled_back_email_is_not_sent(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(ValueError), transaction.atomic():
+                queue_email('Тема', 'Текст', ['buyer@example.com'])
+                raise ValueError
+        self.assertEqual(callbacks, [])
+        self.assertFalse(OutgoingEmail.objects.exists())
+        self.assertEqual(send_pending_emails(), 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_emails_are_sent_in_batches(self):
+        for number in range(5):
+            queue_email(f'Тема {number}', 'Текст', [f'buyer{number}@example.com'])
+        self.assertEqual(send_pending_emails(batch_size=2), 5)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutgoingEmail.objects.exclude(status='sent').exists())
+
+    def test_failed_sending_is_retried_later(self):
+        email = queue_email('Тема', 'Текст', ['buyer@example.com'])
+        with mock.patch('service_app.outbox.EmailMessage.send', side_effect=SMTPException('unavailable')):
+            self.assertEqual(send_pending_emails(), 0)
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            self.assertGreater(email.send_after, timezone.now())
+            # отложенное письмо не отправляется до send_after
+            self.assertEqual(send_pending_emails(), 0)
+            email.refresh_from_db()
+            self.assertEqual(email.attempts, 1)
+            for _ in range(MAX_ATTEMPTS - 1):
+                OutgoingEmail.objects.filter(id=email.id).update(send_after=timezone.now())
+                send_pending_emails()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', MAX_ATTEMPTS))
+        self.assertIn('unavailable', email.error)
+        self.assertEqual(mail.outbox, [])
+
+    def test_stale_emails_are_requeued(self):
+        email = queue_email('Тема', 'Текст', ['buyer@example.com'])
+        OutgoingEmail.objects.filter(id=email.id).update(status='sending',
+                                                         claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_emails(600), 1)
+        self.assertEqual(send_pending_emails(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_order_status_change_queues_email(self):
+        buyer = create_user('buyer')
+        order = Order.objects.create(user=buyer, status='basket')
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.filter(id=order.id).update(status='new')
+            order_status_changed.send(sender=Order, order_id=order.id, user_id=buyer.id, status='new')
+        self.assertEqual([(message.subject, message.to) for message in mail.outbox],
+                         [('Заказ New', ['buyer@example.com'])])
+
+
+@override_settings(**TEST_SETTINGS)
+class TokenCacheTests(TestCase):
+
+    def setUp(self):
+        clear_token_cache()
+        self.user = create_user('buyer')
+        self.token = Token.objects.create(user=self.user)
+        self.key = self.token.key
+        self.authentication = CachedTokenAuthentication()
+
+    def authenticate(self):
+        return self.authentication.authenticate_credentials(self.key)
+
+    def invalidate_in_other_process(self):
+        # другой процесс сбрасывает токен: локальный кеш этого процесса сохраняет прежнюю запись
+        entry = local_token_cache[self.key]
+        invalidate_token(self.key)
+        local_token_cache[self.key] = entry
+
+    def test_cache_hit_runs_no_queries(self):
+        user, token = self.authenticate()
+        with self.assertNumQueries(0):
+            cached_user, cached_token = self.authenticate()
+        self.assertEqual((cached_user.id, cached_token.key), (user.id, self.key))
+        self.assertIsNot(cached_user, user)
+
+    def test_invalidation_reaches_other_processes(self):
+        self.authenticate()
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.invalidate_in_other_process()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleted_token_is_rejected(self):
+        self.authenticate()
+        self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_user_change_invalidates_tokens(self):
+        self.authenticate()
+        self.user.type_of_user = 'shop'
+        self.user.save()
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate()
+        self.assertEqual(user.type_of_user, 'shop')
+
+    def test_async_authentication_shares_cache(self):
+        aauthenticate = async_to_sync(self.authentication.aauthenticate_credentials)
+        self.authenticate()
+        with self.assertNumQueries(0):
+            self.assertEqual(aauthenticate(self.key)[0].id, self.user.id)
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.invalidate_in_other_process()
+        with self.assertRaises(AuthenticationFailed):
+            aauthenticate(self.key)
+
+    @override_settings(AUTH_TOKEN_CACHE_ALIAS=None)
+    def test_process_cache_without_shared_cache(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            self.authenticate()
+        self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+@override_settings(**TEST_SETTINGS)
+class FacetFilterTests(APITestCase):
+    """
+    Фильтры по параметрам и количества по значениям на индексе ProductFacet, построенном импортом
+    """
+
+    def setUp(self):
+        importer = PriceListImporter(create_shop('facets'))
+        importer.import_categories([{'id': 1, 'name': 'Телевизоры'}, {'id': 2, 'name': 'Смартфоны'}])
+        self.goods = [
+            {'id': 1, 'name': 'Телевизор A', 'category': 1, 'price': 100, 'price_rrc': 100, 'quantity': 1,
+             'parameters': {'Цвет': 'черный', 'Диагональ (дюйм)': 55}},
+            {'id': 2, 'name': 'Телевизор B', 'category': 1, 'price': 200, 'price_rrc': 200, 'quantity': 1,
+             'parameters': {'Цвет': 'белый', 'Диагональ (дюйм)': 65}},
+            {'id': 3, 'name': 'Телевизор C', 'category': 1, 'price': 300, 'price_rrc': 300, 'quantity': 1,
+             'parameters': {'Цвет': 'черный', 'Диагональ (дюйм)': '43,5'}},
+            {'id': 4, 'name': 'Смартфон', 'category': 2, 'price': 150, 'price_rrc': 150, 'quantity': 1,
+             'parameters': {'Цвет': 'черный'}},
+        ]
+        importer.import_goods(self.goods)
+        self.importer = importer
+        # названия параметров читаются из кеша каталога, импорт сбрасывает его
+        invalidate_catalog()
+        self.ids = dict(ProductInfo.objects.values_list('external_id', 'id'))
+
+    def get_ids(self, params):
+        response = self.client.get('/api/v1/filter_products/', params)
+        self.assertEqual(response.status_code, 200)
+        return {row['id'] for row in response.data['results']}
+
+    def test_value_filters(self):
+        self.assertEqual(self.get_ids({'param': 'Цвет:черный'}), {self.ids[1], self.ids[3], self.ids[4]})
+        self.assertEqual(self.get_ids({'param': 'Цвет:черный', 'category_id': 1}), {self.ids[1], self.ids[3]})
+        # несколько значений одного параметра - любое из них
+        self.assertEqual(self.get_ids({'param': ['Цвет:черный', 'Цвет:белый'], 'category_id': 1}),
+                         {self.ids[1], self.ids[2], self.ids[3]})
+        self.assertEqual(self.get_ids({'param': ['Цвет:черный', 'Диагональ (дюйм):55']}), {self.ids[1]})
+
+    def test_range_and_price_filters(self):
+        self.assertEqual(self.get_ids({'param_range': 'Диагональ (дюйм):50:'}), {self.ids[1], self.ids[2]})
+        self.assertEqual(self.get_ids({'param_range': 'Диагональ (дюйм)::50'}), {self.ids[3]})
+        self.assertEqual(self.get_ids({'price_min': 150, 'price_max': 200}), {self.ids[2], self.ids[4]})
+
+    def test_unknown_parameter_gives_empty_result(self):
+        self.assertEqual(self.get_ids({'param': 'Вес:1'}), set())
+
+    def test_invalid_filters_return_400(self):
+        for params in ({'param': 'Цвет'}, {'param_range': 'Диагональ (дюйм):a:'}, {'price_min': 'x'}):
+            self.assertEqual(self.client.get('/api/v1/filter_products/', params).status_code, 400)
+
+    def test_facet_counts(self):
+        response = self.client.get('/api/v1/filter_products/', {'category_id': 1, 'facets': 'true'})
+        facets = response.data['facets']
+        self.assertEqual(facets['price'], {'min': 100, 'max': 300})
+        parameters = {facet['parameter']: facet for facet in facets['parameters']}
+        self.assertEqual(parameters['Цвет']['values'], [{'value': 'черный', 'count': 2},
+                                                         {'value': 'белый', 'count': 1}])
+        self.assertEqual((parameters['Диагональ (дюйм)']['min'], parameters['Диагональ (дюйм)']['max']), (43.5, 65))
+
+    def test_import_refreshes_facets(self):
+        self.goods[1]['parameters'] = {'Цвет': 'черный', 'Диагональ (дюйм)': 65}
+        self.importer.import_goods(self.goods)
+        self.assertEqual(self.get_ids({'param': 'Цвет:черный', 'category_id': 1}),
+                         {self.ids[1], self.ids[2], self.ids[3]})
+        self.assertEqual(self.get_ids({'param': 'Цвет:белый'}), set())
+
+
+@override_settings(**TEST_SETTINGS)
+class SearchTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.phone = create_product_info(self.shop, self.category, 1)
+        self.phone.product.name = 'Смартфон Apple iPhone XR'
+        self.phone.product.save()
+        self.case = create_product_info(self.shop, self.category, 2)
+        self.case.product.name = 'Чехол для смартфона'
+        self.case.product.save()
+        parameter = Parameter.objects.create(name='Совместимость')
+        ProductParameter.objects.create(product_info=self.case, parameter=parameter, value='Apple iPhone')
+        self.other_shop = create_shop('other')
+        self.other = create_product_info(self.other_shop, self.category, 3)
+        self.other.product.name = 'Смартфон Samsung Galaxy'
+        self.other.product.save()
+        rebuild_search_index()
+
+    def search(self, **params):
+        return self.client.get('/api/v1/search/', params)
+
+    def found_ids(self, **params):
+        response = self.search(**params)
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_name_match_ranks_first(self):
+        self.assertEqual(self.found_ids(q='apple iphone'), [self.phone.id, self.case.id])
+
+    def test_last_word_is_prefix(self):
+        self.assertEqual(self.found_ids(q='смартфон sams'), [self.other.id])
+        self.assertEqual(self.found_ids(q='gala'), [self.other.id])
+
+    def test_all_words_required(self):
+        self.assertEqual(self.found_ids(q='apple galaxy'), [])
+
+    def test_filters_and_inactive_shops(self):
+        self.assertEqual(self.found_ids(q='смартфон', shop_id=self.other_shop.id), [self.other.id])
+        Shop.objects.filter(id=self.other_shop.id).update(status=False)
+        self.assertEqual(self.found_ids(q='samsung'), [])
+
+    def test_fields_and_score(self):
+        response = self.search(q='iphone', fields='id,price', limit=1)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'price', 'score'})
+
+    def test_invalid_parameters_return_400(self):
+        for params in ({}, {'q': 'iphone', 'limit': 'x'}, {'q': 'iphone', 'shop_id': 'abc'},
+                       {'q': 'iphone', 'category_id': '1.5'}, {'q': 'iphone', 'fields': 'bogus'}):
+            self.assertEqual(self.search(**params).status_code, 400, params)
+        self.assertEqual(self.client.get('/api/v1/filter_products/', {'shop_id': 'abc'}).status_code, 400)
+
+
+@override_settings(**TEST_SETTINGS)
+class AsyncViewParityTests(CatalogTestMixin, APITestCase):
+    """
+    Async views отвечают так же, как синхронные: тот же статус и те же байты тела
+    """
+
+    def setUp(self):
+        super().setUp()
+        parameter = Parameter.objects.create(name='Цвет')
+        for external_id, price in enumerate((300, 100, 200), 1):
+            product_info = create_product_info(self.shop, self.category, external_id, price)
+            ProductParameter.objects.create(product_info=product_info, parameter=parameter, value='черный')
+        self.buyer = create_user('buyer')
+        basket = Order.objects.create(user=self.buyer, status='basket')
+        OrderItem.objects.create(order=basket, product_info=product_info, quantity=2, price=200)
+        Order.objects.create(user=self.buyer, status='new')
+        invalidate_catalog()
+        self.factory = AsyncRequestFactory()
+
+    def assertSameResponse(self, path, async_view, params=None, user=None):
+        headers = {}
+        if user is not None:
+            headers['Authorization'] = f'Token {Token.objects.get_or_create(user=user)[0].key}'
+        expected = self.client.get(path, params or {}, headers=headers)
+        response = async_to_sync(async_view.as_view())(self.factory.get(path, params or {}, headers=headers))
+        self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content),
+                         params)
+        return response
+
+    def test_filter_products(self):
+        path = '/api/v1/filter_products/'
+        view = AsyncProductInfoFiltersView
+        response = self.assertSameResponse(path, view, {'ordering': 'price', 'page_size': 2})
+        cursor = json.loads(response.content)['next']
+        self.assertSameResponse(path, view, {'ordering': 'price', 'page_size': 2, 'cursor': cursor})
+        for params in ({'fields': 'id,price'}, {'param': 'Цвет:черный', 'facets': 'true'},
+                       {'price_min': '150', 'ordering': '-price'}, {'fields': 'bogus'}, {'shop_id': 'abc'},
+                       {'cursor': 'not-a-cursor'}):
+            self.assertSameResponse(path, view, params)
+
+    def test_basket_and_orders(self):
+        self.assertSameResponse('/api/v1/basket/', AsyncBasketView, user=self.buyer)
+        self.assertSameResponse('/api/v1/order/', AsyncOrderView, user=self.buyer)
+        self.assertSameResponse('/api/v1/order/', AsyncOrderView, {'status': 'bogus'}, user=self.buyer)
+
+    def test_shop_status(self):
+        self.assertSameResponse('/api/v1/shop_status/', AsyncShopStatus, user=self.shop.user)
+        self.assertSameResponse('/api/v1/shop_status/', AsyncShopStatus, user=self.buyer)
+
+    def test_authentication_required(self):
+        response = async_to_sync(AsyncBasketView.as_view())(self.factory.get('/api/v1/basket/'))
+        self.assertEqual(response.status_code, self.client.get('/api/v1/basket/').status_code)
+        self.assertEqual(response.status_code, 401)
+
+    def test_writes_are_delegated_to_sync_view(self):
+        token = Token.objects.create(user=self.shop.user)
+        request = self.factory.post('/api/v1/shop_status/', {'status': 'false'},
+                                    headers={'Authorization': f'Token {token.key}'})
+        # ответ синхронного view рендерит обработчик запроса, как и для самого синхронного view
+        response = async_to_sync(AsyncShopStatus.as_view())(request)
+        self.assertEqual(json.loads(response.content), {'Status': True})
+        self.shop.refresh_from_db()
+        self.assertFalse(self.shop.status)
+
+
+@override_settings(**TEST_SETTINGS, DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRoutingTests(CatalogTestMixin, APITransactionTestCase):
+    """
+    Чтение с двух реплик SQLite: replica1 и replica2 - зеркала тестовой базы (TEST MIRROR) в отдельных
+    соединениях, поэтому реплика, на которую ушел запрос, видна по запросам ее соединения
+    """
+    replicas = ('replica1', 'replica2')
+
+    # алиасы реплик появляются только на время класса: тестовый раннер проверяет и создает базы
+    # по атрибуту databases до запуска тестов, зеркала не очищаются после тестов
+    @classmethod
+    def setUpClass(cls):
+        for alias in cls.replicas:
+            connections.settings[alias] = {**connections['default'].settings_dict,
+                                           'TEST': {**connections['default'].settings_dict['TEST'],
+                                                    'MIRROR': 'default'}}
+        cls.databases = {'default', *cls.replicas}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.replicas:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+    def setUp(self):
+        super().setUp()
+        caches['catalog'].clear()
+        self.product_info = create_product_info(self.shop, self.category, 1)
+        self.buyer = self.login('buyer')
+        basket = Order.objects.create(user=self.buyer, status='basket')
+        OrderItem.objects.create(order=basket, product_info=self.product_info, quantity=1, price=100)
+
+    def login(self, name):
+        user = create_user(name)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        return user
+
+    @contextlib.contextmanager
+    def capture(self):
+        with contextlib.ExitStack() as stack:
+            yield {alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                   for alias in ('default', *self.replicas)}
+
+    def tables(self, queries, *aliases):
+        return {table for alias in aliases for query in queries[alias]
+                for table in ('service_app_order', 'service_app_productinfo', 'authtoken_token')
+                if f'"{table}"' in query['sql']}
+
+    def test_reads_go_to_one_replica(self):
+        with self.capture() as queries:
+            response = self.client.get('/api/v1/basket/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['Basket']), 1)
+        # заказы - с реплики, токены - с основной базы; все чтение одного запроса - с одной реплики
+        self.assertEqual(self.tables(queries, *self.replicas), {'service_app_order', 'service_app_productinfo'})
+        self.assertEqual(self.tables(queries, 'default'), {'authtoken_token'})
+        self.assertEqual(len([alias for alias in self.replicas if queries[alias]]), 1)
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post('/api/v1/basket/', {'items': [
+            {'product_info': create_product_info(self.shop, self.category, 2).id, 'quantity': 1}]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        with self.capture() as queries:
+            response = self.client.get('/api/v1/basket/')
+        self.assertEqual(response.json()['Basket'][0]['items_count'], 2)
+        self.assertEqual(self.tables(queries, *self.replicas), set())
+        self.assertIn('service_app_order', self.tables(queries, 'default'))
+
+        # закрепление относится только к записавшему клиенту и истекает вместе с записью в кеше
+        self.login('other')
+        with self.capture() as queries:
+            self.client.get('/api/v1/basket/')
+        self.assertIn('service_app_order', self.tables(queries, *self.replicas))
+        caches['catalog'].clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get(user=self.buyer).key}')
+        with self.capture() as queries:
+            self.client.get('/api/v1/basket/')
+        self.assertIn('service_app_order', self.tables(queries, *self.replicas))
+
+    def test_catalog_cache_is_built_from_primary(self):
+        with self.capture() as queries:
+            response = self.client.get('/api/v1/import_products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.tables(queries, *self.replicas), set())
+        self.assertIn('service_app_productinfo', self.tables(queries, 'default'))
+        # выборка с фильтрами не кешируется и читается с реплики
+        with self.capture() as queries:
+            response = self.client.get('/api/v1/filter_products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('service_app_productinfo', self.tables(queries, *self.replicas))
+
+    def test_primary_reads_outside_replicas(self):
+        router = ReplicaRouter()
+        aliases = []
+
+        def get_response(request):
+            aliases.append(router.db_for_read(Order))
+            with read_from_primary():
+                aliases.append(router.db_for_read(Order))
+            with transaction.atomic():
+                aliases.append(router.db_for_read(Order))
+            aliases.append(router.db_for_read(User))
+            aliases.append(router.db_for_read(Order))
+            return None
+
+        replica_pin_middleware(get_response)(RequestFactory().get('/'))
+        self.assertIn(aliases[0], self.replicas)
+        self.assertEqual(aliases[1:4], [None, None, None])
+        self.assertEqual(aliases[4], aliases[0])
+        # вне HTTP-запроса, например в фоновых обработчиках, чтение идет с основной базы
+        self.assertIsNone(router.db_for_read(Order))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_routing_is_unchanged(self):
+        with self.capture() as queries:
+            self.client.get('/api/v1/basket/')
+        self.assertFalse(queries['replica1'].captured_queries or queries['replica2'].captured_queries)
+        self.assertIn('service_app_order', self.tables(queries, 'default'))
+
+
+@override_settings(**TEST_SETTINGS, METRICS_TOKEN='metrics-secret')
+class MetricsTests(CatalogTestMixin, APITestCase):
+    """
+    Доступ к метрикам и учет времени сериализации
+    """
+
+    def setUp(self):
+        super().setUp()
+        reset_metrics()
+
+    def get_metrics(self, authorization=None):
+        self.client.credentials(**({'HTTP_AUTHORIZATION': authorization} if authorization else {}))
+        return self.client.get('/api/v1/metrics/')
+
+    def user_token(self, is_staff):
+        user = create_user('staff' if is_staff else 'buyer')
+        User.objects.filter(id=user.id).update(is_staff=is_staff)
+        return f'Token {Token.objects.create(user=user).key}'
+
+    def test_denied_by_default(self):
+        self.assertEqual(self.get_metrics().status_code, 403)
+        self.assertEqual(self.get_metrics('Bearer wrong-secret').status_code, 403)
+        self.assertEqual(self.get_metrics(self.user_token(is_staff=False)).status_code, 403)
+
+    def test_metrics_token(self):
+        self.client.get('/api/v1/shop/')
+        response = self.get_metrics('Bearer metrics-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('api_request_duration_seconds_count{route="api/v1/shop/",method="GET"} 1',
+                      response.content.decode())
+
+    def test_staff_user(self):
+        self.assertEqual(self.get_metrics(self.user_token(is_staff=True)).status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_without_metrics_token_only_staff(self):
+        self.assertEqual(self.get_metrics('Bearer None').status_code, 403)
+        self.assertEqual(self.get_metrics('Bearer ').status_code, 403)
+        self.assertEqual(self.get_metrics(self.user_token(is_staff=True)).status_code, 200)
+
+    def test_serialization_is_timed_once_for_all_serializers(self):
+        # many=True дает TimedListSerializer и для наследника со своим Meta
+        self.assertIsInstance(ShopSerializer([], many=True), TimedListSerializer)
+        self.assertIsInstance(SupplierOrderSerializer([], many=True), TimedListSerializer)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            ShopSerializer(Shop.objects.all(), many=True).data
+            ShopSerializer(self.shop).data
+        finally:
+            current_metrics.reset(token)
+        self.assertGreater(metrics.serialize_time, 0)
+        self.assertEqual(metrics.queries, 1)
+        response = self.client.get('/api/v1/shop/')
+        self.assertRegex(response.headers['Server-Timing'], r'serialize;dur=\d+\.\d{2}')
+
+
+@override_settings(**TEST_SETTINGS, QUERY_DETECTOR_SAMPLE_RATE=1, QUERY_DETECTOR_THRESHOLD=3)
+class QueryDetectorTests(CatalogTestMixin, APITestCase):
+    """
+    Поиск N+1 запросов: отпечатки SQL, отчет по находкам и его сводка командой query_report
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.report = os.path.join(directory.name, 'query_report.jsonl')
+        report_settings = self.settings(QUERY_DETECTOR_REPORT=self.report)
+        report_settings.enable()
+        self.addCleanup(report_settings.disable)
+        for external_id in range(1, 5):
+            create_product_info(self.shop, self.category, external_id)
+
+    # сериализация без select_related и prefetch_related: запросы товара, его категории и параметров
+    # на каждую позицию
+    def serialize_without_prefetch(self, request):
+        ProductInfoSerializer(ProductInfo.objects.order_by('id'), many=True).data
+        return None
+
+    def detect(self, get_response, path='/api/v1/n_plus_one/'):
+        query_detector_middleware(get_response)(RequestFactory().get(path))
+
+    def read_report(self):
+        with open(self.report, encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_fingerprint_ignores_parameters(self):
+        key, shape = fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s) LIMIT 21')
+        self.assertEqual(shape, 'SELECT "a" FROM "t" WHERE "id" IN (...) LIMIT N')
+        self.assertEqual(fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s, %s) LIMIT 5')[0], key)
+        self.assertNotEqual(fingerprint('SELECT "b" FROM "t" WHERE "id" IN (%s, %s) LIMIT 5')[0], key)
+        self.assertEqual(fingerprint('INSERT INTO "t" ("a") VALUES (...), (...), (...)')[1],
+                         'INSERT INTO "t" ("a") VALUES (...)')
+
+    def test_n_plus_one_is_reported(self):
+        self.detect(self.serialize_without_prefetch)
+        reports = {report['serializer_field']: report for report in self.read_report()}
+        self.assertEqual(set(reports), {'ProductInfoSerializer.product', 'GoodsSerializer.category',
+                                        'ProductInfoSerializer.product_parameters'})
+        report = reports['ProductInfoSerializer.product']
+        self.assertEqual((report['method'], report['path'], report['count']), ('GET', '/api/v1/n_plus_one/', 4))
+        self.assertEqual(report['request_queries'], 13)
+        self.assertIn('"service_app_goods"', report['sql'])
+        self.assertTrue(any('in serialize_without_prefetch' in frame for frame in report['stack']))
+
+    def test_nothing_reported_below_threshold_or_outside_sample(self):
+        ProductInfo.objects.filter(external_id__gt=2).delete()
+        self.detect(self.serialize_without_prefetch)
+        self.assertFalse(os.path.exists(self.report))
+        create_product_info(self.shop, self.category, 5)
+        with self.settings(QUERY_DETECTOR_SAMPLE_RATE=0):
+            self.detect(self.serialize_without_prefetch)
+        # запросы вне REQUEST_METRICS_PREFIX не проверяются
+        self.detect(self.serialize_without_prefetch, '/admin/')
+        self.assertFalse(os.path.exists(self.report))
+
+    def test_api_views_have_no_n_plus_one(self):
+        buyer = create_user('buyer')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=buyer).key}')
+        basket = Order.objects.create(user=buyer, status='basket')
+        for product_info in ProductInfo.objects.all():
+            OrderItem.objects.create(order=basket, product_info=product_info, quantity=1, price=100)
+        for path in ('/api/v1/import_products/', '/api/v1/filter_products/', '/api/v1/basket/', '/api/v1/order/'):
+            self.assertEqual(self.client.get(path).status_code, 200, path)
+        self.assertFalse(os.path.exists(self.report))
+
+    def test_query_report(self):
+        output = io.StringIO()
+        call_command('query_report', stdout=output)
+        self.assertEqual(output.getvalue(), 'Повторяющихся запросов не найдено\n')
+
+        self.detect(self.serialize_without_prefetch)
+        self.detect(self.serialize_without_prefetch)
+        output = io.StringIO()
+        call_command('query_report', file=self.report, limit=1, stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], 'GET None (None): HTTP-запросов 2, повторов до 4 из 13 запросов')
+        self.assertTrue(lines[1].startswith('  поле сериализатора: '))
+        self.assertEqual(lines[-1], f'Находок: 3, файл {self.report}')
+
+
+@override_settings(**TEST_SETTINGS)
+class KeysetPaginationTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.product_infos = [create_product_info(self.shop, self.category, external_id, price)
+                              for external_id, price in enumerate((300, 100, 200, 100, 500), 1)]
+
+    def get_pages(self, ordering, page_size=2):
+        ids, params = [], {'ordering': ordering, 'page_size': page_size}
+        while True:
+            response = self.client.get('/api/v1/filter_products/', params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), page_size)
+            ids.extend(row['id'] for row in response.data['results'])
+            if response.data['next'] is None:
+                return ids
+            params['cursor'] = response.data['next']
+
+    def test_cursor_round_trip(self):
+        by_price = sorted(self.product_infos, key=lambda product_info: (product_info.price, product_info.id))
+        self.assertEqual(self.get_pages('id'), sorted(product_info.id for product_info in self.product_infos))
+        self.assertEqual(self.get_pages('price'), [product_info.id for product_info in by_price])
+        self.assertEqual(self.get_pages('-price'), [product_info.id for product_info in reversed(by_price)])
+
+    def test_last_page_has_no_cursor(self):
+        response = self.client.get('/api/v1/filter_products/', {'page_size': 5})
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+
+    def test_bad_cursor_returns_404(self):
+        response = self.client.get('/api/v1/filter_products/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_of_other_ordering_returns_404(self):
+        cursor = self.client.get('/api/v1/filter_products/', {'ordering': 'price', 'page_size': 2}).data['next']
+        response = self.client.get('/api/v1/filter_products/', {'ordering': 'id', 'cursor': cursor})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_wrong_value_types_returns_404(self):
+        for ordering, values in (('id', ['abc']), ('id', [['abc']]), ('id', [None]), ('price', [{}, 1]),
+                                 ('-price', ['x', 'y'])):
+            cursor = base64.urlsafe_b64encode(json.dumps({'o': ordering, 'v': values}).encode()).decode()
+            response = self.client.get('/api/v1/filter_products/', {'ordering': ordering, 'cursor': cursor})
+            self.assertEqual(response.status_code, 404, values)
+
+    def test_fields_projection(self):
+        response = self.client.get('/api/v1/filter_products/', {'fields': 'id,price', 'page_size': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['results'][0]), ['id', 'price'])
+
+    def test_unknown_fields_return_400(self):
+        response = self.client.get('/api/v1/filter_products/', {'fields': 'id,bogus'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('bogus', response.data['Errors'])
+
+
+@override_settings(**TEST_SETTINGS)
+class ReservationConcurrencyTests(CatalogTestMixin, TransactionTestCase):
+    """
+    Параллельные оформления заказов одного товара в отдельных потоках и соединениях с базой данных
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.product_info = create_product_info(self.shop, self.category, 1, price=100, quantity=6)
+        self.baskets = []
+        for number in range(5):
+            buyer = create_user(f'buyer{number}')
+            basket = Order.objects.create(user=buyer, status='basket')
+            OrderItem.objects.create(order=basket, product_info=self.product_info, quantity=2, price=100)
+            self.baskets.append((basket.id, buyer.id))
+
+    def checkout_in_parallel(self):
+        barrier = threading.Barrier(len(self.baskets))
+        results, lock = [], threading.Lock()
+
+        def buy(order_id, user_id):
+            try:
+                barrier.wait()
+                try:
+                    checkout(order_id, user_id)
+                    result = 'ok'
+                except OutOfStock as error:
+                    result = error.product_info_ids
+                with lock:
+                    results.append(result)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=basket) for basket in self.baskets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    # письма о заказах и смена версий остатков после фиксации не относятся к проверке остатков
+    @mock.patch('service_app.reservations.order_status_changed')
+    @mock.patch('service_app.reservations.invalidate_stock')
+    def test_parallel_checkouts_do_not_oversell(self, invalidate, order_status_changed):
+        results = self.checkout_in_parallel()
+        self.assertEqual(results.count('ok'), 3)
+        self.assertEqual(results.count([self.product_info.id]), 2)
+        self.product_info.refresh_from_db()
+        self.assertEqual(self.product_info.quantity, 0)
+        # корзины без товара остаются корзинами, версия остатков магазина меняется после каждого списания
+        statuses = list(Order.objects.filter(id__in=[order_id for order_id, _ in self.baskets])
+                        .values_list('status', flat=True))
+        self.assertEqual(sorted(statuses), ['basket', 'basket', 'new', 'new', 'new'])
+        self.assertEqual(invalidate.call_count, 3)
+        invalidate.assert_called_with({self.shop.id})
+
+    @mock.patch('service_app.reservations.order_status_changed')
+    @mock.patch('service_app.reservations.invalidate_stock')
+    def test_out_of_stock_changes_nothing(self, invalidate, order_status_changed):
+        ProductInfo.objects.filter(id=self.product_info.id).update(quantity=1)
+        order_id, user_id = self.baskets[0]
+        with self.assertRaises(OutOfStock):
+            checkout(order_id, user_id)
+        self.product_info.refresh_from_db()
+        self.assertEqual(self.product_info.quantity, 1)
+        self.assertEqual(Order.objects.get(id=order_id).status, 'basket')
+        invalidate.assert_not_called()
+
+
+@override_settings(**TEST_SETTINGS)
+class OrderStatusTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.product_info = create_product_info(self.shop, self.category, 1, quantity=10)
+        self.buyer = create_user('buyer')
+        basket = Order.objects.create(user=self.buyer, status='basket')
+        OrderItem.objects.create(order=basket, product_info=self.product_info, quantity=3, price=100)
+        self.order = checkout(basket.id, self.buyer.id)
+        self.client.force_authenticate(self.buyer)
+
+    def set_status(self, status):
+        return self.client.put('/api/v1/order/', {'id': self.order.id, 'status': status}).json()
+
+    def assertOrder(self, status, quantity):
+        self.order.refresh_from_db()
+        self.product_info.refresh_from_db()
+        self.assertEqual((self.order.status, self.product_info.quantity), (status, quantity))
+
+    def test_buyer_cancels_order(self):
+        self.assertEqual(self.set_status('canceled'), {'Status': True, 'order': self.order.id})
+        self.assertOrder('canceled', 10)
+        self.assertIsNone(self.order.reserved_until)
+        # повторная отмена не возвращает товар второй раз
+        self.assertFalse(self.set_status('canceled')['Status'])
+        self.assertOrder('canceled', 10)
+
+    def test_buyer_may_only_cancel(self):
+        for status in ('confirmed', 'in_progress', 'sent', 'done', 'basket', 'bogus'):
+            self.assertFalse(self.set_status(status)['Status'], status)
+        self.assertOrder('new', 7)
+        self.assertIsNotNone(self.order.reserved_until)
+
+    def test_forward_transitions_only(self):
+        statuses = ('in_progress', 'confirmed', 'sent', 'done')
+        set_order_status(self.order.id, None, 'confirmed', allowed_statuses=statuses)
+        # подтвержденный заказ еще держит резерв
+        self.assertOrder('confirmed', 7)
+        self.assertIsNotNone(self.order.reserved_until)
+        with self.assertRaises(ValueError):
+            set_order_status(self.order.id, None, 'in_progress', allowed_statuses=statuses)
+        set_order_status(self.order.id, None, 'sent', allowed_statuses=statuses)
+        self.assertOrder('sent', 7)
+        self.assertIsNone(self.order.reserved_until)
+        with self.assertRaises(ValueError):
+            set_order_status(self.order.id, None, 'confirmed', allowed_statuses=statuses)
+
+    def test_sent_order_cannot_be_canceled(self):
+        Order.objects.filter(id=self.order.id).update(status='sent', reserved_until=None)
+        self.assertFalse(self.set_status('canceled')['Status'])
+        self.assertOrder('sent', 7)
+
+
+@override_settings(**TEST_SETTINGS)
+class OrderHistoryTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.buyer = create_user('buyer')
+        self.orders = {}
+        for day, status in ((1, 'new'), (2, 'sent'), (2, 'canceled'), (3, 'done')):
+            order = Order.objects.create(user=self.buyer, status=status)
+            Order.objects.filter(id=order.id).update(dt=timezone.make_aware(datetime.datetime(2024, 5, day, 12)))
+            self.orders.setdefault(day, []).append(order.id)
+        Order.objects.create(user=self.buyer, status='basket')
+        Order.objects.create(user=create_user('other'), status='new')
+        self.client.force_authenticate(self.buyer)
+
+    def order_ids(self, **params):
+        response = self.client.get('/api/v1/order/', params)
+        self.assertEqual(response.status_code, 200)
+        return [order['id'] for order in response.json()['results']]
+
+    def test_history_excludes_basket_and_other_users(self):
+        ids = self.order_ids()
+        self.assertEqual(ids, [*self.orders[3], *reversed(self.orders[2]), *self.orders[1]])
+
+    def test_date_filters(self):
+        self.assertEqual(sorted(self.order_ids(dt_from='2024-05-02', dt_to='2024-05-02')), self.orders[2])
+        self.assertEqual(self.order_ids(dt_from='2024-05-03T00:00:00'), self.orders[3])
+        self.assertEqual(self.order_ids(dt_to='2024-05-01T12:00:00'), self.orders[1])
+
+    def test_status_filter(self):
+        self.assertEqual(sorted(self.order_ids(status='new,done')), sorted(self.orders[1] + self.orders[3]))
+
+    def test_pages_follow_ordering(self):
+        ids, params = [], {'page_size': 1}
+        while True:
+            data = self.client.get('/api/v1/order/', params).json()
+            ids.extend(order['id'] for order in data['results'])
+            if data['next'] is None:
+                break
+            params['cursor'] = data['next']
+        self.assertEqual(ids, self.order_ids())
+
+    def test_invalid_filters_return_400(self):
+        for params in ({'dt_from': 'yesterday'}, {'dt_to': '2024-13-01'}, {'status': 'basket'},
+                       {'status': 'new,bogus'}):
+            self.assertEqual(self.client.get('/api/v1/order/', params).status_code, 400, params)
+
+    def test_cursor_with_wrong_value_types_returns_404(self):
+        for values in (['x', 1], [1, 'y'], [None, None]):
+            cursor = base64.urlsafe_b64encode(json.dumps({'o': '-dt', 'v': values}).encode()).decode()
+            self.assertEqual(self.client.get('/api/v1/order/', {'cursor': cursor}).status_code, 404, values)
+
+
+@override_settings(ORDER_FEED_DELAY=0, **TEST_SETTINGS)
+class SupplierOrderFeedTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.own = create_product_info(self.shop, self.category, 1, price=100)
+        self.foreign = create_product_info(create_shop('foreign'), self.category, 2, price=50)
+        self.buyer = create_user('buyer')
+        self.orders = [self.create_order(quantity) for quantity in (1, 2, 3)]
+        # заказ только с чужими товарами в ленту не попадает
+        other = Order.objects.create(user=self.buyer, status='new')
+        OrderItem.objects.create(order=other, product_info=self.foreign, quantity=1, price=50)
+        self.client.force_authenticate(self.shop.user)
+
+    def create_order(self, quantity):
+        order = Order.objects.create(user=self.buyer, status='new')
+        OrderItem.objects.create(order=order, product_info=self.own, quantity=quantity, price=100)
+        OrderItem.objects.create(order=order, product_info=self.foreign, quantity=1, price=50)
+        return order
+
+    def get_feed(self, **params):
+        response = self.client.get('/api/v1/list_of_orders/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_feed_contains_only_own_items(self):
+        data = self.get_feed()
+        self.assertEqual([order['id'] for order in data['results']], [order.id for order in self.orders])
+        for order, quantity in zip(data['results'], (1, 2, 3)):
+            self.assertEqual([item['product_info']['id'] for item in order['ordered_items']], [self.own.id])
+            self.assertEqual(order['shop_total'], 100 * quantity)
+        self.assertFalse(data['has_more'])
+
+    def test_since_returns_only_changed_orders(self):
+        data = self.get_feed(page_size=2)
+        self.assertTrue(data['has_more'])
+        data = self.get_feed(page_size=2, since=data['next'])
+        self.assertEqual([order['id'] for order in data['results']], [self.orders[2].id])
+        self.assertFalse(data['has_more'])
+        since = data['next']
+        self.assertEqual(self.get_feed(since=since)['results'], [])
+        # курсор последней страницы сохраняется, следующий опрос получает только измененный заказ
+        self.assertEqual(self.get_feed(since=since)['next'], since)
+        Order.objects.filter(id=self.orders[0].id).update(status='sent', updated_at=timezone.now())
+        self.assertEqual([order['id'] for order in self.get_feed(since=since)['results']], [self.orders[0].id])
+
+    @override_settings(ORDER_FEED_DELAY=60)
+    def test_recent_changes_are_delayed(self):
+        self.assertEqual(self.get_feed()['results'], [])
+
+    def test_only_for_shops(self):
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get('/api/v1/list_of_orders/').status_code, 403)
+
+
+@override_settings(**TEST_SETTINGS)
+class BasketViewTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.first = create_product_info(self.shop, self.category, 1, price=100)
+        self.second = create_product_info(self.shop, self.category, 2, price=250)
+        self.buyer = create_user('buyer')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.buyer).key}')
+
+    def change(self, method, items):
+        return getattr(self.client, method)('/api/v1/basket/', {'items': items}, format='json')
+
+    def get_basket(self):
+        return Order.objects.get(user=self.buyer, status='basket')
+
+    def test_add_update_delete(self):
+        response = self.change('post', [{'product_info': self.first.id, 'quantity': 2},
+                                        {'product_info': self.second.id, 'quantity': 1}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['Создано объектов'], 2)
+        item_id = response.json()['Items'][0]['id']
+        self.assertEqual(self.get_basket().total_sum, 450)
+
+        response = self.change('put', [{'id': item_id, 'quantity': 5}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(OrderItem.objects.get(id=item_id).quantity, 5)
+        self.assertEqual(self.get_basket().total_sum, 750)
+
+        response = self.change('delete', [{'id': item_id}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['Удалено объектов'], 1)
+        basket = self.get_basket()
+        self.assertEqual((basket.total_sum, basket.items_count), (250, 1))
+
+        response = self.client.get('/api/v1/basket/')
+        self.assertEqual(response.status_code, 200)
+        items = response.json()['Basket'][0]['ordered_items']
+        self.assertEqual([item['product_info']['id'] for item in items], [self.second.id])
+
+    def test_product_already_in_basket_is_rejected(self):
+        self.change('post', [{'product_info': self.first.id, 'quantity': 1}])
+        response = self.change('post', [{'product_info': self.first.id, 'quantity': 3}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['Items'][0]['Errors'], 'Товар уже есть в корзине')
+        self.assertEqual(OrderItem.objects.get(order=self.get_basket()).quantity, 1)
+
+    def test_invalid_item_rejects_whole_change(self):
+        response = self.change('post', [{'product_info': self.first.id, 'quantity': 1},
+                                        {'product_info': 0, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('Errors', response.json()['Items'][0])
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_unknown_positions_return_400(self):
+        self.assertEqual(self.change('post', [{'product_info': 10 ** 6, 'quantity': 1}]).status_code, 400)
+        self.assertEqual(self.change('put', [{'id': 10 ** 6, 'quantity': 1}]).status_code, 400)
+        self.assertEqual(self.change('delete', [{'id': 10 ** 6}]).status_code, 400)
+
+    def test_missing_items(self):
+        response = self.client.post('/api/v1/basket/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(response.json()['Status'], False)
+
+    def test_requires_token(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get('/api/v1/basket/').status_code, 401)
+        self.assertEqual(self.change('post', [{'product_info': self.first.id, 'quantity': 1}]).status_code, 401)
+
+
+@override_settings(**TEST_SETTINGS)
+class CatalogCacheTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.product_info = create_product_info(self.shop, self.category, 1)
+
+    def test_cache_hit_runs_no_queries(self):
+        for path in ('/api/v1/shop/', '/api/v1/categories/', '/api/v1/goods/', '/api/v1/import_products/'):
+            first = self.client.get(path)
+            with self.assertNumQueries(0):
+                second = self.client.get(path)
+            self.assertEqual(second.status_code, 200)
+            self.assertEqual(second.json(), first.json())
+
+    def test_invalidation_rebuilds_data(self):
+        self.client.get('/api/v1/categories/')
+        Category.objects.create(name='Ноутбуки')
+        self.assertEqual(len(self.client.get('/api/v1/categories/').json()['Categories']), 1)
+        invalidate_catalog()
+        self.assertEqual(len(self.client.get('/api/v1/categories/').json()['Categories']), 2)
+
+    def test_stock_change_keeps_catalog_cache(self):
+        for path in ('/api/v1/shop/', '/api/v1/categories/', '/api/v1/import_products/'):
+            self.client.get(path)
+        ProductInfo.objects.filter(id=self.product_info.id).update(quantity=3)
+        invalidate_stock([self.shop.id])
+        with self.assertNumQueries(0):
+            self.client.get('/api/v1/shop/')
+            self.client.get('/api/v1/categories/')
+        self.assertEqual(self.client.get('/api/v1/import_products/').json()['ProductInfo'][0]['quantity'], 3)
+
+    def test_checkout_changes_only_stock_versions(self):
+        buyer = create_user('buyer')
+        basket = Order.objects.create(user=buyer, status='basket')
+        OrderItem.objects.create(order=basket, product_info=self.product_info, quantity=1, price=100)
+        catalog_version, stock_version = get_catalog_version(), get_stock_version(self.shop.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(basket.id, buyer.id)
+        self.assertEqual(get_catalog_version(), catalog_version)
+        self.assertNotEqual(get_stock_version(self.shop.id), stock_version)
+
+    def test_shop_status_change_invalidates_catalog(self):
+        self.assertTrue(self.client.get('/api/v1/shop/').json()['Shops'][0]['status'])
+        self.client.force_authenticate(self.shop.user)
+        response = self.client.post('/api/v1/shop_status/', {'status': 'false'})
+        self.assertEqual(response.json(), {'Status': True})
+        self.assertFalse(self.client.get('/api/v1/shop/').json()['Shops'][0]['status'])
+
+    def test_shop_status_without_shop_returns_404(self):
+        self.client.force_authenticate(create_user('noshop', 'shop'))
+        response = self.client.post('/api/v1/shop_status/', {'status': 'false'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(**TEST_SETTINGS)
+class CatalogSnapshotTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.product_info = create_product_info(self.shop, self.category, 1)
+
+    def get_snapshot(self, **headers):
+        return self.client.get('/api/v1/catalog_snapshot/', HTTP_ACCEPT_ENCODING='gzip', **headers)
+
+    def test_etag_returns_304(self):
+        response = self.get_snapshot()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        response = self.get_snapshot(HTTP_IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_changed_catalog_returns_new_snapshot(self):
+        etag = self.get_snapshot().headers['ETag']
+        ProductInfo.objects.filter(id=self.product_info.id).update(price=999)
+        # перестроение снимков запускается после фиксации изменения каталога
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_catalog()
+        response = self.get_snapshot(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_stock_change_rebuilds_only_affected_scopes(self):
+        other = create_shop('other')
+        create_product_info(other, self.category, 2)
+        scopes = [get_scope(), get_scope(self.shop.id), get_scope(other.id), get_scope(None, self.category.id)]
+        rebuild_snapshots(scopes)
+        with mock.patch('service_app.snapshots.rebuild_snapshot', wraps=rebuild_snapshot) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidate_stock([other.id])
+        self.assertEqual(sorted(call.args[0] for call in rebuild.call_args_list),
+                         sorted([get_scope(), get_scope(other.id), get_scope(None, self.category.id)]))
+
+    @override_settings(CATALOG_SNAPSHOT_WORKERS=1, CATALOG_SNAPSHOT_DEBOUNCE=0.2)
+    def test_rebuilds_are_debounced(self):
+        with mock.patch('service_app.snapshots._rebuild_target') as rebuild_target:
+            for _ in range(5):
+                schedule_rebuild('stock:1')
+                schedule_rebuild()
+            wait_for_rebuilds()
+        self.assertEqual(sorted(call.args[0] for call in rebuild_target.call_args_list), ['*', 'stock:1'])
@@ -1,8 +1,20 @@
+from django.conf import settings
 from django.urls import path
-from .views import (RegisterUser, ConfirmEmail, LoginUser,
+from .views import (RegisterUser, ConfirmEmail, LoginUser, LogoutUser,
                     ModifyUser, ContactView, ShopView,
-                    CategoryView, GoodsView, ProductInfoView, ProductInfoFiltersView,
-                    BasketView, OrderView, ShopUpdate, ShopStatus, ListOfOrdersView)
+                    CategoryView, GoodsView, ProductInfoView, ProductInfoFiltersView, SearchView,
+                    CatalogSnapshotView,
+                    BasketView, OrderView, OrderDetailView, ShopUpdate, ImportJobStatus, ShopStatus,
+                    ListOfOrdersView, MetricsView)
+from . import async_views
+
+
+def read_view(view):
+    """
+    Async-вариант view (service_app.async_views, Async + имя view) при ASYNC_VIEWS, иначе сам view
+    """
+    return getattr(async_views, f'Async{view.__name__}') if settings.ASYNC_VIEWS else view
+
 
 app_name = 'service_app'
 
@@ -10,6 +22,7 @@ urlpatterns = [
     path('user/register/', RegisterUser.as_view(), name='user_register'),
     path('user/register/confirm/', ConfirmEmail.as_view(), name='confirm_email'),
     path('user/login/', LoginUser.as_view(), name='user_login'),
+    path('user/logout/', LogoutUser.as_view(), name='user_logout'),
     path('user/get/', ModifyUser.as_view(), name='user_get'),
     path('user/modify/', ModifyUser.as_view(), name='user_modify'),
     path('user/contact/', ContactView.as_view(), name='contact'),
@@ -17,12 +30,17 @@ urlpatterns = [
     path('categories/', CategoryView.as_view(), name='category'),
     path('goods/', GoodsView.as_view(), name='goods'),
     path('import_products/', ProductInfoView.as_view(), name='product_info'),
-    path('filter_products/', ProductInfoFiltersView.as_view(), name='product_info_filters'),
-    path('basket/', BasketView.as_view(), name='basket'),
-    path('order/', OrderView.as_view(), name='order'),
+    path('filter_products/', read_view(ProductInfoFiltersView).as_view(), name='product_info_filters'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('catalog_snapshot/', CatalogSnapshotView.as_view(), name='catalog_snapshot'),
+    path('basket/', read_view(BasketView).as_view(), name='basket'),
+    path('order/', read_view(OrderView).as_view(), name='order'),
+    path('order/<int:pk>/', OrderDetailView.as_view(), name='order_detail'),
     path('shop_update/', ShopUpdate.as_view(), name='shop_update'),
-    path('shop_status/', ShopStatus.as_view(), name='shop_status'),
+    path('shop_update/<int:job_id>/', ImportJobStatus.as_view(), name='shop_update_status'),
+    path('shop_status/', read_view(ShopStatus).as_view(), name='shop_status'),
     path('list_of_orders/', ListOfOrdersView.as_view(), name='list_of_orders'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     ]
 
 
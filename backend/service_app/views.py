@@ -1,24 +1,65 @@
-from distutils.util import strtobool
+import datetime
+import hmac
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 from django.db import IntegrityError
-from django.db.models import Q, Sum, F
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework.fields import BooleanField
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from .models import (User, ConfirmEmailUser, Contact, Shop, Category, Goods,
-                     ProductInfo, Order, OrderItem, ProductParameter, Parameter)
+                     ProductInfo, Order, OrderItem, ImportJob, status_of_orders)
 from .serializers import (UserSerializer, ContactSerializer,
                           ShopSerializer, CategorySerializer,
                           GoodsSerializer, ProductInfoSerializer,
-                          OrderItemSerializer, OrderSerializer)
-from django.http import JsonResponse
-from django.contrib.auth import authenticate, login
+                          OrderSummarySerializer, SupplierOrderSerializer,
+                          ImportJobSerializer)
+from .authentication import CachedTokenAuthentication
+from .basket import parse_items, add_items, update_items, delete_items
+from .cache import cached_catalog, invalidate_catalog
+from .fast_serializers import (product_info_values, product_info_rows, parse_product_info_fields, order_values,
+                               order_rows)
+from .facets import parse_facet_filters, apply_facet_filters, facet_counts
+from .snapshots import get_snapshot, get_delta, get_scope_ids, choose_encoding
+from .search import search_product_infos, SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from .jobs import enqueue_import
+from .metrics import render_prometheus
+from .pagination import KeysetPagination, SyncPagination
+from .reservations import checkout, set_order_status, OutOfStock
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified
+from django.contrib.auth import authenticate, login, logout
 from rest_framework.authtoken.models import Token
-import os
-from yaml import load as load_yaml, Loader
-from requests import get
+
+
+def parse_bool(value):
+    """
+    Логическое значение параметра запроса (true/false, 1/0, yes/no, on/off), при ошибке - ValueError
+    """
+    if isinstance(value, str):
+        value = value.strip().lower()
+    if value in BooleanField.TRUE_VALUES:
+        return True
+    if value in BooleanField.FALSE_VALUES:
+        return False
+    raise ValueError(f'Некорректное логическое значение: {value}')
+
+
+def parse_id(value, name):
+    """
+    ИД из параметра запроса name (None, если параметр не указан), при ошибке - ValueError
+    """
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Некорректное значение {name}: {value}')
 
 
 class RegisterUser(APIView):
@@ -96,6 +137,22 @@ class LoginUser(APIView):
             return 'False'
 
 
+class LogoutUser(APIView):
+    """
+    Выход пользователя
+    метод post удаляет токен пользователя, после чего запросы с этим токеном не аутентифицируются
+    """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        # удаление через queryset, чтобы не изменять закешированный объект токена
+        Token.objects.filter(key=request.auth.key).delete()
+        logout(request)
+        return Response({'Status': True})
+
+
 class ModifyUser(APIView):
     """
     Получение и изменение данных пользователя
@@ -104,7 +161,7 @@ class ModifyUser(APIView):
     метод get проверяет авторизован ли пользователь и возвращает данные пользователя
     """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
@@ -139,7 +196,7 @@ class ContactView(APIView):
     метод delete проверяет авторизован ли пользователь и удаляет выбранный контакт пользователя
     """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     # получение контактов
@@ -193,76 +250,214 @@ class ContactView(APIView):
 class ShopView(APIView):
     """
     Получение списка магазинов
-    метод get возвращает список магазинов, импортируя информацию из yaml-файла
+    метод get возвращает список магазинов из базы данных через кеш каталога
     """
 
     serializer_class = ShopSerializer
 
     def get(self, request):
-        file_path = os.path.join(os.path.dirname(__file__), 'data/shop1.yaml')
-        queryset = Shop.load_from_yaml(file_path)
-        serializer = self.serializer_class(queryset, many=True)
-        return Response({'Status': True, 'Shops': serializer.data})
-
+        data = cached_catalog('shops', lambda: self.serializer_class(
+            Shop.objects.order_by('id'), many=True).data)
+        return Response({'Status': True, 'Shops': data})
 
 
 class CategoryView(APIView):
     """
     Получение списка категорий
-    метод get возвращает список категорий, импортируя информацию из yaml-файла
+    метод get возвращает список категорий из базы данных через кеш каталога
     """
 
     serializer_class = CategorySerializer
 
     def get(self, request):
-        file_path = os.path.join(os.path.dirname(__file__), 'data/shop1.yaml')
-        queryset = Category.load_from_yaml(file_path)
-        serializer = self.serializer_class(queryset, many=True)
-        return Response({'Status': True, 'Categories': serializer.data})
+        data = cached_catalog('categories', lambda: self.serializer_class(
+            Category.objects.order_by('id'), many=True).data)
+        return Response({'Status': True, 'Categories': data})
+
 
 class GoodsView(APIView):
     """
     Получение списка товаров
-    метод get возвращает список товаров, импортируя информацию из yaml-файла
+    метод get возвращает список товаров из базы данных через кеш каталога
     """
 
     serializer_class = GoodsSerializer
 
     def get(self, request):
-        file_path = os.path.join(os.path.dirname(__file__), 'data/shop1.yaml')
-        queryset = Goods.load_from_yaml(file_path)
-        serializer = self.serializer_class(queryset, many=True)
-        return Response({'Status': True, 'Goods': serializer.data})
+        data = cached_catalog('goods', lambda: self.serializer_class(
+            Goods.objects.select_related('category').order_by('id'), many=True).data)
+        return Response({'Status': True, 'Goods': data})
+
 
 class ProductInfoView(APIView):
     """
     Получение информации о каждом товаре
-    метод get возвращает информацию о каждом товаре, импортируя информацию из yaml-файла
+    метод get возвращает информацию о каждом товаре из базы данных через кеш каталога
     """
 
+    serializer_class = ProductInfoSerializer
+
     def get(self, request):
-        file_path = os.path.join(os.path.dirname(__file__), 'data/shop1.yaml')
-        queryset = ProductInfo.load_from_yaml(file_path)
-        serializer = self.serializer_class(queryset, many=True)
-        return Response({'Status': True, 'ProductInfo': serializer.data})
+        data = cached_catalog('product_info', lambda: product_info_rows(
+            list(product_info_values(ProductInfo.objects.order_by('id')))), stock=True)
+        return Response({'Status': True, 'ProductInfo': data})
+
 
 class ProductInfoFiltersView(APIView):
     """
     Получение информации о продукте по фильтрам
-    метод get выводит информацию о товаре, согласно переданным фильтрам по магазину и категории
+    метод get выводит информацию о товаре, согласно переданным фильтрам по магазину, категории, цене
+    (price_min, price_max) и параметрам (param=Цвет:красный, param_range=Диагональ (дюйм):6:7),
+    постранично (параметры cursor, page_size, ordering=id|price|-price) и только с полями из параметра fields,
+    при facets=true в ответ добавляются количества предложений по значениям параметров
     """
-    def get(self, request, *args, **kwargs):
+
+    pagination_class = KeysetPagination
+    keyset_orderings = {
+        'id': ('id',),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+    }
+
+    def get_fields(self, request):
+        return parse_product_info_fields(request.query_params.get('fields'))
+
+    def get_queryset(self, request, filters=None):
         query = Q(shop__status=True)
-        shop_id = request.query_params.get('shop_id')
-        category_id = request.query_params.get('category_id')
-        if shop_id:
+        shop_id = parse_id(request.query_params.get('shop_id'), 'shop_id')
+        category_id = parse_id(request.query_params.get('category_id'), 'category_id')
+        if shop_id is not None:
             query = query & Q(shop_id=shop_id)
-        if category_id:
+        if category_id is not None:
             query = query & Q(product__category_id=category_id)
-        queryset = (ProductInfo.objects.filter(query).select_related('shop', 'product__category').
-                    prefetch_related('product_parameters__parameter').distinct())
-        serializer = ProductInfoSerializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = ProductInfo.objects.filter(query)
+        if filters is None:
+            filters = parse_facet_filters(request.query_params)
+        return apply_facet_filters(queryset, filters, category_id)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            filters = parse_facet_filters(request.query_params)
+            with_facets = parse_bool(request.query_params.get('facets', 'false'))
+            fields = self.get_fields(request)
+            queryset = self.get_queryset(request, filters)
+        except ValueError as error:
+            return Response({'Status': False, 'Errors': str(error)}, status=400)
+        paginator = self.pagination_class()
+        rows = paginator.paginate_queryset(product_info_values(queryset, fields), request, view=self)
+        response = paginator.get_paginated_response(product_info_rows(rows, fields))
+        if with_facets:
+            response.data['facets'] = facet_counts(queryset)
+        return response
+
+
+class MetricsView(APIView):
+    """
+    Метрики запросов к API в текстовом формате Prometheus (service_app.metrics)
+    метод get отдает метрики с заголовком Authorization: Bearer <METRICS_TOKEN> или пользователю
+    с is_staff (токен пользователя), без METRICS_TOKEN - только пользователю с is_staff
+    """
+
+    def has_metrics_token(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        return bool(token) and hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', '').encode(), f'Bearer {token}'.encode())
+
+    def get(self, request, *args, **kwargs):
+        if not self.has_metrics_token(request) and not request.user.is_staff:
+            return JsonResponse({'Status': False, 'Error': 'Доступ запрещен'}, status=403)
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class CatalogSnapshotView(APIView):
+    """
+    Снимок каталога для мобильных клиентов
+    метод get возвращает все предложения активных магазинов (с необязательными фильтрами shop_id и category_id)
+    заранее подготовленным и сжатым (br, gzip) JSON с ETag и Last-Modified, на условный запрос
+    с той же версией отвечает 304; с параметром since=<version> возвращает только предложения, измененные
+    после этой версии, и ИД удаленных (delta=true) или весь снимок, если версия since устарела
+    """
+
+    def get_scope_param(self, request, name, known_ids):
+        value = request.query_params.get(name)
+        if not value:
+            return None
+        if not value.isdigit() or int(value) not in known_ids:
+            raise ValueError(f'Некорректное значение {name}: {value}')
+        return int(value)
+
+    def get(self, request, *args, **kwargs):
+        shop_ids, category_ids = get_scope_ids()
+        try:
+            shop_id = self.get_scope_param(request, 'shop_id', shop_ids)
+            category_id = self.get_scope_param(request, 'category_id', category_ids)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        snapshot = get_snapshot(shop_id, category_id)
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), snapshot['bodies'])
+        since = request.query_params.get('since')
+        if since == snapshot['digest'] or (not since and self.is_not_modified(request, snapshot)):
+            return self.set_validators(HttpResponseNotModified(), snapshot, encoding)
+        delta = get_delta(snapshot, shop_id, category_id, since) if since else None
+        response = HttpResponse((delta or snapshot)['bodies'][encoding], content_type='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if delta is not None:
+            # дельта зависит от since, проверка версии для нее не нужна
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        return self.set_validators(response, snapshot, encoding)
+
+    def is_not_modified(self, request, snapshot):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            return if_none_match.strip() == '*' or snapshot['digest'] in {
+                etag.removeprefix('W/').strip('"').split('-')[0] for etag in parse_etags(if_none_match)}
+        modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return modified_since is not None and int(snapshot['last_modified'].timestamp()) <= modified_since
+
+    def set_validators(self, response, snapshot, encoding):
+        # у сжатых представлений свои байты, поэтому и свой сильный ETag
+        response.headers['ETag'] = quote_etag(
+            snapshot['digest'] if encoding == 'identity' else f'{snapshot["digest"]}-{encoding}')
+        response.headers['Last-Modified'] = http_date(snapshot['last_modified'].timestamp())
+        response.headers['Cache-Control'] = 'public, no-cache'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class SearchView(APIView):
+    """
+    Полнотекстовый поиск товаров
+    метод get ищет предложения по словам из параметра q (последнее слово - по префиксу) в названии товара,
+    модели и значениях параметров, с необязательными фильтрами shop_id и category_id, и возвращает
+    не более limit лучших совпадений с весом score, только с полями из параметра fields
+    """
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'Status': False, 'Errors': 'Не указана строка поиска'}, status=400)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT))
+        except ValueError:
+            return Response({'Status': False, 'Errors': 'Некорректное значение limit'}, status=400)
+        try:
+            shop_id = parse_id(request.query_params.get('shop_id'), 'shop_id')
+            category_id = parse_id(request.query_params.get('category_id'), 'category_id')
+            fields = parse_product_info_fields(request.query_params.get('fields'))
+        except ValueError as error:
+            return Response({'Status': False, 'Errors': str(error)}, status=400)
+        found = search_product_infos(query, limit, shop_id, category_id)
+        product_infos = {row['id']: row for row in product_info_values(
+            ProductInfo.objects.filter(id__in=[product_info_id for product_info_id, _ in found]), fields)}
+        rows = [product_infos[product_info_id] for product_info_id, _ in found if product_info_id in product_infos]
+        results = product_info_rows(rows, fields)
+        scores = dict(found)
+        for item, row in zip(results, rows):
+            item['score'] = scores[row['id']]
+        return Response({'Status': True, 'results': results})
 
 
 class BasketView(APIView):
@@ -272,149 +467,161 @@ class BasketView(APIView):
     метод post проверяет авторизован ли пользователь и добавляет в корзину товары
     метод put проверяет авторизован ли пользователь и обновляет информацию о корзине
     метод delete проверяет авторизован ли пользователь и удаляет из корзины все лишние позиции
+    изменения применяются ко всему списку items в одной транзакции, в ответе - результат по каждой позиции
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self, request):
+        # корзина у пользователя одна, сортировка не нужна
+        return Order.objects.filter(user_id=request.user.id, status='basket').order_by()
+
     def get(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return Response({'Status': False, 'Error': 'User is not authenticated'})
-        basket = Order.objects.filter(
-            user_id=request.user.id, status='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
-        if basket:
-            serializer = OrderSerializer(basket, many=True)
-            return Response({'Status': True, 'Basket': serializer.data})
+        basket = list(order_values(self.get_queryset(request)))
+        return Response({'Status': True, 'Basket': order_rows(basket) if basket else []})
 
-    def post(self, request, *args, **kwargs):
+    # общая часть post, put и delete: разбор списка позиций и пакетное изменение корзины
+    def change_basket(self, request, change, count_key):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'User is not authenticated'},
                                 status=403)
-        items_string = request.data.get('items')
-        if items_string:
-            basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
-            objects_created = 0
-            for order_item in items_string:
-                order_item.update({'order': basket.id})
-                serializer = OrderItemSerializer(data=order_item)
-                if serializer.is_valid():
-                    try:
-                        serializer.save()
-                    except IntegrityError as error:
-                        return JsonResponse({'Status': False, 'Errors': str(error)})
-                    else:
-                        objects_created += 1
-                else:
-                    return JsonResponse({'Status': False, 'Errors': serializer.errors})
-                return JsonResponse({'Status': True, 'Создано объектов': objects_created})
-        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        items = request.data.get('items')
+        if not items:
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        try:
+            items = parse_items(items)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+        basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
+        success, results, count = change(basket, items)
+        if not success:
+            return JsonResponse({'Status': False, 'Errors': 'Корзина не изменена', 'Items': results}, status=400)
+        return JsonResponse({'Status': True, count_key: count, 'basket': basket.id, 'Items': results})
 
-    def put(self, request, *args, **kwargs):
+    def post(self, request, *args, **kwargs):
+        return self.change_basket(request, add_items, 'Создано объектов')
 
-        if not request.user.is_authenticated:
-            return JsonResponse({'Status': False, 'Error': 'User is not authenticated'},
-                                status=403)
-        items = request.data.get('items')
-        if items:
-            basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
-            objects_updated = 0
-            for order_item in items:
-                if isinstance(order_item['id'], int) and isinstance(order_item['quantity'], int):
-                    objects_updated += OrderItem.objects.filter(id=order_item['id'], order_id=basket.id).update(
-                        quantity=order_item['quantity'])
-            basket_info = Order.objects.select_related('contact').get(id=basket.id)
-            return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated, 'basket': basket_info.id})
-        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+    def put(self, request, *args, **kwargs):
+        return self.change_basket(request, update_items, 'Обновлено объектов')
 
     def delete(self, request, *args, **kwargs):
-        if not request.user.is_authenticated:
-            return JsonResponse({'Status': False, 'Error': 'User is not authenticated'},
-                                status=403)
-        items = request.data.get('items')
-        if items:
-            basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
-            objects_deleted = 0
-            for order_item in items:
-                if isinstance(order_item['id'], int):
-                    objects_deleted += OrderItem.objects.filter(id=order_item['id'], order_id=basket.id).delete()[0]
-            return JsonResponse({'Status': True, 'Удалено объектов': objects_deleted})
-        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        return self.change_basket(request, delete_items, 'Удалено объектов')
 
 
 class OrderView(APIView):
     """
     получение списка заказов пользователя
-    метод get проверяет авторизован ли пользователь и возвращает список заказов
+    метод get проверяет авторизован ли пользователь и возвращает историю заказов в кратком виде постранично
+    (параметры cursor, page_size) с фильтрами dt_from, dt_to и status
     метод post проверяет авторизован ли пользователь и создает новый заказ
     метод put проверяет авторизован ли пользователь и обновляет статус заказа
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
-    # получение списка заказов пользователя
+    pagination_class = KeysetPagination
+    keyset_orderings = {
+        '-dt': ('-dt', '-id'),
+    }
+
+    # фильтры истории заказов: dt_from, dt_to (дата или дата и время) и status (через запятую),
+    # корзина в историю не входит; при ошибке формата вызывается ValueError
+    def get_queryset(self, request):
+        queryset = Order.objects.filter(user_id=request.user.id).exclude(status='basket')
+        for name, lookup in (('dt_from', 'dt__gte'), ('dt_to', 'dt__lte')):
+            value = request.query_params.get(name)
+            if value:
+                dt = parse_date(value) or parse_datetime(value)
+                if dt is None:
+                    raise ValueError(f'Некорректное значение {name}: {value}')
+                if not isinstance(dt, datetime.datetime):
+                    # дата в dt_to включает весь день
+                    dt = datetime.datetime.combine(dt, datetime.time.max if name == 'dt_to' else datetime.time.min)
+                if timezone.is_naive(dt):
+                    dt = timezone.make_aware(dt)
+                queryset = queryset.filter(**{lookup: dt})
+        status = request.query_params.get('status')
+        if status:
+            statuses = status.split(',')
+            unknown = [value for value in statuses if value == 'basket' or value not in dict(status_of_orders)]
+            if unknown:
+                raise ValueError(f'Некорректное значение status: {", ".join(unknown)}')
+            queryset = queryset.filter(status__in=statuses)
+        return queryset.only(*OrderSummarySerializer.Meta.fields)
+
+    # получение истории заказов пользователя постранично в кратком виде
     def get(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'User is not authenticated'},
                                 status=403)
-        orders = Order.objects.filter(user_id=request.user.id).prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
-
-        if orders:
-            serializer = OrderSerializer(orders, many=True)
-            return JsonResponse({'Status': True, 'Orders': serializer.data}, safe=False)
-        else:
-            return JsonResponse({'Status': False, 'Error': 'Заказов нет'})
-
-    # создание нового заказа
+        try:
+            queryset = self.get_queryset(request)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(OrderSummarySerializer(page, many=True).data)
+
+    # создание нового заказа с резервированием товара
     def post(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'User is not authenticated'},
                                 status=403)
         if {'id', 'contact'}.issubset(request.data):
-            if 'id' in request.data and request.data['id'].isdigit():
+            if str(request.data['id']).isdigit():
                 try:
-                    new_order = Order.objects.get(
-                        id=request.data['id'], user_id=request.user.id)
-                    new_order.contact_id = request.data['contact']
-                    new_order.status = 'new'
-                    new_order.save()
-                except IntegrityError as error:
+                    new_order = checkout(int(request.data['id']), request.user.id, request.data['contact'])
+                except OutOfStock as error:
+                    return JsonResponse({'Status': False, 'Errors': 'Недостаточно товара',
+                                         'product_info': error.product_info_ids}, status=409)
+                except (ValueError, IntegrityError) as error:
                     return JsonResponse({'Status': False, 'Errors': str(error)})
                 return JsonResponse({'Status': True, 'order': new_order.id})
-        else:
-            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
-    # изменение статуса заказа
+    # изменение статуса заказа, при отмене товар возвращается на остаток
     def put(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'User is not authenticated'},
                                 status=403)
         if {'id', 'status'}.issubset(request.data):
-            if 'id' in request.data and request.data['id'].isdigit():
+            if str(request.data['id']).isdigit():
                 try:
-                    order = Order.objects.get(
-                        id=request.data['id'], user_id=request.user.id)
-                    order.status = request.data['status']
-                    order.save()
-                except IntegrityError as error:
+                    set_order_status(int(request.data['id']), request.user.id, request.data['status'])
+                except (ValueError, IntegrityError) as error:
                     return JsonResponse({'Status': False, 'Errors': str(error)})
-                return JsonResponse({'Status': True, 'order': order.id})
-        else:
-            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+                return JsonResponse({'Status': True, 'order': int(request.data['id'])})
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+
+class OrderDetailView(APIView):
+    """
+    подробная информация о заказе пользователя
+    метод get возвращает заказ с позициями, товарами и параметрами
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self, request):
+        return Order.objects.filter(user_id=request.user.id)
+
+    def get(self, request, pk, *args, **kwargs):
+        order = order_values(self.get_queryset(request).filter(id=pk)).first()
+        if order is None:
+            return JsonResponse({'Status': False, 'Error': 'Заказ не найден'}, status=404)
+        return Response({'Status': True, 'Order': order_rows([order])[0]})
 
 
 class ShopUpdate(APIView):
     """
     обновление информации от магазина
-    метод post проверяет авторизован ли пользователь и обновляет информацию о магазине, категориях и товарахб
-    импортируя ее из файла по ссылке
+    метод post проверяет авторизован ли пользователь и ставит в очередь задачу импорта информации
+    о магазине, категориях и товарах из файла по ссылке, возвращая номер задачи
     """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
@@ -431,34 +638,26 @@ class ShopUpdate(APIView):
                 validate_url(url)
             except ValidationError:
                 return JsonResponse({'Status': False, 'Error': 'Некорректная ссылка'})
-            else:
-                stream = get(url).content
-                stream = stream.decode('utf-8')
-                data = load_yaml(stream, Loader=Loader)
-
-            shop, _ = Shop.objects.get_or_create(name=data[0]['users'][0]['shop']['name'], url=data[0]['users'][0]['shop']['url'], user_id=request.user.id)
-            for category in data[1]['categories']:
-                category, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                category.shops.add(shop.id)
-                category.save()
-            ProductInfo.objects.filter(shop_id=shop.id).delete()
-            for item in data[2]['goods']:
-                product, _ = Goods.objects.get_or_create(name=item['name'], category_id=item['category'])
-                product_info = ProductInfo.objects.create(product_id=product.id,
-                                                          external_id=item['id'],
-                                                          model=item['model'],
-                                                          price=item['price'],
-                                                          price_rrc=item['price_rrc'],
-                                                          quantity=item['quantity'],
-                                                          shop_id=shop.id)
-                for name, value in item['parameters'].items():
-                    parameter, _ = Parameter.objects.get_or_create(name=name)
-                    ProductParameter.objects.get_or_create(product_info_id=product_info.id,
-                                                           parameter_id=parameter.id,
-                                                           value=value)
+            job = enqueue_import(request.user, url)
+            return JsonResponse({'Status': True, 'Job': job.id})
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
-                return JsonResponse({'Status': True})
-        return JsonResponse({'Status': False, 'Errors': 'Пользователь не найден'})
+
+class ImportJobStatus(APIView):
+    """
+    статус задачи импорта прайс-листа
+    метод get проверяет авторизован ли пользователь и возвращает прогресс, статистику и ошибки задачи
+    """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = ImportJob.objects.filter(id=job_id, user_id=request.user.id).first()
+        if job is None:
+            return JsonResponse({'Status': False, 'Error': 'Задача не найдена'}, status=404)
+        serializer = ImportJobSerializer(job)
+        return Response({'Status': True, 'Job': serializer.data})
 
 
 class ShopStatus(APIView):
@@ -468,7 +667,7 @@ class ShopStatus(APIView):
     метод get проверяет авторизован ли пользователь и возвращает статус получения заказа
     """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
@@ -481,7 +680,9 @@ class ShopStatus(APIView):
         status = request.data.get('status')
         if status:
             try:
-                shop = Shop.objects.filter(user_id=request.user.id).update(status=strtobool(status))
+                if not Shop.objects.filter(user_id=request.user.id).update(status=parse_bool(status)):
+                    return JsonResponse({'Status': False, 'Error': 'Магазин не найден'}, status=404)
+                invalidate_catalog()
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Error': str(error)})
@@ -501,12 +702,25 @@ class ShopStatus(APIView):
 
 class ListOfOrdersView(APIView):
     """
-    список заказов
-    метод get проверяет авторизован ли пользователь и возвращает список заказов
+    лента заказов поставщика
+    метод get проверяет авторизован ли пользователь и возвращает заказы с товарами его магазинов
+    в порядке изменения, в каждом заказе только позиции этих магазинов.
+    Параметр since - курсор next из предыдущего ответа, с ним возвращаются только заказы,
+    созданные или измененные после уже полученных
     """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = SyncPagination
+    keyset_orderings = {'updated_at': ('updated_at', 'id')}
+
+    def get_items(self, request):
+        return OrderItem.objects.filter(product_info__shop__user_id=request.user.id)
+
+    def get_queryset(self, request):
+        settled = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'ORDER_FEED_DELAY', 5))
+        return Order.objects.filter(id__in=self.get_items(request).values('order_id'),
+                                    updated_at__lt=settled).exclude(status='basket')
 
     def get(self, request, *args, **kwargs):
 
@@ -516,17 +730,11 @@ class ListOfOrdersView(APIView):
         if request.user.type_of_user != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
-        orders = Order.objects.filter(
-            user_id=request.user.id).exclude(status='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
-
-        if orders:
-            serializer = OrderSerializer(orders, many=True)
-            return Response(serializer.data)
-        else:
-            return JsonResponse({'Status': False, 'Error': 'Заказов нет'})
+        paginator = self.pagination_class()
+        rows = paginator.paginate_queryset(order_values(self.get_queryset(request), ('updated_at',)),
+                                           request, view=self)
+        orders = order_rows(rows, self.get_items(request), SupplierOrderSerializer.Meta.fields)
+        return paginator.get_paginated_response(orders)
 
 
 